@@ -0,0 +1,292 @@
+"""
+Compares a query circuit against a library of circuits in a single run, writing one JSON line per library circuit.
+
+The query is preprocessed, normalised and has its invariants computed once. Each library circuit is first screened by its invariants,
+and optionally its canonical hash, so only the remaining circuits are compared by SAT; these comparisons are run in a process pool.
+
+The following flags alter the behaviour of the file
+    -q query_file.r1cs
+        provides the location of the query circuit
+        : default
+            If the first argument is not a flag it is assumed to be the query file
+        : alternative
+            --query
+
+    -l library_file_or_directory ...
+        provides the library circuits, every following argument up to the next flag is a file or a directory of files of the
+        input format
+        : alternative
+            --library
+
+    -o output_file.jsonl
+        provides the location of the JSON lines output
+        : default
+            printed to stdout
+        : alternative
+            --outfile
+
+    -j number_of_processes
+        the number of processes running SAT comparisons
+        : default
+            1, comparisons are run in this process
+        : alternative
+            --jobs
+
+    --timeout
+        defines the timeout of each SAT comparison in seconds, comparisons with a timeout use glucose4 rather than CaDiCaL
+        : default
+            0 seconds (no timeout)
+        : alternative
+            -t
+
+    --max-conflicts number_of_conflicts
+        limits the conflicts of each SAT comparison, unlike the timeout the result does not depend on the machine
+        : default
+            no limit
+
+    --max-propagations number_of_propagations
+        limits the propagations of each SAT comparison, these comparisons use glucose4 rather than CaDiCaL
+        : default
+            no limit
+
+    --max-clauses number_of_clauses
+        limits the number of clauses encoded by each SAT comparison
+        : default
+            no limit
+
+    --canonical-hash
+        also screens library circuits by the canonical hash of their constraints
+        : default
+            only invariants are screened
+
+    -m
+        includes the mapping of each equivalent library circuit
+        : default
+            does not
+        : alternative
+            --include-mappings
+
+    --r1cs
+        assumes input files are in the r1cs format
+        : default
+            this is default behaviour
+
+    --acir
+        assumes that the input files are in the acir format
+        : default
+            assumes r1cs by default
+"""
+
+from typing import Tuple, List, Dict, Iterable, Iterator
+import sys
+import os
+import json
+import time
+import warnings
+import multiprocessing
+
+from circuits_and_constraints.abstract_circuit import Circuit
+from circuits_and_constraints.r1cs.r1cs_circuit import R1CSCircuit
+from circuits_and_constraints.acir.acir_circuit import ACIRCircuit
+
+from testing_harness import exception_catcher
+from utilities.deadline import Deadline
+from utilities.budget import Budget, default_solver_name
+from structural_analysis.utilities.connected_preprocessing import connected_preprocessing
+from comparison_v2.comparison_session import ComparisonSession
+from comparison_v2.prescreen import circuit_invariants, compare_invariants
+from comparison_v2.canonical_labelling import canonical_hash, DEFAULT_MAX_LEAVES
+
+# NOTE: the query session is shared with the worker processes by forking, which requires unix
+_WORKER_SESSION: ComparisonSession | None = None
+
+def _compare_with_session(args: Tuple[str, Circuit, Dict[str, any], int, Budget | None]) -> Tuple[str, Dict[str, any]]:
+    name, circ, invariants, time_limit, budget = args
+    return name, exception_catcher([(_WORKER_SESSION.name, None), (name, circ)], {}, time_limit_seconds=time_limit, comparison=_WORKER_SESSION.compare,
+                                   preprocessed=True, invariants=invariants, budget=budget)
+
+def _record(query_name: str, name: str, stage: str, test_data: Dict[str, any], include_mappings: bool) -> Dict[str, any]:
+    record = {"query": query_name, "name": name, "stage": stage, "result": test_data["result"], "result_explanation": test_data["result_explanation"],
+              "timing": test_data.get("timing", {})}
+    if include_mappings and test_data["result"]: record["mapping"] = test_data["mapping"]
+    if "limit_hit" in test_data: record["limit_hit"] = test_data["limit_hit"]
+    return record
+
+def batch_equivalence(
+        query: Tuple[str, Circuit],
+        library: Iterable[Tuple[str, Circuit]],
+        time_limit: int = 0,
+        jobs: int = 1,
+        canonical_hashing: bool = False,
+        max_leaves: int = DEFAULT_MAX_LEAVES,
+        include_mappings: bool = False,
+        budget: Budget | None = None
+    ) -> Iterator[Dict[str, any]]:
+    """
+    Compares the query circuit against each library circuit, yielding a json-like record for each library circuit.
+
+    Every library circuit is screened before any SAT comparison is started, so the records of screened circuits are yielded first, in
+    library order. The records of the SAT comparisons follow in the order they finish.
+
+    Parameters
+    -----------
+        query: Tuple[str, Circuit]
+            The (name, Circuit) of the query circuit
+        library: Iterable[Tuple[str, Circuit]]
+            The (name, Circuit) of each library circuit, the names must differ from the query name
+        time_limit: int
+            The timeout of each SAT comparison in seconds, 0 means no limit. If positive the session uses glucose4, as CaDiCaL cannot
+            be interrupted. Default 0
+        jobs: int
+            The number of processes running SAT comparisons, if 1 they are run in this process. Default 1
+        canonical_hashing: bool
+            Flag for whether to also screen by canonical_hash. Default False
+        max_leaves: int
+            The maximum number of leaves of the canonical labelling, circuits exceeding it are not screened by hash. Default DEFAULT_MAX_LEAVES
+        include_mappings: bool
+            Flag for whether to include the mapping in the records of equivalent circuits. Default False
+        budget: Budget | None
+            Deterministic limits of each SAT comparison. If it limits propagations the session uses glucose4. Default None
+
+    Return
+    ---------
+    Iterator[Dict[str, any]]
+        For each library circuit a record with the fields "query", "name", "stage", "result", "result_explanation", "timing", and if
+        include_mappings and equivalent "mapping". "stage" is the step that decided the result: "invariants", "canonical hash" or "sat".
+        If a SAT comparison ran out of time or budget "limit_hit" is the limit, see TimeoutException.
+    """
+    global _WORKER_SESSION
+
+    query_name = query[0]
+    session = ComparisonSession(query_name, query[1], solver_name=default_solver_name(Deadline(time_limit), budget))
+    query_hash = canonical_hash(session.circ, max_leaves=max_leaves) if canonical_hashing else None
+
+    candidates = []
+    for name, circ in library:
+        if name == query_name: raise ValueError(f"Library circuit has the same name as the query {query_name}")
+        start = time.time()
+        test_data = {"result": False, "timing": {}}
+
+        candidate = connected_preprocessing(circ)
+        invariants = circuit_invariants(candidate)
+        try:
+            compare_invariants([query_name, name], {query_name: session.invariants, name: invariants})
+        except AssertionError as e:
+            test_data["result_explanation"] = repr(e)
+            test_data["timing"]["invariants"] = time.time() - start
+            yield _record(query_name, name, "invariants", test_data, include_mappings)
+            continue
+
+        if query_hash is not None:
+            hash_ = canonical_hash(candidate, max_leaves=max_leaves)
+            if hash_ is not None and hash_ != query_hash:
+                test_data["result_explanation"] = f"Different canonical hash, {query_name} had {query_hash} where {name} had {hash_}"
+                test_data["timing"]["canonical_hash"] = time.time() - start
+                yield _record(query_name, name, "canonical hash", test_data, include_mappings)
+                continue
+
+        candidates.append((name, candidate, invariants, time_limit, budget))
+
+    _WORKER_SESSION = session
+    try:
+        if jobs <= 1 or len(candidates) <= 1:
+            for name, test_data in map(_compare_with_session, candidates):
+                yield _record(query_name, name, "sat", test_data, include_mappings)
+            return
+
+        with multiprocessing.get_context('fork').Pool(min(jobs, len(candidates))) as pool:
+            for name, test_data in pool.imap_unordered(_compare_with_session, candidates):
+                yield _record(query_name, name, "sat", test_data, include_mappings)
+    finally:
+        _WORKER_SESSION = None
+        session.delete()
+
+def _read_circuit(filename: str, fileformat: str) -> Circuit:
+    match fileformat:
+        case "r1cs": circ = R1CSCircuit()
+        case "acir": circ = ACIRCircuit()
+        case _: raise SyntaxError(f"fileformat provided is of unspecified type {fileformat}")
+    circ.parse_file(filename)
+    return circ
+
+def _library_files(paths: List[str], fileformat: str, query_file: str) -> List[str]:
+    "the files given and those of the fileformat extension in the directories given, directory contents in sorted order, except the query file"
+    filenames = []
+    for path in paths:
+        if os.path.isdir(path):
+            filenames.extend(os.path.join(path, filename) for filename in sorted(os.listdir(path)) if filename.endswith(f".{fileformat}"))
+        else: filenames.append(path)
+    return [filename for filename in filenames if not os.path.samefile(filename, query_file)]
+
+if __name__ == '__main__':
+
+    query_file, library_paths, outfile, fileformat = None, [], None, "r1cs"
+    timeout, jobs, canonical_hashing, include_mappings = 0, 1, False, False
+    max_conflicts, max_propagations, max_clauses = None, None, None
+
+    if len(sys.argv) == 1:
+        raise SyntaxError("No File Provided")
+
+    i = 1
+    while i < len(sys.argv):
+        arg = sys.argv[i]
+
+        if arg[0] != "-":
+            if i == 1: query_file, i = arg, i + 1
+            else:
+                warnings.warn(f"Invalid argument '{arg}' ignored", SyntaxWarning)
+                i += 1
+            continue
+
+        match arg:
+            case "-q" | "--query":
+                if sys.argv[i+1][0] == '-': raise SyntaxError(f"Invalid query filename {sys.argv[i+1]}")
+                query_file, i = sys.argv[i+1], i+2
+            case "-l" | "--library":
+                i += 1
+                while i < len(sys.argv) and sys.argv[i][0] != '-':
+                    library_paths.append(sys.argv[i])
+                    i += 1
+            case "-o" | "--outfile":
+                if sys.argv[i+1][0] == '-': raise SyntaxError(f"Invalid output filename {sys.argv[i+1]}")
+                outfile, i = sys.argv[i+1], i+2
+            case "-j" | "--jobs":
+                if sys.argv[i+1][0] == '-': raise SyntaxError(f"Invalid jobs value {sys.argv[i+1]}")
+                jobs, i = int(sys.argv[i+1]), i+2
+            case "-t" | "--timeout":
+                if sys.argv[i+1][0] == '-': raise SyntaxError(f"Invalid timeout value {sys.argv[i+1]}")
+                timeout, i = int(sys.argv[i+1]), i+2
+            case "--max-conflicts":
+                if sys.argv[i+1][0] == '-': raise SyntaxError(f"Invalid max conflicts value {sys.argv[i+1]}")
+                max_conflicts, i = int(sys.argv[i+1]), i+2
+            case "--max-propagations":
+                if sys.argv[i+1][0] == '-': raise SyntaxError(f"Invalid max propagations value {sys.argv[i+1]}")
+                max_propagations, i = int(sys.argv[i+1]), i+2
+            case "--max-clauses":
+                if sys.argv[i+1][0] == '-': raise SyntaxError(f"Invalid max clauses value {sys.argv[i+1]}")
+                max_clauses, i = int(sys.argv[i+1]), i+2
+            case "--canonical-hash": canonical_hashing, i = True, i+1
+            case "-m" | "--include-mappings": include_mappings, i = True, i+1
+            case "--r1cs": fileformat, i = "r1cs", i+1
+            case "--acir": fileformat, i = "acir", i+1
+            case _:
+                warnings.warn(f"Invalid argument '{arg}' ignored", SyntaxWarning)
+                i += 1
+
+    if query_file is None: raise SyntaxError("No query file given")
+    if len(library_paths) == 0: raise SyntaxError("No library given")
+
+    library = ((filename, _read_circuit(filename, fileformat)) for filename in _library_files(library_paths, fileformat, query_file))
+
+    out = sys.stdout if outfile is None else open(outfile, "w")
+    try:
+        for record in batch_equivalence((query_file, _read_circuit(query_file, fileformat)), library, time_limit=timeout, jobs=jobs,
+                                        canonical_hashing=canonical_hashing, include_mappings=include_mappings,
+                                        budget=None if (max_conflicts, max_propagations, max_clauses) == (None, None, None) 
+                                               else Budget(max_conflicts, max_propagations, max_clauses)):
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+    finally:
+        if outfile is not None: out.close()
+
+    # python3 batch_compare.py query.r1cs -l library_dir -o results.jsonl -j 4
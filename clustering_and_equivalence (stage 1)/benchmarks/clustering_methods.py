@@ -0,0 +1,82 @@
+"""
+Benchmark of the louvain clusterings of cluster.py: louvain-networkx against the default igraph Leiden pipeline.
+
+For each circuit reports the time to build the constraint graph and cluster it with each method, at the default resolution of cluster.py,
+and the modularity of each partition measured on the same weighted graph. Runs on each r1cs file given and every r1cs file in each
+directory given, or if none are given on generated circuits. The records are also written as JSON lines if -o is given.
+
+    python3 -m benchmarks.clustering_methods [-o results.jsonl] [circuit.r1cs | directory ...]
+"""
+
+from typing import List, Tuple, Dict
+import sys
+import os
+import json
+import time
+
+from networkx.algorithms.community import louvain_communities
+
+from circuits_and_constraints.r1cs.r1cs_circuit import R1CSCircuit
+from structural_analysis.utilities.constraint_graph import shared_signal_graph_nx, shared_signal_graph_sparse, constraint_partition
+from structural_analysis.clustering_methods.leiden import leiden_clustering
+from benchmarks.constraint_graph import hub_circuit
+
+# (constraints, hub fanout) of the generated circuits
+GENERATED_SIZES: List[Tuple[int, int]] = [(10000, 100), (50000, 500), (200000, 1000)]
+SEED = 0
+
+def _membership(partition: List[List[int]], nconstraints: int) -> List[int]:
+    membership = [0] * nconstraints
+    for parti, part in enumerate(partition):
+        for coni in part: membership[coni] = parti
+    return membership
+
+def _networkx(circ: R1CSCircuit, resolution: float) -> Tuple[List[List[int]], float]:
+    start = time.time()
+    graph = shared_signal_graph_nx(circ.constraints)
+    partition = list(map(list, louvain_communities(graph, resolution=resolution, seed=SEED)))
+    return partition, time.time() - start
+
+def _leiden(circ: R1CSCircuit, resolution: float) -> Tuple[List[List[int]], float]:
+    start = time.time()
+    graph = shared_signal_graph_sparse(circ)
+    partition = constraint_partition(leiden_clustering(graph, resolution, seed=SEED), circ, graph)
+    return partition, time.time() - start
+
+def _circuits(paths: List[str]) -> List[Tuple[str, R1CSCircuit]]:
+    filenames = []
+    for path in paths:
+        if os.path.isdir(path): filenames.extend(os.path.join(path, filename) for filename in sorted(os.listdir(path)) if filename.endswith(".r1cs"))
+        else: filenames.append(path)
+
+    circuits = []
+    for filename in filenames:
+        circ = R1CSCircuit()
+        circ.parse_file(filename)
+        circuits.append((filename, circ))
+    return circuits
+
+if __name__ == '__main__':
+
+    outfile, paths = None, sys.argv[1:]
+    if len(paths) >= 2 and paths[0] == "-o": outfile, paths = paths[1], paths[2:]
+
+    circuits = _circuits(paths)
+    if len(circuits) == 0:
+        circuits = [(f"hub_circuit({n}, {fanout})", hub_circuit(n, fanout)) for n, fanout in GENERATED_SIZES]
+
+    records: List[Dict[str, any]] = []
+    print(f"{'circuit':28} {'method':>17} {'time':>8} {'clusters':>8} {'modularity':>10}")
+    for name, circ in circuits:
+        # the default resolution of cluster.py
+        resolution = circ.nConstraints ** 0.5
+        exact = shared_signal_graph_sparse(circ)
+
+        for method, clustering in [("louvain-networkx", _networkx), ("louvain", _leiden)]:
+            partition, seconds = clustering(circ, resolution)
+            modularity = exact.modularity(_membership(partition, len(circ.constraints)), weights="weight", resolution=resolution)
+            records.append({"circuit": name, "method": method, "resolution": resolution, "time": seconds, "clusters": len(partition), "modularity": modularity})
+            print(f"{name:28} {method:>17} {seconds:>7.2f}s {len(partition):>8} {modularity:>10.4f}")
+
+    if outfile is not None:
+        with open(outfile, "w") as f: f.writelines(json.dumps(record) + "\n" for record in records)
@@ -0,0 +1,78 @@
+"""
+Benchmark of the coarsening pre-pass of the louvain clustering of cluster.py, see structural_analysis.clustering_methods.coarsening.
+
+For each circuit reports the vertices and edges of the constraint graph before and after coarsening, the time to cluster each graph with
+Leiden at the default resolution of cluster.py (including coarsening and projection for the coarse graph), and the modularity of both
+partitions measured on the original graph. Runs on each r1cs file given, or if none are given on generated circuits of wired templates.
+
+    python3 -m benchmarks.coarsening [circuit.r1cs ...]
+"""
+
+from typing import List, Tuple
+import sys
+import time
+import random
+
+from circuits_and_constraints.r1cs.r1cs_circuit import R1CSCircuit
+from circuits_and_constraints.r1cs.r1cs_constraint import R1CSConstraint
+from structural_analysis.utilities.constraint_graph import shared_signal_graph_sparse
+from structural_analysis.clustering_methods.leiden import leiden_clustering
+from structural_analysis.clustering_methods.coarsening import coarsen_graph, project_clustering
+from benchmarks.constraint_graph import PRIME
+
+# (templates, bits of each template) of the generated circuits
+GENERATED_SIZES: List[Tuple[int, int]] = [(1000, 8), (5000, 16), (20000, 32)]
+SEED = 0
+
+def wired_circuit(ntemplates: int, nbits: int, seed: int = 0) -> R1CSCircuit:
+    """
+    Templates that decompose a signal into nbits bits, recompose it and multiply two bits, like circom's Num2Bits. The input of each template
+    is copied from the output of a random earlier template by a linear wiring constraint, as circom does for template arguments
+    """
+    rng = random.Random(seed)
+    circ = R1CSCircuit()
+    outputs, nxt = [2], 3
+    for _ in range(ntemplates):
+        x = nxt
+        circ.add_constraint(R1CSConstraint({}, {}, {x: 1, rng.choice(outputs): PRIME - 1}, PRIME))
+        bits = list(range(nxt + 1, nxt + 1 + nbits))
+        for b in bits: circ.add_constraint(R1CSConstraint({b: 1}, {b: 1, 0: PRIME - 1}, {}, PRIME))
+        recomposition = {b: pow(2, j, PRIME) for j, b in enumerate(bits)}
+        recomposition[x] = PRIME - 1
+        circ.add_constraint(R1CSConstraint({}, {}, recomposition, PRIME))
+        y = nxt + 1 + nbits
+        circ.add_constraint(R1CSConstraint({bits[0]: 1}, {bits[1]: 1}, {y: 1, x: PRIME - 1}, PRIME))
+        outputs.append(y)
+        nxt = y + 1
+    circ.add_constraint(R1CSConstraint({}, {}, {1: 1, outputs[-1]: PRIME - 1}, PRIME))
+    circ.update_header(32, PRIME, nxt, 1, 1, 0, None, len(circ.constraints))
+    return circ
+
+if __name__ == '__main__':
+
+    circuits = []
+    for filename in sys.argv[1:]:
+        circ = R1CSCircuit()
+        circ.parse_file(filename)
+        circuits.append((filename, circ))
+    if len(circuits) == 0:
+        circuits = [(f"wired_circuit({n}, {bits})", wired_circuit(n, bits)) for n, bits in GENERATED_SIZES]
+
+    print(f"{'circuit':30} {'vertices':>17} {'edges':>17} {'leiden':>8} {'coarse':>8} {'modularity':>10} {'coarse':>10}")
+    for name, circ in circuits:
+        graph = shared_signal_graph_sparse(circ)
+        # the default resolution of cluster.py
+        resolution = circ.nConstraints ** 0.5
+
+        start = time.time()
+        fine = leiden_clustering(graph, resolution, seed=SEED)
+        fine_time = time.time() - start
+
+        start = time.time()
+        coarse_graph, groups = coarsen_graph(circ, graph)
+        coarse = project_clustering(leiden_clustering(coarse_graph, resolution, seed=SEED), graph, groups)
+        coarse_time = time.time() - start
+
+        modularity = lambda clustering : graph.modularity(clustering.membership, weights="weight", resolution=resolution)
+        print(f"{name:30} {graph.vcount():>8}/{coarse_graph.vcount():<8} {graph.ecount():>8}/{coarse_graph.ecount():<8} {fine_time:>7.2f}s {coarse_time:>7.2f}s"
+              f" {modularity(fine):>10.4f} {modularity(coarse):>10.4f}")
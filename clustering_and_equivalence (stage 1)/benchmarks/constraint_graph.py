@@ -0,0 +1,60 @@
+"""
+Benchmark of the shared signal constraint graph builders in structural_analysis.utilities.constraint_graph.
+
+Times shared_signal_graph_nx, shared_signal_graph_igraph and shared_signal_graph_sparse on each r1cs file given, or if none are given
+on generated circuits with a high-fanout signal like the constant-like wires of real circuits.
+
+    python3 -m benchmarks.constraint_graph [circuit.r1cs ...]
+"""
+
+from typing import List, Tuple
+import sys
+import time
+import random
+
+from circuits_and_constraints.r1cs.r1cs_circuit import R1CSCircuit
+from circuits_and_constraints.r1cs.r1cs_constraint import R1CSConstraint
+from structural_analysis.utilities.constraint_graph import shared_signal_graph_nx, shared_signal_graph_igraph, shared_signal_graph_sparse
+
+PRIME = 21888242871839275222246405745050782275610582400258534375553810140719052264817
+
+# (constraints, hub fanout) of the generated circuits
+GENERATED_SIZES: List[Tuple[int, int]] = [(10000, 100), (10000, 1000), (50000, 2000), (100000, 3000)]
+
+def hub_circuit(nconstraints: int, fanout: int, seed: int = 0) -> R1CSCircuit:
+    """
+    A chain of multiplications x_i * x_{i+1} = x_{i+2}, where fanout random constraints also use a single hub signal
+    """
+    rng = random.Random(seed)
+    hub = nconstraints + 3
+    hub_constraints = set(rng.sample(range(nconstraints), fanout))
+
+    circ = R1CSCircuit()
+    for i in range(nconstraints):
+        C = {i + 3: 1, hub: 1} if i in hub_constraints else {i + 3: 1}
+        circ.add_constraint(R1CSConstraint({i + 1: 1}, {i + 2: 1}, C, PRIME))
+    circ.update_header(32, PRIME, hub + 1, 1, 1, 0, None, nconstraints)
+    return circ
+
+def _time(builder, *args) -> Tuple[float, int]:
+    start = time.time()
+    graph = builder(*args)
+    return time.time() - start, graph.number_of_edges() if hasattr(graph, "number_of_edges") else graph.ecount()
+
+if __name__ == '__main__':
+
+    circuits = []
+    for filename in sys.argv[1:]:
+        circ = R1CSCircuit()
+        circ.parse_file(filename)
+        circuits.append((filename, circ))
+    if len(circuits) == 0:
+        circuits = [(f"hub_circuit({n}, {fanout})", hub_circuit(n, fanout)) for n, fanout in GENERATED_SIZES]
+
+    print(f"{'circuit':40} {'edges':>10} {'networkx':>10} {'igraph':>10} {'sparse':>10}")
+    for name, circ in circuits:
+        times = {}
+        for label, builder, args in [("networkx", shared_signal_graph_nx, (circ.constraints,)), ("igraph", shared_signal_graph_igraph, (circ,)),
+                                     ("sparse", shared_signal_graph_sparse, (circ,))]:
+            times[label], edges = _time(builder, *args)
+        print(f"{name:40} {edges:>10} {times['networkx']:>9.2f}s {times['igraph']:>9.2f}s {times['sparse']:>9.2f}s")
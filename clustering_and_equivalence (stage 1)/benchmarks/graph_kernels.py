@@ -0,0 +1,79 @@
+"""
+Benchmark of the breadth first searches of utilities.graph_kernels against the python BFS of utilities.utilities they replace.
+
+For each circuit reports the time of the distances of every signal to the inputs and to the outputs, as connected_preprocessing found
+them with _distances_to_signal_set, and the time of the distances of parts of a partition to the input and output parts, as each
+iteration of dag_from_partition found them with dist_to_source_set, along with whether both give the same distances. The partition
+groups every PART_SIZE consecutive constraints. Runs on each r1cs file given, or if none are given on generated circuits, the hub
+circuits being a single chain as deep as they are long.
+
+    python3 -m benchmarks.graph_kernels [circuit.r1cs ...]
+"""
+
+from typing import Dict, List
+import sys
+import time
+import numpy as np
+from scipy import sparse
+
+from circuits_and_constraints.r1cs.r1cs_circuit import R1CSCircuit
+from utilities.utilities import _distances_to_signal_set, dist_to_source_set
+from utilities.graph_kernels import signal_distances, adjacency_matrix, multi_source_distances
+from structural_analysis.utilities.constraint_graph import incidence_matrix
+from benchmarks.constraint_graph import hub_circuit
+from benchmarks.coarsening import wired_circuit
+
+PART_SIZE = 8
+
+def part_adjacencies(circ: R1CSCircuit) -> Dict[int, List[int]]:
+    "The adjacencies of the parts of every PART_SIZE consecutive constraints, two parts adjacent if they share a signal"
+    incidence = incidence_matrix(circ.constraints, circ.nWires)
+    adjacent = (incidence @ incidence.T).tocoo()
+    nparts = -(-circ.nConstraints // PART_SIZE)
+    parts = sparse.coo_matrix((adjacent.data, (adjacent.row // PART_SIZE, adjacent.col // PART_SIZE)), shape=(nparts, nparts)).tocsr()
+    return {i: [j for j in parts.indices[parts.indptr[i]:parts.indptr[i+1]].tolist() if j != i] for i in range(nparts)}
+
+def as_dict(distances: np.ndarray) -> Dict[int, int]:
+    return {i: dist for i, dist in enumerate(distances.tolist()) if dist >= 0}
+
+if __name__ == '__main__':
+
+    circuits = []
+    for filename in sys.argv[1:]:
+        circ = R1CSCircuit()
+        circ.parse_file(filename)
+        circuits.append((filename, circ))
+    if len(circuits) == 0:
+        circuits = [(f"wired_circuit({n}, {bits})", wired_circuit(n, bits)) for n, bits in [(2000, 16), (20000, 32)]]
+        circuits += [(f"hub_circuit({n}, {fanout})", hub_circuit(n, fanout)) for n, fanout in [(100000, 0), (100000, 3000)]]
+
+    print(f"{'circuit':30} {'constraints':>11} {'signal bfs':>10} {'kernel':>8} {'same':>5} {'part bfs':>9} {'kernel':>8} {'same':>5}")
+    for name, circ in circuits:
+        sources = [list(circ.get_input_signals()), list(circ.get_output_signals())]
+
+        start = time.time()
+        reference = [_distances_to_signal_set(circ.constraints, source) for source in sources]
+        reference_time = time.time() - start
+
+        start = time.time()
+        incidence = incidence_matrix(circ.constraints, circ.nWires)
+        distances = [signal_distances(incidence, source) for source in sources]
+        kernel_time = time.time() - start
+        same = reference == list(map(as_dict, distances))
+
+        # part sources as in dag_from_partition, the parts with an input or output signal
+        adjacencies = part_adjacencies(circ)
+        part_sources = [sorted(set(map(lambda coni : coni // PART_SIZE, incidence.T.tocsr()[source].indices.tolist()))) for source in sources]
+
+        start = time.time()
+        part_reference = [dist_to_source_set(source, adjacencies) for source in part_sources]
+        part_reference_time = time.time() - start
+
+        start = time.time()
+        graph = adjacency_matrix(adjacencies, len(adjacencies))
+        part_distances = [multi_source_distances(graph, source) for source in part_sources]
+        part_kernel_time = time.time() - start
+        part_same = part_reference == list(map(as_dict, part_distances))
+
+        print(f"{name:30} {circ.nConstraints:>11} {reference_time:>9.2f}s {kernel_time:>7.2f}s {str(same):>5}"
+              f" {part_reference_time:>8.2f}s {part_kernel_time:>7.2f}s {str(part_same):>5}")
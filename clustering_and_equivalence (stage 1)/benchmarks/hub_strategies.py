@@ -0,0 +1,57 @@
+"""
+Benchmark of the hub strategies of shared_signal_graph_sparse.
+
+For each hub threshold and strategy reports the size of the graph, the time to build and cluster it, and the modularity of the resulting
+constraint partition measured on the exact graph, where every signal is a clique. Runs on each r1cs file given, or if none are given on
+generated circuits with a high-fanout signal.
+
+    python3 -m benchmarks.hub_strategies [circuit.r1cs ...]
+"""
+
+from typing import List, Tuple
+import sys
+import time
+
+from circuits_and_constraints.r1cs.r1cs_circuit import R1CSCircuit
+from structural_analysis.utilities.constraint_graph import shared_signal_graph_sparse, constraint_partition, HUB_STRATEGIES
+from benchmarks.constraint_graph import hub_circuit
+
+# (constraints, hub fanout) of the generated circuits
+GENERATED_SIZES: List[Tuple[int, int]] = [(20000, 2000), (100000, 3000)]
+HUB_THRESHOLDS: List[int] = [16, 256]
+SEED = 0
+
+def _membership(partition: List[List[int]], nconstraints: int) -> List[int]:
+    membership = [0] * nconstraints
+    for parti, part in enumerate(partition):
+        for coni in part: membership[coni] = parti
+    return membership
+
+if __name__ == '__main__':
+
+    circuits = []
+    for filename in sys.argv[1:]:
+        circ = R1CSCircuit()
+        circ.parse_file(filename)
+        circuits.append((filename, circ))
+    if len(circuits) == 0:
+        circuits = [(f"hub_circuit({n}, {fanout})", hub_circuit(n, fanout)) for n, fanout in GENERATED_SIZES]
+
+    print(f"{'circuit':28} {'threshold':>9} {'strategy':>9} {'vertices':>9} {'edges':>9} {'build':>7} {'cluster':>8} {'clusters':>8} {'modularity':>10}")
+    for name, circ in circuits:
+        start = time.time()
+        exact = shared_signal_graph_sparse(circ)
+        exact_build = time.time() - start
+
+        for threshold, strategy in [(None, "clique")] + [(threshold, strategy) for threshold in HUB_THRESHOLDS for strategy in HUB_STRATEGIES]:
+            start = time.time()
+            graph = exact if threshold is None else shared_signal_graph_sparse(circ, threshold, strategy, SEED)
+            build = exact_build if threshold is None else time.time() - start
+
+            start = time.time()
+            partition = graph.community_leiden(objective_function="modularity", weights="weight")
+            partition = constraint_partition(partition, circ, graph)
+            cluster = time.time() - start
+
+            modularity = exact.modularity(_membership(partition, len(circ.constraints)), weights="weight")
+            print(f"{name:28} {str(threshold):>9} {strategy:>9} {graph.vcount():>9} {graph.ecount():>9} {build:>6.2f}s {cluster:>7.2f}s {len(partition):>8} {modularity:>10.4f}")
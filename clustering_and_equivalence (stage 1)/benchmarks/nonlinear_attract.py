@@ -0,0 +1,43 @@
+"""
+Benchmark of nonlinear_attract_clustering against the original nonlinear_attract_clustering_unionfind.
+
+For each circuit, with and without pre_merge, reports the time of each implementation, the number of clusters and the largest cluster,
+and whether both give the same clusters. Runs on each r1cs file given, such as test_ecdsa, or if none are given on generated circuits.
+
+    python3 -m benchmarks.nonlinear_attract [circuit.r1cs ...]
+"""
+
+from typing import List, Tuple
+import sys
+import time
+
+from circuits_and_constraints.r1cs.r1cs_circuit import R1CSCircuit
+from structural_analysis.clustering_methods.nonlinear_attract import nonlinear_attract_clustering, nonlinear_attract_clustering_unionfind
+from benchmarks.constraint_graph import hub_circuit
+from benchmarks.coarsening import wired_circuit
+
+if __name__ == '__main__':
+
+    circuits = []
+    for filename in sys.argv[1:]:
+        circ = R1CSCircuit()
+        circ.parse_file(filename)
+        circuits.append((filename, circ))
+    if len(circuits) == 0:
+        circuits = [(f"wired_circuit({n}, {bits})", wired_circuit(n, bits)) for n, bits in [(2000, 16), (10000, 32)]]
+        circuits += [(f"hub_circuit({n}, {fanout})", hub_circuit(n, fanout)) for n, fanout in [(50000, 500)]]
+
+    print(f"{'circuit':30} {'pre_merge':>9} {'constraints':>11} {'unionfind':>10} {'arrays':>10} {'clusters':>9} {'largest':>8} {'same':>5}")
+    for name, circ in circuits:
+        for pre_merge in [False, True]:
+            start = time.time()
+            reference, _, _ = nonlinear_attract_clustering_unionfind(circ, pre_merge)
+            reference_time = time.time() - start
+
+            start = time.time()
+            clusters, _, _ = nonlinear_attract_clustering(circ, pre_merge)
+            arrays_time = time.time() - start
+
+            same = set(map(frozenset, reference.values())) == set(map(frozenset, clusters.values()))
+            print(f"{name:30} {str(pre_merge):>9} {circ.nConstraints:>11} {reference_time:>9.2f}s {arrays_time:>9.2f}s {len(clusters):>9}"
+                  f" {max(map(len, clusters.values()), default=0):>8} {str(same):>5}")
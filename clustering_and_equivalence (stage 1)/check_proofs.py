@@ -0,0 +1,75 @@
+"""
+Checks the DRAT proofs of non-equivalence verdicts in result JSON files, in a separate pass from the comparisons that wrote them.
+
+Each file is a test_data JSON with a "proof" entry, as written by testing_harness.run_current_best_test with proof, and has the result
+of the check added as "proof_check". A pair rejected by its invariants before solving has a "certificate" entry naming the differing
+invariant instead, which is reported but needs no check. Other files without a proof, such as equivalent pairs and pairs that were not
+decided, are reported as having no proof.
+
+The following flags alter the behaviour of the file
+    --checker executable
+        the drat-trim executable used to check the proofs
+        : default
+            drat-trim if it is on the PATH, otherwise the bundled checker
+
+    --bundled
+        checks the proofs with the bundled checker, which is only practical for small proofs
+        : default
+            uses the external checker if available
+
+    --timeout
+        defines the timeout of the external checker for each proof in seconds
+        : default
+            0 seconds (no timeout)
+        : alternative
+            -t
+"""
+
+import sys
+import json
+import warnings
+
+from comparison_v2.proofs import check_proof, DRAT_TRIM
+
+if __name__ == '__main__':
+
+    filenames, checker, timeout = [], DRAT_TRIM, 0
+
+    if len(sys.argv) == 1:
+        raise SyntaxError("No File Provided")
+
+    i = 1
+    while i < len(sys.argv):
+        arg = sys.argv[i]
+
+        if arg[0] != "-":
+            filenames.append(arg)
+            i += 1
+            continue
+
+        match arg:
+            case "--checker":
+                if sys.argv[i+1][0] == '-': raise SyntaxError(f"Invalid checker {sys.argv[i+1]}")
+                checker, i = sys.argv[i+1], i+2
+            case "--bundled": checker, i = None, i+1
+            case "-t" | "--timeout":
+                if sys.argv[i+1][0] == '-': raise SyntaxError(f"Invalid timeout value {sys.argv[i+1]}")
+                timeout, i = int(sys.argv[i+1]), i+2
+            case _:
+                warnings.warn(f"Invalid argument '{arg}' ignored", SyntaxWarning)
+                i += 1
+
+    for filename in filenames:
+        with open(filename, "r") as f: test_data = json.load(f)
+        if test_data.get("proof", None) is None:
+            certificate = test_data.get("certificate", None)
+            if certificate is not None: print(filename, f"rejected by differing {certificate['invariant']}, no proof needed")
+            else: print(filename, "no proof", f"(result {test_data.get('result', None)})")
+            continue
+
+        test_data["proof_check"] = check_proof(test_data["proof"]["formula"], test_data["proof"]["proof"], checker=checker, timeout=timeout if timeout > 0 else None)
+        print(filename, "verified" if test_data["proof_check"]["verified"] else "NOT verified", f"by {test_data['proof_check']['checker']}")
+
+        with open(filename, "w") as f: json.dump(test_data, f, indent=4)
+
+    # python3 check_proofs.py results/*.json
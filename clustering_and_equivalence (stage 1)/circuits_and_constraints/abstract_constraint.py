@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Set, List, Hashable
+from typing import Set, List, Dict, Hashable
 
 class Constraint(ABC):
 
@@ -19,4 +19,13 @@ class Constraint(ABC):
     def is_nonlinear(self) -> bool: pass
 
     @abstractmethod
-    def get_coefficients(self) -> Hashable: pass
\ No newline at end of file
+    def get_coefficients(self) -> Hashable: pass
+
+    @abstractmethod
+    def term_counts(self) -> Hashable: pass
+
+    @abstractmethod
+    def relabelled(self, relabelling: Dict[int, int]) -> Hashable: pass
+
+    @abstractmethod
+    def signal_roles(self) -> Dict[int, Hashable]: pass
\ No newline at end of file
@@ -66,6 +66,21 @@ class ACIRConstraint(Constraint):
     def get_coefficients(self):
         return tuple(itertools.chain(itertools.chain.from_iterable(map(lambda part: tuple(sorted(part.values())), [self.mult, self.linear])), [self.constant])) # In general constraint values are sorted already since these are norms, but just to be careful
 
+    def term_counts(self):
+        return (len(self.mult), len(self.linear), self.constant != 0)
+
+    def relabelled(self, relabelling: Dict[int, int]) -> Hashable:
+        # exact unlike fingerprint, equal only for the same constraint after relabelling, signals not in relabelling are unchanged
+        return (frozenset((tuple(sorted(relabelling.get(sig, sig) for sig in key)), coef) for key, coef in self.mult.items()),
+                frozenset((relabelling.get(sig, sig), coef) for sig, coef in self.linear.items()), self.constant)
+
+    def signal_roles(self) -> Dict[int, Hashable]:
+        # the linear coefficient and sorted product coefficients of each signal, which tell apart signals with the same fingerprint
+        roles = {sig: [coef] for sig, coef in self.linear.items()}
+        for key, coef in self.mult.items():
+            for sig in key: roles.setdefault(sig, [0]).append(coef)
+        return {sig: (coefs[0], tuple(sorted(coefs[1:]))) for sig, coefs in roles.items()}
+
 
 def parse_acir_constraint(json: dict, prime: int) -> ACIRConstraint:
     ## Assumes each witness appears in each part at most once
@@ -1,5 +1,5 @@
 import itertools
-from typing import Set, List, Tuple, Hashable
+from typing import Set, List, Dict, Tuple, Hashable
 from circuits_and_constraints.abstract_constraint import Constraint
 
 from normalisation import divisionNorm
@@ -117,4 +117,18 @@ class R1CSConstraint(Constraint):
         return f"R1CSConstraint(A: {self.A}, B: {self.B}, C: {self.C})"
     
     def get_coefficients(self) -> Hashable:
-        return tuple(map(lambda part: tuple(sorted(part.values())), [self.A, self.B, self.C])) # In general constraint values are sorted already since these are norms, but just to be careful
\ No newline at end of file
+        return tuple(map(lambda part: tuple(sorted(part.values())), [self.A, self.B, self.C])) # In general constraint values are sorted already since these are norms, but just to be careful
+
+    def term_counts(self) -> Hashable:
+        # A and B are interchangeable so their counts are sorted, scaling a constraint never changes its terms
+        return (tuple(sorted([len(self.A), len(self.B)])), len(self.C))
+
+    def relabelled(self, relabelling: Dict[int, int]) -> Hashable:
+        # exact unlike fingerprint, equal only for the same constraint after relabelling, signals not in relabelling are unchanged
+        relabel = lambda part : frozenset((relabelling.get(sig, sig), coef) for sig, coef in part.items())
+        # A * B is commutative
+        return (frozenset([relabel(self.A), relabel(self.B)]), relabel(self.C))
+
+    def signal_roles(self) -> Dict[int, Hashable]:
+        # the coefficients of each signal, which tell apart signals of the constraint with the same fingerprint such as bits
+        return {sig: (self.A.get(sig, 0), self.B.get(sig, 0), self.C.get(sig, 0)) for sig in self.signals()}
\ No newline at end of file
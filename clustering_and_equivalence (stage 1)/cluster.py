@@ -19,11 +19,42 @@ The following flags alter the behaviour of the file
 
     -c clustering_type
         defines the type of clustering method performed
-            options are: nonlinear_attract, louvain
+            options are: nonlinear_attract, louvain, louvain-networkx, iterated_louvain
+                louvain: seeded Leiden modularity optimisation with igraph, louvain-igraph and leiden are aliases
+                louvain-networkx: louvain modularity optimisation with networkx, much slower, kept for comparison with earlier results
         : default
             louvain
         : alternative
             --clustering
+
+    --resolution-schedule factor,factor,...
+        runs louvain at each factor of the resolution in turn, each run starting from the partition of the previous
+        : default
+            a single run at the resolution
+
+    --sweep-resolutions resolution,resolution,...
+        runs louvain at each resolution on the same graph, in parallel with -j, and clusters by the run of highest modularity or, with
+        --expected-size, the run whose mean cluster size is closest. The metrics of every run are written to the "sweep" data of the JSON
+        : default
+            a single run at the resolution
+
+    --sweep-seeds seed,seed,...
+        as --sweep-resolutions for seeds, sweeping both runs every pair
+        : default
+            a single run with the seed
+
+    --coarsen
+        runs louvain on a coarse constraint graph where each chain of pass-through constraints, those adjacent to at most two other
+        constraints, is contracted into the constraint it shares most signals with, then projects the clusters back
+        : default
+            runs louvain on every constraint
+
+    --incremental previous_clustering.json previous_file.r1cs
+        reclusters from the clustering of a previous version of the circuit, a single JSON written by an earlier run with -m. Constraints
+        unchanged between the versions start louvain in their previous cluster, and nodes unchanged under the matching keep their previous
+        equivalence class so only the other nodes and one node of each previous class are analysed
+        : default
+            clusters from scratch
     
     -e equivalence_type
         defines the type of equivalence method utilised
@@ -33,6 +64,40 @@ The following flags alter the behaviour of the file
         : alternative
             --equivalence
     
+    --canonical-hash
+        groups clusters by a canonical hash of their subcircuit before comparing, so each cluster is compared once
+        : default
+            compares each cluster against every class with the same fingerprint
+
+    --fingerprint-index index_directory
+        reuses the equivalence classes of earlier runs stored in the index directory, clusters whose subcircuit has the canonical
+        hash of a stored class are classed by it after an exact check, the classes of the other clusters are added to the index
+        : default
+            no index is used
+
+    --hub-threshold maximum_degree
+        signals in more constraints than this are added to the constraint graph by the hub strategy rather than as a clique, for the
+        louvain methods
+        : default
+            every signal is added as a clique
+
+    --hub-strategy strategy
+        how signals above the hub threshold are added to the constraint graph
+            options are: drop, hub, sparsify
+                drop: the signal adds no edges, constraints left without edges join the most common cluster of the signal
+                hub: the signal is an auxiliary vertex adjacent to its constraints
+                sparsify: the signal adds a few random cycles through its constraints, weighted as the clique
+        : default
+            drop
+
+    -j number_of_processes
+        analyses the equivalence of independent fingerprint groups of clusters, runs the louvain sweep, and takes the subcircuits of the
+        connected components, in a pool of this many processes
+        : default
+            1, groups are analysed in turn
+        : alternative
+            --jobs
+
     -m
         includes each mapping between equivalent clusters
         : default
@@ -102,15 +167,19 @@ from circuits_and_constraints.acir.acir_circuit import ACIRCircuit
 from networkx.algorithms.community import louvain_communities
 from testing_harness import time_limit
 
-from structural_analysis.utilities.constraint_graph import shared_signal_graph_nx, shared_signal_graph_igraph
+from structural_analysis.utilities.constraint_graph import shared_signal_graph_nx, shared_signal_graph_sparse, constraint_partition, HUB_STRATEGIES
 from structural_analysis.utilities.connected_preprocessing import componentwise_preprocessing, preclustering
 from structural_analysis.clustering_methods.nonlinear_attract import nonlinear_attract_clustering
 # from structural_analysis.clustering_methods.linear_coefficient import cluster_by_linear_coefficient #TODO: maybe refactor but not promising enough to spend time on
 from structural_analysis.cluster_trees.dag_from_clusters import dag_from_partition, partition_from_partial_clustering, dag_to_nodes
-from structural_analysis.cluster_trees.full_equivalency_partitions import subcircuit_fingerprinting_equivalency, subcircuit_fingerprint_with_structural_augmentation_equivalency, subcircuit_fingerprinting_equivalency_and_structural_augmentation_equivalency
+from structural_analysis.cluster_trees.fingerprint_index import FingerprintIndex
+from structural_analysis.cluster_trees.incremental import PreviousClustering, incremental_equivalency
+from structural_analysis.cluster_trees.full_equivalency_partitions import subcircuit_fingerprinting_equivalency, subcircuit_fingerprint_with_structural_augmentation_equivalency, subcircuit_fingerprinting_equivalency_and_structural_augmentation_equivalency, propagate_subcirctuit_labels
 from structural_analysis.utilities.graph_to_img import dag_graph_to_img
 from structural_analysis.cluster_trees.dag_postprocessing import merge_passthrough, merge_only_nonlinear
 from structural_analysis.clustering_methods.iterated_louvain import iterated_louvain
+from structural_analysis.clustering_methods.coarsening import coarsen_graph, coarsen_membership, project_clustering
+from structural_analysis.clustering_methods.leiden import leiden_clustering, leiden_sweep
 from maximal_equivalence.applied_maximal_equivalence import maximally_equivalent_classes
 from structural_analysis.cluster_trees.dag_from_clusters import DAGNode
 
@@ -142,6 +211,17 @@ def circuit_cluster(
         single_json: bool = False,
         resolution: int | None = None,
         expected_size: int | None = None,
+        canonical_hashing: bool = False,
+        fingerprint_index: str | None = None,
+        jobs: int = 1,
+        hub_threshold: int | None = None,
+        hub_strategy: str = "drop",
+        resolution_schedule: List[float] | None = None,
+        sweep_resolutions: List[float] | None = None,
+        sweep_seeds: List[int] | None = None,
+        coarsen: bool = False,
+        previous_clustering: str | None = None,
+        previous_file: str | None = None,
         debug: int = 0,
     ):
     """
@@ -151,6 +231,8 @@ def circuit_cluster(
     if seed is None:
         seed = random.randint(0,25565)
 
+    subcircuit_index = None if fingerprint_index is None else FingerprintIndex(fingerprint_index)
+
     if debug:
         log = []
         debug_start_time = time.time()
@@ -166,6 +248,15 @@ def circuit_cluster(
 
     main_circ.parse_file(input_filename)
 
+    previous = None
+    if previous_clustering is not None:
+        if sweep_resolutions is not None or sweep_seeds is not None: raise SyntaxError("Can't sweep an incremental clustering")
+        previous_circ = main_circ.__class__()
+        previous_circ.parse_file(previous_file)
+        previous = PreviousClustering(previous_clustering, previous_circ, main_circ)
+        if previous.classes is None or previous.mappings is None:
+            warnings.warn(f"{previous_clustering} has no equivalence mappings, every node will be analysed")
+
     if debug:
         debug_parsing_time = time.time()
         logging_lines([f"File Parsed: {debug_parsing_time - debug_last_time}s"], [log], printbool = debug >= DEBUG_PRINT_LEVEL)
@@ -186,19 +277,22 @@ def circuit_cluster(
             coni_inverse = []
 
             for circ, sig_inv, coni_inv in iterable:
-                circs_, minimum_size_clusterings_, sig_inverse_, coni_inverse_ = componentwise_preprocessing(circ, minimum_circuit_size=minimum_circuit_size, output_automatic_clusters=output_automatic_clusters, debug=False)
+                circs_, minimum_size_clusterings_, sig_inverse_, coni_inverse_ = componentwise_preprocessing(circ, minimum_circuit_size=minimum_circuit_size, output_automatic_clusters=output_automatic_clusters, debug=False, jobs=jobs)
                 circs.extend(circs_)
                 minimum_size_clusterings.extend(minimum_size_clusterings_)
                 sig_inverse.extend([{key: sig_inv[val] for key, val in sig_inv_.items()} for sig_inv_ in sig_inverse_])
                 coni_inverse.extend([list(map(coni_inv.__getitem__, coni_inv_)) for coni_inv_ in coni_inverse_])
 
     elif not skip_preprocessing:
-        circs, minimum_size_clusterings, sig_inverse, coni_inverse = componentwise_preprocessing(main_circ, minimum_circuit_size=minimum_circuit_size, output_automatic_clusters=output_automatic_clusters, debug=debug)
+        circs, minimum_size_clusterings, sig_inverse, coni_inverse = componentwise_preprocessing(main_circ, minimum_circuit_size=minimum_circuit_size, output_automatic_clusters=output_automatic_clusters, debug=debug, jobs=jobs)
     else:
         undo_remapping = False
         circs = [main_circ]
         minimum_size_clusterings = []
-    
+        sig_inverse, coni_inverse = [None], [None]
+
+    # the inverses are kept to match the parts with the previous clustering
+    part_sig_inverse, part_coni_inverse = sig_inverse, coni_inverse
     if not undo_remapping: sig_inverse, coni_inverse = None, None
 
     if main_circ.nOutputs == 0: warnings.warn("Your circuit has no outputs, this may cause undefined behaviour")
@@ -269,7 +363,7 @@ def circuit_cluster(
             mappings = { 'local': [[] for _ in nodes] }
 
         elif equivalence_method != "none":
-            equivalency_list, mappings_list = subcircuit_fingerprinting_equivalency(nodes)
+            equivalency_list, mappings_list = subcircuit_fingerprinting_equivalency(nodes, canonical_hashing=canonical_hashing, index=subcircuit_index, index_source=f"{filename}:automatic:", jobs=jobs)
             equivalency, mappings = {}, {}
             if equivalence_method in ['local', 'total']:
                 equivalency['local'] = equivalency_list
@@ -351,37 +445,49 @@ def circuit_cluster(
                 clusters, _, remaining = nonlinear_attract_clustering(circ, pre_merge = automerge_only_nonlinear)
                 partition = partition_from_partial_clustering(circ, clusters.values(), remaining=remaining)
 
-            case "louvain":
-                circuit_graph = shared_signal_graph_nx(circ.constraints)
-                resolution = get_resolution(circ, circuit_graph.number_of_edges())
-                if debug: logging_lines([f"Graph Created in: {time.time() - last_time}", f"Resolution: {resolution}", f"Expected size: {(2 * circuit_graph.number_of_edges() / resolution)**0.5}"], [log, circuit_log], printbool = debug >= DEBUG_PRINT_LEVEL)
-                partition = list(map(list, louvain_communities(circuit_graph, resolution=resolution, seed=seed)))
-
             case "louvain-networkx":
-                circuit_graph = shared_signal_graph_nx(circ.constraints)
+                if hub_threshold is None:
+                    circuit_graph = shared_signal_graph_nx(circ.constraints)
+                else:
+                    hub_graph = shared_signal_graph_sparse(circ, hub_threshold, hub_strategy, seed)
+                    circuit_graph = hub_graph.to_networkx()
                 resolution = get_resolution(circ, circuit_graph.number_of_edges())
                 if debug: logging_lines([f"Graph Created in: {time.time() - last_time}", f"Resolution: {resolution}", f"Expected size: {(2 * circuit_graph.number_of_edges() / resolution)**0.5}"], [log, circuit_log], printbool = debug >= DEBUG_PRINT_LEVEL)
                 partition = list(map(list, louvain_communities(circuit_graph, resolution=resolution, seed=seed)))
+                if hub_threshold is not None: partition = constraint_partition(partition, circ, hub_graph)
 
-            case "louvain-igraph":
+            case "louvain" | "louvain-igraph" | "leiden":
                 if circ.nConstraints > 1:
-                    random.seed(seed)
-                    circuit_graph = shared_signal_graph_igraph(circ)
+                    circuit_graph = shared_signal_graph_sparse(circ, hub_threshold, hub_strategy, seed)
                     resolution = get_resolution(circ, len(circuit_graph.es))
                     if debug: logging_lines([f"Graph Created in: {time.time() - last_time}", f"Resolution: {resolution}", f"Expected size: {(2 * len(circuit_graph.es) / resolution)**0.5}"], [log, circuit_log], printbool = debug >= DEBUG_PRINT_LEVEL)
-                    partition = circuit_graph.community_leiden(
-                            objective_function = 'modularity',
-                            resolution = resolution,
-                            n_iterations = leiden_iterations
-                        )
+
+                    # the resolution is that of the original graph, the coarse graph has the same total weight
+                    cluster_graph, groups = circuit_graph, None
+                    if coarsen:
+                        cluster_graph, groups = coarsen_graph(circ, circuit_graph)
+                        data["coarse_vertices"] = cluster_graph.vcount()
+                        if debug: logging_lines([f"Coarsened {circuit_graph.vcount()} vertices to {cluster_graph.vcount()}"], [log, circuit_log], printbool = debug >= DEBUG_PRINT_LEVEL)
+
+                    if sweep_resolutions is None and sweep_seeds is None:
+                        initial_membership = None if previous is None else previous.initial_membership(part_coni_inverse[index], circuit_graph.vcount())
+                        if initial_membership is not None and groups is not None: initial_membership = coarsen_membership(initial_membership, groups)
+                        partition = leiden_clustering(cluster_graph, resolution, resolution_schedule, seed=seed, n_iterations=leiden_iterations, 
+                                                      initial_membership=initial_membership)
+                    else:
+                        partition, data["sweep"] = leiden_sweep(cluster_graph, [resolution] if sweep_resolutions is None else sweep_resolutions,
+                                                                [seed] if sweep_seeds is None else sweep_seeds, resolution_schedule, leiden_iterations,
+                                                                expected_size=expected_size, jobs=jobs)
+                    if groups is not None: partition = project_clustering(partition, circuit_graph, groups)
                     if debug: logging_lines([f"Modularity: {partition.modularity}"], [log, circuit_log])
+                    partition = constraint_partition(partition, circ, circuit_graph)
                 else:
                     partition = [[0]]
 
             case "iterated_louvain":
-                circuit_graph = shared_signal_graph_igraph(circ)
+                circuit_graph = shared_signal_graph_sparse(circ, hub_threshold, hub_strategy, seed)
                 partition, resolution = iterated_louvain(circuit_graph, init_resolution=get_resolution(circ, len(circuit_graph.es)), seed=seed)
-                partition = list(map(list, partition))
+                partition = constraint_partition(partition, circ, circuit_graph)
                 data["final_resolution"] = resolution
             
             # case "linear_coefficient":
@@ -441,25 +547,43 @@ def circuit_cluster(
             print(get_outfile(index, "png"))
             dag_graph_to_img(circ, circuit_graph, nodes, get_outfile(index, "png"))
 
+        local_analysis = lambda analysed : subcircuit_fingerprinting_equivalency(analysed, canonical_hashing=canonical_hashing, index=subcircuit_index, index_source=f"{filename}:{index}:", jobs=jobs)
+        incremental = previous is not None and previous.classes is not None and previous.mappings is not None and equivalence_method in ["local", "structural", "total"]
+        if incremental:
+            unchanged = previous.unchanged_nodes(nodes, part_coni_inverse[index], part_sig_inverse[index])
+            data["unchanged_nodes"] = len(unchanged)
+            if debug: logging_lines([f"Unchanged Nodes: {len(unchanged)} of {len(nodes)}"], [log, circuit_log], printbool = debug >= DEBUG_PRINT_LEVEL)
+
         match equivalence_method:
 
             case "local":
                 equivalency = {}
                 mappings = {}
-                local_equivalency, local_mapping = subcircuit_fingerprinting_equivalency(nodes)
+                if incremental:
+                    local_equivalency, local_mapping = incremental_equivalency(nodes, previous, unchanged, local_analysis)
+                else:
+                    local_equivalency, local_mapping = local_analysis(nodes)
                 equivalency["local"] = local_equivalency
                 mappings["local"] = local_mapping
 
 
             case "structural":
                 equivalency = {}
-                structural_equivalency, structural_mapping = subcircuit_fingerprint_with_structural_augmentation_equivalency(nodes)
+                if incremental:
+                    # structural classes are refined from the local classes by label passing, as for the total method
+                    structural_equivalency, structural_mapping = propagate_subcirctuit_labels(nodes, *incremental_equivalency(nodes, previous, unchanged, local_analysis))
+                else:
+                    structural_equivalency, structural_mapping = subcircuit_fingerprint_with_structural_augmentation_equivalency(nodes, canonical_hashing=canonical_hashing, index=subcircuit_index, index_source=f"{filename}:{index}:", jobs=jobs)
                 equivalency["structural"] = structural_equivalency
                 mappings = {}
                 mappings["structural"] = structural_mapping
             
             case "total":
-                local_equiv, local_mapp, full_equiv, full_mapp = subcircuit_fingerprinting_equivalency_and_structural_augmentation_equivalency(nodes)
+                if incremental:
+                    local_equiv, local_mapp = incremental_equivalency(nodes, previous, unchanged, local_analysis)
+                    full_equiv, full_mapp = propagate_subcirctuit_labels(nodes, local_equiv, local_mapp)
+                else:
+                    local_equiv, local_mapp, full_equiv, full_mapp = subcircuit_fingerprinting_equivalency_and_structural_augmentation_equivalency(nodes, canonical_hashing=canonical_hashing, index=subcircuit_index, index_source=f"{filename}:{index}:", jobs=jobs)
 
                 equivalency = {
                     "local": local_equiv,
@@ -571,7 +695,9 @@ if __name__ == '__main__':
     automerge_passthrough, automerge_only_nonlinear, return_img , timing, undo_remapping, include_mappings = True, False, False, True, True, False
     maxequiv, maxequiv_timeout, maxequiv_tol, maxequiv_merge, sanity_check, seed, debug, minimum_circuit_size = False, 5, 0.8, 0, False, None, 0, 100
     output_automatic_clusters, skip_preprocessing, preclustering_file, leiden_iterations, single_json = True, False, None, -1, False
-    resolution, expected_size = None, None
+    resolution, expected_size, canonical_hashing, fingerprint_index, jobs = None, None, False, None, 1
+    hub_threshold, hub_strategy, resolution_schedule, sweep_resolutions, sweep_seeds = None, "drop", None, None, None
+    previous_clustering, previous_file, coarsen = None, None, False
 
     def set_file(index: int, filename: str):
         if filename[0] == '-': raise SyntaxError(f"Invalid {'input' if not index else 'outout'} filename {filename}")
@@ -679,6 +805,37 @@ if __name__ == '__main__':
             case "--no-timing-information": timing, i = False, i+1
             case "--maximal-equivalence": maxequiv, i = True, i+1
             case "--sanity-check": sanity_check, i = True, i+1
+            case "--canonical-hash": canonical_hashing, i = True, i+1
+            case "-j":
+                if sys.argv[i+1][0] == '-': raise SyntaxError(f"Invalid jobs value {sys.argv[i+1]}")
+                jobs = int(sys.argv[i+1])
+                i += 2
+            case "--jobs":
+                if sys.argv[i+1][0] == '-': raise SyntaxError(f"Invalid jobs value {sys.argv[i+1]}")
+                jobs = int(sys.argv[i+1])
+                i += 2
+            case "--hub-threshold":
+                if sys.argv[i+1][0] == '-': raise SyntaxError(f"Invalid hub threshold value {sys.argv[i+1]}")
+                hub_threshold, i = int(sys.argv[i+1]), i+2
+            case "--hub-strategy":
+                if sys.argv[i+1] not in HUB_STRATEGIES: raise SyntaxError(f"Invalid hub strategy {sys.argv[i+1]}, expected one of {HUB_STRATEGIES}")
+                hub_strategy, i = sys.argv[i+1], i+2
+            case "--resolution-schedule":
+                if sys.argv[i+1][0] == '-': raise SyntaxError(f"Invalid resolution schedule {sys.argv[i+1]}")
+                resolution_schedule, i = list(map(float, sys.argv[i+1].split(","))), i+2
+            case "--sweep-resolutions":
+                if sys.argv[i+1][0] == '-': raise SyntaxError(f"Invalid sweep resolutions {sys.argv[i+1]}")
+                sweep_resolutions, i = list(map(float, sys.argv[i+1].split(","))), i+2
+            case "--sweep-seeds":
+                if sys.argv[i+1][0] == '-': raise SyntaxError(f"Invalid sweep seeds {sys.argv[i+1]}")
+                sweep_seeds, i = list(map(int, sys.argv[i+1].split(","))), i+2
+            case "--coarsen": coarsen, i = True, i+1
+            case "--incremental":
+                if sys.argv[i+1][0] == '-' or sys.argv[i+2][0] == '-': raise SyntaxError(f"Invalid previous clustering {sys.argv[i+1]} {sys.argv[i+2]}")
+                previous_clustering, previous_file, i = sys.argv[i+1], sys.argv[i+2], i+3
+            case "--fingerprint-index":
+                if sys.argv[i+1][0] == '-': raise SyntaxError(f"Invalid index directory {sys.argv[i+1]}")
+                fingerprint_index, i = sys.argv[i+1], i+2
             case "--debug": debug, i = 2, i+1
             case "--log": debug, i = 1, i+1
             case "-d": debug, i = True, i+1
@@ -712,6 +869,8 @@ if __name__ == '__main__':
         circuit_cluster(*req_args, automerge_passthrough=automerge_passthrough, automerge_only_nonlinear=automerge_only_nonlinear, return_img=return_img, timing=timing, undo_remapping = undo_remapping, include_mappings=include_mappings, 
             maxequiv=maxequiv, maxequiv_tol=maxequiv_tol, maxequiv_timeout=maxequiv_timeout, maxequiv_merge=maxequiv_merge, sanity_check=sanity_check, seed = seed, minimum_circuit_size=minimum_circuit_size, 
             output_automatic_clusters=output_automatic_clusters, skip_preprocessing=skip_preprocessing, preclustering_file=preclustering_file, leiden_iterations=leiden_iterations, single_json=single_json, 
-            resolution=resolution, expected_size=expected_size, debug=debug)
+            resolution=resolution, expected_size=expected_size, canonical_hashing=canonical_hashing, fingerprint_index=fingerprint_index, jobs=jobs, 
+            hub_threshold=hub_threshold, hub_strategy=hub_strategy, resolution_schedule=resolution_schedule, 
+            sweep_resolutions=sweep_resolutions, sweep_seeds=sweep_seeds, coarsen=coarsen, previous_clustering=previous_clustering, previous_file=previous_file, debug=debug)
 
     # python3 cluster.py r1cs_files/binsub_test.r1cs -o clustering_tests -e structural
\ No newline at end of file
@@ -0,0 +1,274 @@
+"""
+Canonical labelling of circuits by colour refinement and individualisation-refinement.
+
+Two circuits that are equivalent up to a signal/constraint permutation and constant factors get the same certificate, so circuits
+can be grouped by the hash of the certificate in linear time rather than being compared pairwise.
+"""
+
+from typing import List, Dict, Tuple, Hashable, Iterable, Callable
+import hashlib
+
+from circuits_and_constraints.abstract_circuit import Circuit
+from circuits_and_constraints.abstract_constraint import Constraint
+
+from utilities.utilities import _signal_data_from_cons_list, UnionFind
+
+DEFAULT_MAX_LEAVES = 256
+
+# ranks before every refined colour, so an individualised signal is always in a class of its own
+INDIVIDUALISED_COLOUR = (-1, 0)
+
+class _SearchLimitReached(Exception): pass
+
+def _rank_colours(keys: Iterable[Hashable]) -> Tuple[List[Tuple[int, int]], int]:
+    """
+    Replaces each key by its rank in the sorted distinct keys. Unlike an Assignment the colour does not depend on the order of the
+    keys, hence does not depend on the indexing of the circuit. Colours are tuples to be comparable with CONSTANT_FINGERPRINT.
+
+    Return
+    ---------
+    Tuple[List[Tuple[int, int]], int]
+        The colour of each key, and the number of distinct colours
+    """
+    keys = list(keys)
+    ranks = {key: i for i, key in enumerate(sorted(set(keys)))}
+    return [(0, ranks[key]) for key in keys], len(ranks)
+
+def _split_classes(elements: List[int], colours: Dict[int, Hashable] | List[Hashable], touched: Iterable[int], fingerprint: Callable[[int], Hashable]) -> Tuple[List[Tuple[int, int]], List[int]]:
+    """
+    Splits each colour class containing a touched element by the fingerprint of its elements, other classes are not fingerprinted.
+
+    Return
+    ---------
+    Tuple[List[Tuple[int, int]], List[int]]
+        The new colour of each element, and the elements in classes that were split
+    """
+    touched_colours = set(map(colours.__getitem__, touched))
+    new_colours, _ = _rank_colours(
+        (colours[elem], fingerprint(elem)) if colours[elem] in touched_colours else (colours[elem],) for elem in elements)
+
+    old_to_new = {}
+    for elem, colour in zip(elements, new_colours): old_to_new.setdefault(colours[elem], set([])).add(colour)
+    return new_colours, [elem for elem in elements if len(old_to_new[colours[elem]]) > 1]
+
+def colour_refinement(
+        norms: List[Constraint],
+        signals: List[int],
+        signal_to_normi: Dict[int, List[int]],
+        fingerprint_signal: Callable,
+        signal_colours: Dict[int, Hashable],
+        norm_colours: List[Hashable],
+        split_signals: List[int] | None = None
+    ) -> Tuple[Dict[int, Tuple[int, int]], List[Tuple[int, int]]]:
+    """
+    Refines the colours of norms and signals by their incidence until stable.
+
+    A norm is recoloured by its current colour and its fingerprint under the signal colours, then each signal by its current colour
+    and its fingerprint under the norm colours. This is the same refinement as back_and_forth_fingerprinting on a single circuit, but
+    the colours are canonical so can be compared between circuits that were never fingerprinted together. After the first round only
+    the classes incident to a class that was split in the last round are fingerprinted again.
+
+    Parameters
+    -----------
+        norms: List[Constraint]
+            The normalised constraints of the circuit
+        signals: List[int]
+            The signals of the circuit
+        signal_to_normi: Dict[int, List[int]]
+            The norms each signal is in, must have an entry for every signal
+        fingerprint_signal: Callable
+            The fingerprint_signal method of the circuit
+        signal_colours: Dict[int, Hashable]
+            The initial colour of each signal
+        norm_colours: List[Hashable]
+            The initial colour of each norm
+        split_signals: List[int] | None
+            If not None, the colours must be the output of a previous refinement where only the classes of split_signals have since
+            been split, e.g. by individualisation. Default None, everything is fingerprinted in the first round.
+
+    Return
+    ---------
+    Tuple[Dict[int, Tuple[int, int]], List[Tuple[int, int]]]
+        The stable colour of each signal and of each norm
+    """
+    normis = list(range(len(norms)))
+
+    def _norm_fingerprint(normi: int) -> Hashable:
+        return norms[normi].fingerprint(signal_colours)
+
+    def _signal_fingerprint(sig: int) -> Hashable:
+        return fingerprint_signal(sig, norms, norm_colours, signal_colours, signal_to_normi)
+
+    if split_signals is None:
+        signal_list, _ = _rank_colours(map(signal_colours.__getitem__, signals))
+        signal_colours = dict(zip(signals, signal_list))
+        norm_colours, _ = _rank_colours(norm_colours)
+
+        norm_colours, split_norms = _split_classes(normis, norm_colours, normis, _norm_fingerprint)
+        signal_list, split_signals = _split_classes(signals, signal_colours, signals, _signal_fingerprint)
+        signal_colours = dict(zip(signals, signal_list))
+
+    while len(split_signals) > 0:
+        norm_colours, split_norms = _split_classes(normis, norm_colours, set(normi for sig in split_signals for normi in signal_to_normi[sig]), _norm_fingerprint)
+        signal_list, split_signals = _split_classes(signals, signal_colours, 
+                                                    set(sig for normi in split_norms for sig in norms[normi].signals() if sig in signal_colours), _signal_fingerprint)
+        signal_colours = dict(zip(signals, signal_list))
+
+    return signal_colours, norm_colours
+
+def canonical_labelling(
+        norms: List[Constraint],
+        signals: List[int],
+        fingerprint_signal: Callable,
+        initial_signal_colours: Dict[int, Hashable],
+        initial_norm_colours: List[Hashable] | None = None,
+        max_leaves: int = DEFAULT_MAX_LEAVES,
+        return_automorphisms: bool = False
+    ) -> Tuple[Hashable, Dict[int, int]] | None | Tuple[Tuple[Hashable, Dict[int, int]] | None, List[Dict[int, int]]]:
+    """
+    Canonical labelling of the signals of a circuit by individualisation-refinement, as in nauty/bliss.
+
+    The colours are refined until stable, then a signal from the first non-singleton class is individualised and the colours are refined
+    again, recursively, until every signal has a distinct colour. Each such leaf gives a labelling of the signals and a certificate:
+    the sorted norm fingerprints under that labelling. The smallest certificate over all leaves is canonical. Two leaves with the same
+    certificate give an automorphism of the circuit, which are used to skip individualising signals in the same orbit as one already tried.
+
+    Parameters
+    -----------
+        norms: List[Constraint]
+            The normalised constraints of the circuit
+        signals: List[int]
+            The signals of the circuit
+        fingerprint_signal: Callable
+            The fingerprint_signal method of the circuit
+        initial_signal_colours: Dict[int, Hashable]
+            Initial colour of each signal, only signals of the same colour can be mapped to each other. Must be comparable between circuits.
+        initial_norm_colours: List[Hashable] | None
+            Initial colour of each norm, only norms of the same colour can be mapped to each other. Default None, all the same colour.
+        max_leaves: int
+            The maximum number of leaves searched. Default DEFAULT_MAX_LEAVES.
+        return_automorphisms: bool
+            Flag for whether to also return the automorphisms found during the search. Default False.
+
+    Return
+    ---------
+    Tuple[Hashable, Dict[int, int]] | None
+        The canonical certificate and the signal to canonical label mapping. If more than max_leaves leaves are needed returns None
+    List[Dict[int, int]], optional
+        If return_automorphisms, the automorphisms found as signal to signal mappings, including those found before the search limit
+        was reached. These are only automorphisms up to Constraint.fingerprint, so should be checked if used for more than hashing.
+    """
+
+    signals = list(signals)
+    if initial_norm_colours is None: initial_norm_colours = [0 for _ in norms]
+
+    signal_to_normi = _signal_data_from_cons_list(norms, signal_to_cons = {sig: [] for sig in signals})
+
+    def _certificate(signal_colours: Dict[int, Tuple[int, int]]) -> Hashable:
+        return (
+            tuple(sorted(zip(initial_norm_colours, map(lambda norm : norm.fingerprint(signal_colours), norms)))),
+            tuple(map(lambda sig : initial_signal_colours[sig], sorted(signals, key = signal_colours.__getitem__)))
+        )
+
+    state = {"leaves": 0, "first": None, "best": None}
+    automorphisms: List[Dict[int, int]] = []
+
+    def _common_prefix(lpath: List[int], rpath: List[int]) -> int:
+        return next((i for i, (l, r) in enumerate(zip(lpath, rpath)) if l != r), min(len(lpath), len(rpath)))
+
+    def _search(signal_colours: Dict[int, Hashable], norm_colours: List[Hashable], prefix: List[int], split_signals: List[int] | None) -> int:
+        """
+        Searches the subtree of prefix, returning the depth to backtrack to. When a leaf is equivalent to the first or best leaf the
+        automorphism maps the rest of the subtree onto an already searched subtree, so the search backtracks to their common ancestor.
+        """
+        signal_colours, norm_colours = colour_refinement(norms, signals, signal_to_normi, fingerprint_signal, signal_colours, norm_colours, split_signals)
+
+        colour_to_signals = {}
+        for sig in signals: colour_to_signals.setdefault(signal_colours[sig], []).append(sig)
+        nonsingular = [colour for colour in sorted(colour_to_signals.keys()) if len(colour_to_signals[colour]) > 1]
+
+        if len(nonsingular) == 0:
+            state["leaves"] += 1
+            if state["leaves"] > max_leaves: raise _SearchLimitReached()
+
+            leaf = (_certificate(signal_colours), signal_colours, prefix)
+            for other in [state["first"], state["best"]]:
+                if other is not None and other[0] == leaf[0]:
+                    label_to_signal = {colour: sig for sig, colour in other[1].items()}
+                    automorphisms.append({sig: label_to_signal[colour] for sig, colour in signal_colours.items()})
+                    return _common_prefix(prefix, other[2])
+
+            if state["first"] is None: state["first"] = leaf
+            if state["best"] is None or leaf[0] < state["best"][0]: state["best"] = leaf
+            return len(prefix)
+
+        cell = colour_to_signals[nonsingular[0]]
+        explored = []
+        orbits, nautomorphisms = UnionFind(), 0
+
+        for sig in cell:
+
+            # orbits under the automorphisms found so far that fix the individualised prefix
+            for automorphism in filter(lambda automorphism : all(automorphism[fixed] == fixed for fixed in prefix), automorphisms[nautomorphisms:]):
+                for osig in cell: orbits.union(osig, automorphism[osig])
+            nautomorphisms = len(automorphisms)
+            if any(orbits.find(sig) == orbits.find(osig) for osig in explored): continue
+
+            explored.append(sig)
+            individualised = dict(signal_colours)
+            individualised[sig] = INDIVIDUALISED_COLOUR
+
+            backtrack = _search(individualised, norm_colours, prefix + [sig], cell)
+            if backtrack < len(prefix): return backtrack
+
+        return len(prefix)
+
+    try:
+        _search(initial_signal_colours, initial_norm_colours, [], None)
+    except _SearchLimitReached:
+        return (None, automorphisms) if return_automorphisms else None
+
+    certificate, signal_colours, _ = state["best"]
+    labelling = certificate, {sig: colour[1] for sig, colour in signal_colours.items()}
+    return (labelling, automorphisms) if return_automorphisms else labelling
+
+def canonical_hash(
+        circ: Circuit,
+        initial_signal_colours: Dict[int, Hashable] | None = None,
+        initial_norm_colours: List[Hashable] | None = None,
+        max_leaves: int = DEFAULT_MAX_LEAVES,
+        return_labels: bool = False
+    ) -> str | None | Tuple[str, Dict[int, int]]:
+    """
+    Hash of the canonical certificate of the normalised constraints of circ, normalising the circuit if not already normalised.
+
+    By default signals are initially coloured as output, input, or neither; as in circuit_equivalence. Equivalent circuits have the
+    same hash, assuming Constraint.fingerprint does not depend on the order of the signals.
+
+    Parameters
+    -----------
+        circ: Circuit
+            The circuit to hash
+        return_labels: bool
+            Flag for whether to also return the canonical labels of the signals. Default False.
+
+    For other parameters see canonical_labelling.
+
+    Return
+    ---------
+    str | None
+        The hex sha256 digest of the certificate, None if the labelling search exceeded max_leaves
+    Dict[int, int], optional
+        If return_labels, the canonical label of each signal. Labels start at 1 so that the constant signal 0 keeps its index.
+    """
+
+    if len(circ.normalised_constraints) == 0: circ.normalise_constraints()
+
+    if initial_signal_colours is None:
+        initial_signal_colours = {sig: 1 if circ.signal_is_output(sig) else 2 if circ.signal_is_input(sig) else 3 for sig in circ.get_signals()}
+
+    labelling = canonical_labelling(circ.normalised_constraints, circ.get_signals(), circ.fingerprint_signal, initial_signal_colours, initial_norm_colours, max_leaves)
+    if labelling is None: return None
+
+    hash_ = hashlib.sha256(repr(labelling[0]).encode()).hexdigest()
+    return (hash_, {sig: label + 1 for sig, label in labelling[1].items()}) if return_labels else hash_
@@ -0,0 +1,98 @@
+"""
+Formula-like clause sinks that stream encoded clauses directly into a SAT solver
+"""
+
+from typing import List, Iterable, TextIO
+from pysat.solvers import Solver
+
+DEFAULT_BATCH_SIZE = 10000
+
+# The DIMACS header is only known once all clauses are written, a fixed width line is reserved and overwritten on close
+DIMACS_HEADER_WIDTH = 64
+
+class SolverSink():
+    """
+    Streams clauses into an already instantiated solver instead of building a complete CNF first.
+
+    Implements the `append`/`extend` interface of pysat.formula.CNF that the encoders in `constraint_encoding_v2` use, so can
+    be passed in place of the formula. Clauses are buffered and passed to the solver in batches with `append_formula`. Hence
+    clauses never exist twice in memory, at most batch_size clauses are held by the sink.
+
+    Attributes
+    -----------
+        solver: Solver
+            The solver the clauses are passed to
+        batch_size: int
+            The number of clauses buffered before being passed to the solver
+        nclauses: int
+            The number of clauses appended to the sink so far
+        dimacs: TextIO | None
+            If not None, every clause is also written to this DIMACS file for debugging
+        selector: int | None
+            If not None, every clause is guarded by this literal i.e. only active when the solver assumes it
+        class_selector: int | None
+            If not None, clauses are also guarded by this literal. Changed by the encoder between classes to guard each class separately
+    """
+
+    def __init__(self, solver: Solver, batch_size: int = DEFAULT_BATCH_SIZE, dimacs_file: str | None = None, selector: int | None = None):
+        """
+        Constructor for SolverSink
+
+        Parameters
+        -----------
+            solver: Solver
+                The instantiated solver the clauses are passed to
+            batch_size: int
+                The number of clauses buffered before being passed to the solver. Default DEFAULT_BATCH_SIZE
+            dimacs_file: str | None
+                If not None, the location of a DIMACS file the clauses are also written to. Default None
+            selector: int | None
+                If not None, -selector is added to every clause so the clauses can be later disabled in an incremental solver. Default None
+        """
+        self.solver = solver
+        self.batch_size = batch_size
+        self.nclauses = 0
+        self.buffer = []
+        self.selector = selector
+        self.class_selector = None
+
+        self.dimacs: TextIO | None = None
+        if dimacs_file is not None:
+            self.dimacs = open(dimacs_file, "w")
+            self.dimacs.write(" " * DIMACS_HEADER_WIDTH + "\n")
+
+    def append(self, clause: List[int]) -> None:
+        "Adds a single clause to the sink, flushing if the buffer is full"
+        if self.selector is not None: clause = [*clause, -self.selector]
+        if self.class_selector is not None: clause = [*clause, -self.class_selector]
+        self.buffer.append(clause)
+        self.nclauses += 1
+        if len(self.buffer) >= self.batch_size: self.flush()
+
+    def extend(self, clauses: Iterable[List[int]]) -> None:
+        "Adds each clause in clauses to the sink"
+        for clause in clauses: self.append(clause)
+
+    def flush(self) -> None:
+        "Passes all buffered clauses to the solver"
+        if len(self.buffer) == 0: return
+
+        self.solver.append_formula(self.buffer)
+        if self.dimacs is not None:
+            self.dimacs.writelines(" ".join(map(str, clause)) + " 0\n" for clause in self.buffer)
+
+        self.buffer = []
+
+    def close(self) -> None:
+        """
+        Flushes the remaining clauses, and if dumping writes the DIMACS header and closes the file.
+
+        Must be called before solving.
+        """
+        self.flush()
+
+        if self.dimacs is not None:
+            self.dimacs.seek(0)
+            self.dimacs.write(f"p cnf {self.solver.nof_vars()} {self.nclauses}".ljust(DIMACS_HEADER_WIDTH))
+            self.dimacs.close()
+            self.dimacs = None
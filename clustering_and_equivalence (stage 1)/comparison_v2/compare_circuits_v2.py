@@ -2,9 +2,9 @@
 Main function for circuit equivalence
 """
 
-from typing import Tuple, List, Dict
-from pysat.formula import CNF
+from typing import Tuple, List, Dict, Hashable
 from pysat.solvers import Solver
+from pysat.formula import CNF
 import time
 import itertools
 from collections import deque 
@@ -13,10 +13,19 @@ from circuits_and_constraints.abstract_circuit import Circuit
 from circuits_and_constraints.abstract_constraint import Constraint
 
 from utilities.utilities import _signal_data_from_cons_list, count_ints
+from utilities.assignment import decode_model
+from utilities.deadline import Deadline, TimeoutException, check_deadline
+from utilities.budget import Budget, check_budget_clauses, default_solver_name
 from structural_analysis.utilities.connected_preprocessing import connected_preprocessing
 
 from comparison_v2.fingerprinting_v2 import back_and_forth_fingerprinting, early_exit
 from comparison_v2.constraint_encoding_v2 import encode_classes_v2
+from comparison_v2.clause_sink import SolverSink
+from comparison_v2.solver_portfolio import default_portfolio, race_solvers
+from comparison_v2.symmetry_breaking import symmetry_breaking_clauses
+from comparison_v2.prescreen import structural_invariants, coefficient_invariants, compare_invariants
+from comparison_v2.unsat_cores import minimise_core, core_pattern, matches_core_pattern
+from comparison_v2.proofs import store_proof
 
 # TODO: tomorrow
 
@@ -26,13 +35,20 @@ def circuit_equivalence(
         debug: bool = False,
         fingerprints_to_normi: Dict[str, Dict[int, List[int]]] | None = None,
         fingerprints_to_signals: Dict[str, Dict[int, List[int]]] | None = None,
+        dimacs_file: str | None = None,
+        portfolio: bool | List[str] = False,
+        symmetry_breaking: bool = False,
+        explain_unsat: bool = False,
+        deadline: Deadline | None = None,
+        budget: Budget | None = None,
+        proof_prefix: str | None = None
         ) -> Dict[str, any]:
     """
     Implementation of circuit_equivalence by fingerprinting with propagation and SAT encoding
 
     Given two circuits where each connected component has input and output signals, we give each constraint norm and signal a colour, then iteratively
     propagate these colours through each other until the colours stabilise before passing the final classes, defined by the colours, to a SAT solver to
-    output the final mapping if equivalent or reason otherwise.
+    output the final mapping if equivalent or reason otherwise. The clauses are streamed into the solver as they are encoded.
 
     Parameters
     -----------
@@ -46,6 +62,32 @@ def circuit_equivalence(
             Initial precomputed partition of constraint norms for each circuit. Assumes same indexing as in_pair and correct partitioning. Default is None.
         fingerprints_to_signals: Dict[str, Dict[int, List[int]]] | None, optional
             Initial precomputed partition of signals for each circuit. Assumes same indexing as in_pair and correct partitioning. Default is None.
+        dimacs_file: str | None, optional
+            If not None, the encoded formula is also written to this location in DIMACS format for debugging. Default is None.
+        portfolio: bool | List[str], optional
+            If a list of pysat solver names, the formula is solved by racing these solvers in separate processes. If True, the solvers
+            are chosen by default_portfolio from the formula size. A portfolio formula is built in memory rather than streamed. Default is False.
+        symmetry_breaking: bool, optional
+            If True, lex-leader clauses are added for the automorphisms of the first circuit that preserve the fingerprint classes, see
+            symmetry_breaking_clauses. Adds "symmetry_generators" to test_data. Default is False.
+        explain_unsat: bool, optional
+            If True, the clauses of each class are guarded by a selector and, if unsatisfiable, a minimal set of classes whose clauses are
+            unsatisfiable is added to test_data as "unsat_core". Cannot be used with portfolio or symmetry_breaking. Default is False.
+        deadline: Deadline | None, optional
+            Checked between steps, each round of fingerprinting and each encoded class, and stops the solver by interrupt when expired.
+            Raises TimeoutException once expired. Unlike testing_harness.time_limit it uses no signals so works in any thread. Default is None.
+        budget: Budget | None, optional
+            Deterministic limits on the conflicts and propagations of the solve and the number of clauses, raising TimeoutException with
+            the limit hit once exceeded. The solver limits cannot be used with portfolio. Default is None.
+
+            CaDiCaL can neither be interrupted nor limited in propagations, so glucose4 is used if the deadline expires or the budget
+            limits propagations, see default_solver_name.
+        proof_prefix: str | None, optional
+            If not None and the formula is unsatisfiable, the formula with the assumptions as unit clauses and a DRAT proof of its 
+            unsatisfiability are written gzipped to proof_prefix + ".cnf.gz" and ".drat.gz" and added to test_data as "proof", see
+            comparison_v2.proofs.check_proof. A pair rejected by a differing count or invariant before solving has no proof, the
+            invariant is added to test_data as "certificate" instead, see compare_invariants. Cannot be used with portfolio, dimacs_file
+            or explain_unsat. Default is None.
     
     Return
     ---------
@@ -69,9 +111,97 @@ def circuit_equivalence(
     in_pair = [(names[0], S1), (names[1], S2)]
 
     connected_preprocessing_time = time.time()
-    last_time = connected_preprocessing_time
     test_data["timing"]["connected_preprocessing"] = connected_preprocessing_time - start
 
+    solver = None if portfolio else Solver(name=default_solver_name(deadline, budget), with_proof=proof_prefix is not None)
+    try:
+        _compare_preprocessed(in_pair, test_data, solver, start, debug=debug, fingerprints_to_normi=fingerprints_to_normi, 
+                              fingerprints_to_signals=fingerprints_to_signals, dimacs_file=dimacs_file, 
+                              portfolio=portfolio if type(portfolio) == list else None, symmetry_breaking=symmetry_breaking,
+                              explain_unsat=explain_unsat, deadline=deadline, budget=budget, proof_prefix=proof_prefix)
+    finally:
+        if solver is not None: solver.delete()
+
+    return test_data
+
+def _compare_preprocessed(
+        in_pair: List[Tuple[str, Circuit]],
+        test_data: Dict[str, any],
+        solver: Solver | None,
+        start: float,
+        debug: bool = False,
+        fingerprints_to_normi: Dict[str, Dict[int, List[int]]] | None = None,
+        fingerprints_to_signals: Dict[str, Dict[int, List[int]]] | None = None,
+        dimacs_file: str | None = None,
+        signal_to_normi: Dict[str, Dict[int, List[int]]] | None = None,
+        selector: int | None = None,
+        variable_offset: int = 0,
+        portfolio: List[str] | None = None,
+        symmetry_breaking: bool = False,
+        invariants: Dict[str, Dict[str, Hashable] | None] | None = None,
+        explain_unsat: bool = False,
+        unsat_patterns: List[Hashable] | None = None,
+        deadline: Deadline | None = None,
+        budget: Budget | None = None,
+        proof_prefix: str | None = None
+        ) -> Dict[str, any]:
+    """
+    The steps of circuit_equivalence following connected_preprocessing, seperated so that a ComparisonSession can reuse a preprocessed circuit
+    and solver over many comparisons.
+
+    Circuits that are already normalised are not normalised again. If signal_to_normi is given, any circuit with a non-None entry reuses it.
+    Likewise for invariants, which are compared before normalisation and fingerprinting to reject most non-equivalent pairs cheaply.
+
+    If unsat_patterns is given, any comparison whose classes contain one of the patterns is rejected after fingerprinting, and with
+    explain_unsat the pattern of each new unsatisfiable core is appended. The patterns depend on the indexing of the first circuit so
+    must only be shared between comparisons with the same first circuit.
+
+    If selector is not None every clause is guarded by the selector and the solver is called assuming the selector, so the clauses can be
+    disabled afterwards by the caller. The encoded variables start after variable_offset so they do not collide with those already in the solver.
+
+    Parameters
+    -----------
+        in_pair: List[Tuple[str, Circuit]]
+            Pair of (name, Circuit) tuples, after connected_preprocessing.
+        test_data: Dict[str, any]
+            Pointer to the json-like Dict object that will be returned. Assumed to be initialised by the caller.
+        solver: Solver | None
+            The instantiated solver the formula is streamed into. If None the formula is solved by a solver portfolio.
+        start: float
+            The time the comparison started, used for total_time.
+        signal_to_normi: Dict[str, Dict[int, List[int]]] | None, optional
+            Precomputed incidence map of signals to norms for either circuit. Default None.
+        selector: int | None, optional
+            Selector literal guarding every clause of the encoding. Default None.
+        variable_offset: int, optional
+            The largest variable already used in the solver. Default 0.
+        portfolio: List[str] | None, optional
+            If solver is None, the solvers to race. Default None, chosen by default_portfolio.
+        invariants: Dict[str, Dict[str, Hashable] | None] | None, optional
+            Precomputed circuit_invariants for either circuit. Default None.
+        unsat_patterns: List[Hashable] | None, optional
+            The core_patterns of earlier unsatisfiable comparisons with the same first circuit, extended in place. Default None.
+        
+        For other parameters see circuit_equivalence.
+    
+    Return
+    ---------
+    Dict[str, any]
+        test_data populated as in circuit_equivalence
+    """
+
+    names = [in_pair[0][0], in_pair[1][0]]
+    S1 = in_pair[0][1]
+    S2 = in_pair[1][1]
+    last_time = time.time()
+
+    if explain_unsat and (solver is None or symmetry_breaking):
+        raise ValueError("explain_unsat requires a single solver and no symmetry breaking")
+    if solver is None and budget is not None and budget.limits_solver():
+        raise ValueError("Conflict and propagation budgets require a single solver")
+    if proof_prefix is not None and (solver is None or selector is not None or explain_unsat or dimacs_file is not None):
+        raise ValueError("Proofs require a single non-incremental solver, and cannot be used with explain_unsat or dimacs_file")
+
     try: 
         N = S1.nConstraints
         K = S1.nWires
@@ -79,17 +209,34 @@ def circuit_equivalence(
         for lval, rval, val_name,  in [
             (S1.nWires, S2.nWires, "wires"), (S1.nConstraints, S2.nConstraints, "constraints"),(S1.nOutputs, S2.nOutputs, "output signals"), 
             (S1.nInputs, S2.nInputs, "input signals")]:
-            if lval != rval: raise AssertionError(f"Different number of {val_name} in circuits: S1 has {lval}, S2 has {rval}")
+            if lval != rval:
+                if proof_prefix is not None: test_data["certificate"] = {"invariant": f"number of {val_name}", names[0]: str(lval), names[1]: str(rval)}
+                raise AssertionError(f"Different number of {val_name} in circuits: S1 has {lval}, S2 has {rval}")
+
+        # in proof mode a rejection here is recorded as a certificate, as it has no proof
+        certificate_data = test_data if proof_prefix is not None else None
+
+        if invariants is None: invariants = {}
+        invariants = {name: invariants[name] if invariants.get(name, None) is not None else structural_invariants(circ) for name, circ in in_pair}
+        compare_invariants(names, invariants, certificate_data)
 
-        assumptions = set([])
-        formula = CNF()
+        for circ in [S1, S2]:
+            check_deadline(deadline)
+            if len(circ.normalised_constraints) == 0: circ.normalise_constraints()
 
-        S1.normalise_constraints()
-        S2.normalise_constraints()
+        for name, circ in in_pair:
+            if "normalised coefficients" not in invariants[name]: invariants[name] = {**invariants[name], **coefficient_invariants(circ)}
+        compare_invariants(names, invariants, certificate_data)
+
+        invariants_time = time.time()
+        test_data["timing"]["invariants"] = invariants_time - last_time
+        last_time = invariants_time
 
         # the norms for each constraint
         normi_to_coni = {name : circ.normi_to_coni for name, circ in in_pair}
-        signal_to_normi = {name: _signal_data_from_cons_list(circ.normalised_constraints) for name, circ in in_pair}
+        if signal_to_normi is None: signal_to_normi = {}
+        signal_to_normi = {name: signal_to_normi[name] if signal_to_normi.get(name, None) is not None else _signal_data_from_cons_list(circ.normalised_constraints) 
+                           for name, circ in in_pair}
 
         if len(S1.normalised_constraints) != len(S2.normalised_constraints):
             raise AssertionError(f"EE: Different number of normalised constraints, {names[0]} had {len(S1.normalised_constraints)} where {names[1]} had {len(S2.normalised_constraints)}")
@@ -108,7 +255,7 @@ def circuit_equivalence(
         # encode initial fingerprints but norms now have signal class in norm
         fingerprints_to_normi, fingerprints_to_signals, _, signal_to_fingerprints = back_and_forth_fingerprinting(
             names, in_pair, signal_to_normi, fingerprints_to_normi, fingerprints_to_signals, return_index_to_fingerprint=True,
-            test_data = test_data
+            test_data = test_data, deadline = deadline
         )
 
         early_exit(fingerprints_to_normi)
@@ -124,38 +271,98 @@ def circuit_equivalence(
                 "sizes": [x[0] for x in ints],
                 "counts": [x[1] for x in ints]
             }
-        # now do label passing for constraints
+        if unsat_patterns and any(matches_core_pattern(pattern, names, in_pair, fingerprints_to_normi, fingerprints_to_signals) for pattern in unsat_patterns):
+            raise AssertionError("EE: Classes contain a known unsatisfiable core")
 
-        formula, assumptions, norm_assignment, signal_assignment = encode_classes_v2(in_pair, fingerprints_to_normi, signal_to_fingerprints, fingerprints_to_signals)
+        # now do label passing for constraints
 
-        test_data["formula_size"] = len(formula.clauses)
-        solver = Solver(name='cadical195', bootstrap_with=formula)
+        if proof_prefix is not None: dimacs_file = f"{proof_prefix}.cnf"
+        formula = CNF() if solver is None else SolverSink(solver, dimacs_file=dimacs_file, selector=selector)
+        class_selectors = {} if explain_unsat else None
+
+        # the sink is closed even if encoding fails, so a DIMACS file is never left open with a blank header
+        try:
+            _, assumptions, norm_assignment, signal_assignment = encode_classes_v2(in_pair, fingerprints_to_normi, signal_to_fingerprints, fingerprints_to_signals, 
+                                                                                   formula=formula, variable_offset=variable_offset, class_selectors=class_selectors,
+                                                                                   deadline=deadline, budget=budget)
+
+            if symmetry_breaking:
+                symmetry_breaking_start = time.time()
+                symmetry_clauses, test_data["symmetry_generators"] = symmetry_breaking_clauses(
+                    names, in_pair, signal_to_normi, fingerprints_to_normi, fingerprints_to_signals, signal_assignment)
+                formula.extend(symmetry_clauses)
+                test_data["timing"]["symmetry_breaking"] = time.time() - symmetry_breaking_start
+
+            # the proof must refute the formula as written, so it cannot rely on assumptions
+            if solver is not None and proof_prefix is not None: formula.extend([lit] for lit in assumptions)
+        finally:
+            if solver is not None: formula.close()
+
+        if solver is None:
+            if dimacs_file is not None: formula.to_file(dimacs_file)
+            test_data["formula_size"] = len(formula.clauses)
+        else:
+            test_data["formula_size"] = formula.nclauses
+        check_budget_clauses(budget, formula)
 
         encoding_time = time.time()
 
         test_data["timing"]["encoding_time"] = encoding_time - last_time
 
-        result = solver.solve(assumptions)
+        check_deadline(deadline)
+        if deadline is None: deadline = Deadline()
+
+        if solver is None:
+            if portfolio is None: portfolio = default_portfolio(len(formula.clauses))
+            test_data["solver"], result, model = race_solvers(formula.clauses, portfolio, list(assumptions), timeout=deadline.remaining())
+            if test_data["solver"] is None: raise TimeoutException("Deadline expired while solving")
+        else:
+            fixed = [] if selector is None else [selector]
+            class_assumptions = [] if class_selectors is None else [lit for lit in class_selectors if lit not in assumptions]
+            solve_assumptions = [] if proof_prefix is not None else list(assumptions) + class_assumptions + fixed
+            if deadline.expires is None and (budget is None or not budget.limits_solver()): 
+                result = solver.solve(solve_assumptions)
+            else:
+                if budget is None: budget = Budget()
+                with deadline.interrupting(solver), budget.limiting(solver) as stats:
+                    result = solver.solve_limited(solve_assumptions, expect_interrupt=deadline.expires is not None)
+            if proof_prefix is not None:
+                proof_start = time.time()
+                test_data["proof"] = store_proof(proof_prefix, solver, result)
+                test_data["timing"]["proof_writing"] = time.time() - proof_start
+            if result is None:
+                limit = budget.limit_hit(solver, stats, deadline)
+                raise TimeoutException("Deadline expired while solving" if limit == "wall clock" else f"Budget of {limit} exhausted while solving", limit=limit)
+            model = solver.get_model() if result else None
         solving_time = time.time()
 
+        if explain_unsat and not result:
+            core = minimise_core(solver, solver.get_core(), class_selectors.keys(), fixed)
+            core_keys = {kind: [key for lit in core for lkind, key in [class_selectors[lit]] if lkind == kind] for kind in ["norm", "signal"]}
+            test_data["unsat_core"] = {
+                "norm_classes": [{name: fingerprints_to_normi[name][key] for name in names} for key in core_keys["norm"]],
+                "signal_classes": [{name: fingerprints_to_signals[name][key] for name in names} for key in core_keys["signal"]]
+            }
+
+            pattern = core_pattern(names, in_pair, core_keys["norm"], core_keys["signal"], fingerprints_to_normi, fingerprints_to_signals)
+            if unsat_patterns is not None and pattern is not None and pattern not in unsat_patterns: unsat_patterns.append(pattern)
+            test_data["timing"]["unsat_core"] = time.time() - solving_time
+
         if result:
-            # TODO: make faster (have each Assignment keep track of its variables)
-            model = solver.get_model()    
-            norm_vals = { val : True for val in norm_assignment.has_assigned}
-            signal_vals = { val : True for val in signal_assignment.has_assigned}
+            model_norm_pairs, model_signal_pairs = decode_model(model, [norm_assignment, signal_assignment])
 
             norm_pairs = list(itertools.chain( 
                     # norm pairs from uniquely identified norms
                 map(lambda key : (fingerprints_to_normi[names[0]][key][0], fingerprints_to_normi[names[1]][key][0]), filter(lambda key : len(fingerprints_to_normi[names[0]][key]) == 1, fingerprints_to_normi[names[0]].keys()))
                 , # norm pairs from SAT solver
-                map(norm_assignment.get_inv_assignment, filter(lambda lit : norm_vals.setdefault(lit, False), filter(lambda x : x > 0, model))) 
+                model_norm_pairs
             ))
 
             signal_pairs = list(itertools.chain(
                 # from assumptions
                 map(signal_assignment.get_inv_assignment, filter(lambda x : x > 0, assumptions))
                 , # from SAT solver
-                map(signal_assignment.get_inv_assignment, filter(lambda lit : signal_vals.setdefault(lit, False), filter(lambda x : x > 0, model)))
+                model_signal_pairs
             ))
             coni_pairs = list(set(map(lambda pair : tuple(normi_to_coni[names[i]][pair[i]] for i in range(2)), norm_pairs)))
 
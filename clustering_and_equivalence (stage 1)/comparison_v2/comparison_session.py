@@ -0,0 +1,171 @@
+"""
+Representative-centric comparison session, for comparing many candidate circuits against the same circuit
+"""
+
+from typing import Tuple, List, Dict, Hashable
+from pysat.solvers import Solver
+import time
+
+from circuits_and_constraints.abstract_circuit import Circuit
+
+from utilities.utilities import _signal_data_from_cons_list
+from structural_analysis.utilities.connected_preprocessing import connected_preprocessing
+
+from comparison_v2.compare_circuits_v2 import _compare_preprocessed
+from comparison_v2.prescreen import circuit_invariants
+from utilities.deadline import Deadline
+from utilities.budget import Budget, default_solver_name
+
+class ComparisonSession():
+    """
+    Compares candidate circuits against a fixed representative circuit, reusing work between comparisons.
+
+    The connected_preprocessing, normalised constraints, invariants and signal to norm incidence map of the representative are computed
+    once on construction. The fingerprinting is a joint refinement of both circuits so is still done for each comparison.
+
+    If incremental, all comparisons share a single incremental solver: each comparison's clauses are guarded by a fresh selector
+    literal that is assumed while solving and asserted false afterwards, so earlier candidates never constrain later ones. Each
+    comparison encodes with variables above those already in the solver. The pair variables are specific to each candidate so
+    nothing learnt carries over, and the guarded clauses are slower to solve than a fresh solver (notably for CaDiCaL), hence
+    by default each comparison uses a new solver.
+
+    Attributes
+    -----------
+        name: str
+            The name of the representative, must be the first name of each compared pair
+        circ: Circuit
+            The representative after connected_preprocessing, with normalised constraints
+        signal_to_normi: Dict[int, List[int]]
+            The incidence map from the representative signals to norms
+        invariants: Dict[str, Hashable]
+            The circuit_invariants of the representative
+        solver_name: str | None
+            The name of the pysat solver used, None if chosen for each comparison by default_solver_name
+        incremental: bool
+            Whether the comparisons share a single solver
+        solver: Solver | None
+            The incremental solver shared by all comparisons, None if not incremental
+        top: int
+            The largest variable used in the solver so far
+        ncomparisons: int
+            The number of comparisons made with the session
+        unsat_patterns: List[Hashable]
+            The core_patterns of the unsatisfiable comparisons explained so far, later candidates containing one are rejected without solving
+    """
+
+    def __init__(self, name: str, circ: Circuit, solver_name: str | None = None, incremental: bool = False, preprocessed: bool = False):
+        """
+        Constructor for ComparisonSession
+
+        Parameters
+        -----------
+            name: str
+                The name of the representative circuit
+            circ: Circuit
+                The representative circuit
+            solver_name: str | None
+                The name of the pysat solver to use, must support assumptions, and interrupts if compared with a deadline. If None each
+                comparison uses default_solver_name of its deadline and budget, and an incremental session, which may be compared with
+                any deadline, uses glucose4. Default None
+            incremental: bool
+                Flag for whether to use a single incremental solver for all comparisons. Default False
+            preprocessed: bool
+                Flag for whether circ has already had connected_preprocessing applied. Default False
+        """
+        self.name = name
+        self.circ = circ if preprocessed else connected_preprocessing(circ)
+        if len(self.circ.normalised_constraints) == 0: self.circ.normalise_constraints()
+        self.signal_to_normi = _signal_data_from_cons_list(self.circ.normalised_constraints)
+        self.invariants = circuit_invariants(self.circ)
+
+        self.solver_name = solver_name
+        self.incremental = incremental
+        self.solver = Solver(name=solver_name if solver_name is not None else 'glucose4') if incremental else None
+        self.top = 0
+        self.ncomparisons = 0
+        self.unsat_patterns = []
+
+    def compare(
+            self,
+            in_pair: List[Tuple[str, Circuit]],
+            test_data: Dict[str, any] = {},
+            debug: bool = False,
+            fingerprints_to_normi: Dict[str, Dict[int, List[int]]] | None = None,
+            fingerprints_to_signals: Dict[str, Dict[int, List[int]]] | None = None,
+            dimacs_file: str | None = None,
+            preprocessed: bool = False,
+            invariants: Dict[str, Hashable] | None = None,
+            explain_unsat: bool = False,
+            deadline: Deadline | None = None,
+            budget: Budget | None = None,
+            proof_prefix: str | None = None
+        ) -> Dict[str, any]:
+        """
+        Drop-in replacement for circuit_equivalence where the first circuit of the pair is the representative.
+
+        Parameters
+        -----------
+            in_pair: List[Tuple[str, Circuit]]
+                Pair of (name, Circuit) tuples. The first name must be the session name, the session circuit is used in place of its circuit.
+            preprocessed: bool, optional
+                Flag for whether the candidate circuit has already had connected_preprocessing applied. Default False.
+            invariants: Dict[str, Hashable] | None, optional
+                Precomputed circuit_invariants of the preprocessed candidate circuit. Default None.
+            explain_unsat: bool, optional
+                Flag for whether to find the unsatisfiable core of the comparison, and add its pattern to unsat_patterns. Default False.
+            budget: Budget | None, optional
+                As in circuit_equivalence, but a deadline or propagation budget requires a session solver_name other than CaDiCaL.
+                Default None.
+            proof_prefix: str | None, optional
+                As in circuit_equivalence, only for sessions that are not incremental. Default None.
+
+            For other parameters see circuit_equivalence.
+
+        Return
+        ---------
+        Dict[str, any]
+            test_data populated as in circuit_equivalence
+        """
+
+        if in_pair[0][0] != self.name:
+            raise ValueError(f"Session for {self.name} cannot compare {in_pair[0][0]}")
+
+        names = [in_pair[0][0], in_pair[1][0]]
+
+        for key, init in [("result", None), ("timing", {}), ("result_explanation", None), ("formula_size", None), ("group_sizes", {})]:
+            test_data[key] = init
+
+        start = time.time()
+
+        candidate = in_pair[1][1] if preprocessed else connected_preprocessing(in_pair[1][1])
+        test_data["timing"]["connected_preprocessing"] = time.time() - start
+
+        in_pair = [(names[0], self.circ), (names[1], candidate)]
+        kwargs = {"debug": debug, "fingerprints_to_normi": fingerprints_to_normi, "fingerprints_to_signals": fingerprints_to_signals, 
+                  "dimacs_file": dimacs_file, "signal_to_normi": {names[0]: self.signal_to_normi}, 
+                  "invariants": {names[0]: self.invariants, names[1]: invariants}, "explain_unsat": explain_unsat,
+                  "unsat_patterns": self.unsat_patterns, "deadline": deadline, "budget": budget, "proof_prefix": proof_prefix}
+        self.ncomparisons += 1
+
+        if not self.incremental:
+            solver_name = self.solver_name if self.solver_name is not None else default_solver_name(deadline, budget)
+            solver = Solver(name=solver_name, with_proof=proof_prefix is not None)
+            try:
+                _compare_preprocessed(in_pair, test_data, solver, start, **kwargs)
+            finally:
+                solver.delete()
+            return test_data
+
+        selector = self.top + 1
+        try:
+            _compare_preprocessed(in_pair, test_data, self.solver, start, selector=selector, variable_offset=selector, **kwargs)
+        finally:
+            # permanently disables every clause of this comparison
+            self.solver.add_clause([-selector])
+            self.top = max(selector, self.solver.nof_vars())
+
+        return test_data
+
+    def delete(self) -> None:
+        "Frees the solver of the session"
+        if self.solver is not None: self.solver.delete()
@@ -2,17 +2,24 @@
 Methods for encoding classes as defined by fingerprints into a SAT/ MaxSAT formula
 """
 
-from typing import Dict, List, Tuple, Set
+from typing import Dict, List, Tuple, Set, Hashable
 from pysat.formula import CNF, WCNF
-from pysat.pb import PBEnc, EncType
 from functools import reduce
 import itertools
+import math
 
 from circuits_and_constraints.abstract_circuit import Circuit
 from circuits_and_constraints.abstract_constraint import Constraint
 from circuits_and_constraints.r1cs.r1cs_constraint import R1CSConstraint
 
 from utilities.assignment import Assignment
+from utilities.deadline import Deadline, check_deadline
+from utilities.budget import Budget, check_budget_clauses
+from comparison_v2.clause_sink import SolverSink
+
+# size thresholds for the at-most-one encodings in at_most_one_clauses
+AMO_PAIRWISE_LIMIT = 4
+AMO_NESTED_LIMIT = 24
 
 def encode_classes_v2(
         in_pair: List[Tuple[str, Circuit]],
@@ -20,7 +27,12 @@ def encode_classes_v2(
         signal_to_fingerprint: Dict[str, List[int]],
         fingerprint_to_signals: Dict[str, Dict[int, List[int]]],
         weighted_cnf: bool = False,
-    ) -> Tuple[CNF | WCNF, Set[int], Assignment, Assignment]:
+        formula: CNF | WCNF | SolverSink | None = None,
+        variable_offset: int = 0,
+        class_selectors: Dict[int, Tuple[str, Hashable]] | None = None,
+        deadline: Deadline | None = None,
+        budget: Budget | None = None
+    ) -> Tuple[CNF | WCNF | SolverSink, Set[int], Assignment, Assignment]:
     """
     Top-level encoder for constraint & signals classes intor a SAT/MaxSAT Formula.
 
@@ -31,6 +43,8 @@ def encode_classes_v2(
     If weighted_cnf is True, the implication constraints are treated as hard, as they are rules that must be obeyed. All cardinality constraints are labeled
     soft with 1 weights, hence the MaxSAT encodings is attempting to maximise the number of constraint + signals that are deemed equivalent.
 
+    If a formula is given the clauses are added to it, this can be a SolverSink to stream the clauses directly into a solver.
+
     Parameters
     -----------
         names: List[str]
@@ -45,22 +59,45 @@ def encode_classes_v2(
             For each circuit, the partition of signals into classes, indexed by the encoded fingerprint label. Assumed to be consistent with fingerprint_to_signals.
         weighted_cnf: bool, optional
             Flag for whether We are encoding for a SAT or MaxSAT problem. Default False.
+        formula: CNF | WCNF | SolverSink | None, optional
+            Formula to extend with the encoding. If None a new CNF/WCNF is made. A SolverSink cannot hold weighted clauses. Default None.
+        variable_offset: int, optional
+            All variables of the encoding are greater than variable_offset. Used when the formula already contains variables. Default 0.
+        class_selectors: Dict[int, Tuple[str, Hashable]] | None, optional
+            If not None, the clauses of each class are guarded by a new selector variable so that an unsatisfiable core can be given in
+            terms of classes. Each selector, and the assumption of each singular signal class, is added to class_selectors mapped to 
+            ("norm" | "signal", fingerprint). The selectors are not added to the assumptions. Requires formula to be a SolverSink. Default None.
+        deadline: Deadline | None, optional
+            Checked before encoding each class of size > 1 and each norm of a norm class, raising TimeoutException once expired. Default None.
+        budget: Budget | None, optional
+            If not None, the number of clauses is checked against the budget before encoding each class of size > 1, raising 
+            TimeoutException once exceeded. Default None.
     
     Return
     ---------
-    Tuple[CNF | WCNF, Set[int], Assignment, Assignment]
-        Returns the calculated formula, the set of literal assumptions (empty is MaxSAT), and the Assignment encoder for norm and signal pairs.
+    Tuple[CNF | WCNF | SolverSink, Set[int], Assignment, Assignment]
+        Returns the calculated formula (or the given formula), the set of literal assumptions (empty is MaxSAT), and the Assignment encoder for norm and signal pairs.
     """
 
     names = [in_pair[0][0], in_pair[1][0]]
 
     # encode classes
 
-    formula = WCNF() if weighted_cnf else CNF()
+    if formula is None: formula = WCNF() if weighted_cnf else CNF()
+    elif weighted_cnf and type(formula) == SolverSink:
+        raise ValueError("Cannot stream a weighted formula into a SolverSink")
+    if class_selectors is not None and type(formula) != SolverSink:
+        raise ValueError("Class selectors require a SolverSink")
+
     assumptions = set([])
 
-    norm_pair_encoder   = Assignment(assignees=2)
-    signal_pair_encoder = Assignment(assignees=2, link=norm_pair_encoder)
+    norm_pair_encoder   = Assignment(assignees=2, offset=variable_offset)
+    signal_pair_encoder = Assignment(assignees=2, link=norm_pair_encoder, offset=variable_offset)
+
+    def _guard_class(kind: str, key: Hashable) -> None:
+        if class_selectors is None: return
+        formula.class_selector = norm_pair_encoder.get_auxiliary()[0]
+        class_selectors[formula.class_selector] = (kind, key)
 
     in_both_keys = set(fingerprint_to_normi[names[0]].keys()).intersection(fingerprint_to_normi[names[1]].keys())
 
@@ -95,13 +132,17 @@ def encode_classes_v2(
                 is_singular_class = not weighted_cnf
             )
 
+            _guard_class("norm", key)
             formula.extend(viable_pairs)
 
     # Add clauses for classes of size > 1
     for key in nonsingular_classes:
+        check_deadline(deadline)
+        check_budget_clauses(budget, formula)
+        _guard_class("norm", key)
         encode_single_norm_class(
             names, in_pair , {name: fingerprint_to_normi[name][key] for name in names}, norm_pair_encoder,
-            signal_pair_encoder, signal_to_fingerprint, fingerprint_to_signals, formula, weighted_cnf = weighted_cnf
+            signal_pair_encoder, signal_to_fingerprint, fingerprint_to_signals, formula, weighted_cnf = weighted_cnf, deadline = deadline
         )
 
     # Add bijection clauses for all signals
@@ -111,8 +152,14 @@ def encode_classes_v2(
             literal = signal_pair_encoder.get_assignment(fingerprint_to_signals[names[0]][key][0], fingerprint_to_signals[names[1]][key][0])
             if weighted_cnf: formula.append([literal])
             else: assumptions.add(literal)
+            if class_selectors is not None: class_selectors[literal] = ("signal", key)
         else:
+            check_deadline(deadline)
+            check_budget_clauses(budget, formula)
+            _guard_class("signal", key)
             encode_single_signal_class([fingerprint_to_signals[name][key] for name in names], signal_pair_encoder, formula, weighted_cnf = weighted_cnf)
+
+    if class_selectors is not None: formula.class_selector = None
     
     return formula, assumptions, norm_pair_encoder, signal_pair_encoder
 
@@ -125,7 +172,8 @@ def encode_single_norm_class(
         signal_to_fingerprint: Dict[str, List[int]],
         fingerprint_to_signals: Dict[str, Dict[int, List[int]]],
         formula: WCNF | CNF,
-        weighted_cnf: bool = False
+        weighted_cnf: bool = False,
+        deadline: Deadline | None = None
     ):
     """
     SAT encoder for a single norm-class
@@ -154,6 +202,8 @@ def encode_single_norm_class(
             SAT/MaxSAT formula to be extended
         weighted_cnf: bool
             Flag for whether We are encoding for a SAT or MaxSAT problem. Default False.
+        deadline: Deadline | None
+            Checked before encoding each norm in the 'left' circuit. Default None.
     
     Return
     ---------
@@ -165,6 +215,7 @@ def encode_single_norm_class(
 
     # for each norm pair we isolate the restriction clauses and add a if_pair -> clauses set to the clauses
     for normi in class_[names[0]]:
+        check_deadline(deadline)
 
         normi_options = []
 
@@ -193,8 +244,9 @@ def encode_single_signal_class(signals: List[List[int]], signal_pair_encoder: As
     """
     Encodes a mutual exclusion constraint among pairs of signals into a CNF or WCNF formula.
 
-    This encodes the bijection between the two sets of signals. The function uses pseudo-Boolean constraints (at most one) and
-    encodes them into CNF or weighted CNF format.
+    This encodes the bijection between the two sets of signals. The pair variables for the class form a single matrix, rows
+    are signals in the left circuit and columns are signals in the right circuit, and each row and column is given an
+    exactly-one constraint.
 
     Parameters
     -----------
@@ -218,33 +270,64 @@ def encode_single_signal_class(signals: List[List[int]], signal_pair_encoder: As
 
     Notes
     -----------
-    - Uses `PBEnc.atmost` from the PySAT library to create at-most-one constraints.
-    - Auxiliary variables introduced during encoding are re-mapped to avoid clashes.
+    - The at-most-one constraints are encoded natively by :func:`at_most_one_clauses`, each pair variable is shared by
+      the row and column constraint it is in.
+    - Auxiliary variables are reserved from signal_pair_encoder so never clash with pair variables.
     """
-    # Adaptation of red_pseudoboolean_encoding to new class system
-    sign = lambda x: -1 if x < 0 else 1
 
-    for index in range(2):
-        for signal in signals[index]:
+    matrix = [[signal_pair_encoder.get_assignment(lsignal, rsignal) for rsignal in signals[1]] for lsignal in signals[0]]
 
-            sat_variables = list(map(lambda osignal: signal_pair_encoder.get_assignment(*((signal, osignal) if not index else (osignal, signal))), signals[1-index]))
+    for sat_variables in itertools.chain(matrix, map(list, zip(*matrix))):
+        formula.append(sat_variables, *([1] if weighted_cnf else []))
+        formula.extend(at_most_one_clauses(sat_variables, signal_pair_encoder))
 
-            atleast_clause = sat_variables
-            atmost_clauses = PBEnc.atmost(
-                lits = sat_variables,
-                bound = 1,
-                encoding = EncType.best
-            ).clauses
+def at_most_one_clauses(literals: List[int], variable_encoder: Assignment) -> List[List[int]]:
+    """
+    Native at-most-one encoding of a list of literals.
 
-            maxval = max(sat_variables)
+    Encodings are chosen by size to minimise the number of clauses, all of them are constructed directly without a PySAT round-trip:
+        - at most AMO_PAIRWISE_LIMIT literals use the pairwise encoding and no auxiliary variables.
+        - at most AMO_NESTED_LIMIT literals use the nested encoding, each auxiliary variable y commands a block of three literals
+          with AMO(x1, x2, x3, y) and AMO(-y, x4, ...) encoded recursively. This is 3n-6 clauses.
+        - larger lists use the product encoding of Chen, the literals are placed in a p x q grid, p ~ sqrt(n), and each literal implies
+          its row and column variable. At most one row and at most one column variable are then encoded recursively. This is 
+          2n + O(sqrt(n)) clauses.
 
-            # PBEnc adds new variables which might already be used, they will always be bigger than the largest introduced variable
-            aux_variable_reencoding = Assignment(assignees=1, link = signal_pair_encoder)
-            
-            formula.append(atleast_clause, *([1] if weighted_cnf else []))
-            formula.extend(map(
-                lambda clause : list(map(lambda x : x if abs(x) <= maxval else sign(x) * aux_variable_reencoding.get_assignment(abs(x)),
-                                    clause)),
-                atmost_clauses,
-            )) # weights if appropriate
-        
+    Parameters
+    -----------
+        literals: List[int]
+            The literals of which at most one can be true.
+        variable_encoder: Assignment
+            The encoder from which auxiliary variables are reserved.
+
+    Returns
+    -----------
+    List[List[int]]
+        The at-most-one clauses
+    """
+
+    pairwise = lambda lits : [[-l, -r] for l, r in itertools.combinations(lits, 2)]
+
+    if len(literals) <= AMO_NESTED_LIMIT:
+        clauses = []
+
+        while len(literals) > AMO_PAIRWISE_LIMIT:
+            commander = variable_encoder.get_auxiliary()[0]
+            clauses.extend(pairwise(literals[:AMO_PAIRWISE_LIMIT-1] + [commander]))
+            literals = [-commander] + literals[AMO_PAIRWISE_LIMIT-1:]
+
+        clauses.extend(pairwise(literals))
+        return clauses
+
+    ncols = math.isqrt(len(literals) - 1) + 1
+    nrows = (len(literals) + ncols - 1) // ncols
+
+    rows, cols = list(variable_encoder.get_auxiliary(nrows)), list(variable_encoder.get_auxiliary(ncols))
+
+    clauses = list(itertools.chain.from_iterable(
+        ([-lit, rows[i // ncols]], [-lit, cols[i % ncols]]) for i, lit in enumerate(literals)
+    ))
+    clauses.extend(at_most_one_clauses(rows, variable_encoder))
+    clauses.extend(at_most_one_clauses(cols, variable_encoder))
+
+    return clauses
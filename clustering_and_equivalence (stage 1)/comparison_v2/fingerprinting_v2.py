@@ -11,6 +11,7 @@ from circuits_and_constraints.abstract_constraint import Constraint
 
 from utilities.assignment import Assignment
 from utilities.utilities import count_ints
+from utilities.deadline import Deadline, check_deadline
 
 def _key_is_unique(key, name, names, label_to_indices, strict: bool) -> bool:
     if strict:
@@ -80,6 +81,7 @@ def back_and_forth_fingerprinting(
             strict_unique: bool = False,
             test_data: dict | None = None,
             constraints_to_fingerprint: Dict[str, List[Constraint]] | None = None,
+            deadline: Deadline | None = None,
         ):
     """
     Executes the back-and-forth fingerprinting algorithm for matching equivalent circuit structures.
@@ -109,6 +111,8 @@ def back_and_forth_fingerprinting(
         Whether to return mapping from indices to fingerprint keys.
     test_data : Optional[Dict], optional
         Container for storing test/benchmarking data.
+    deadline : Optional[Deadline], optional
+        Checked at the start of each round, raising TimeoutException once expired.
 
     Returns
     -------
@@ -164,6 +168,7 @@ def back_and_forth_fingerprinting(
     round_num = 0
     while not ( all(map(lambda iterable: len(iterable) == 0, norms_to_update.values())) and all(map(lambda iterable: len(iterable) == 0, signals_to_update.values())) ):        
         # things to update in the next update
+        check_deadline(deadline)
 
         # print(round_num, fingerprint_mode)
 
@@ -0,0 +1,99 @@
+"""
+Cheap invariants of circuits that are equal for equivalent circuits, used to reject non-equivalent pairs before fingerprinting
+"""
+
+from typing import List, Dict, Hashable
+from collections import Counter
+import hashlib
+
+from circuits_and_constraints.abstract_circuit import Circuit
+
+from utilities.utilities import _signal_data_from_cons_list
+
+def _histogram(values) -> Hashable:
+    return tuple(sorted(Counter(values).items()))
+
+def structural_invariants(circ: Circuit) -> Dict[str, Hashable]:
+    """
+    Invariants of the constraints of a circuit that do not need normalisation, computed in O(m).
+
+    Each is unchanged by renaming signals, reordering constraints and multiplying constraints by constants.
+
+    Parameters
+    -----------
+        circ: Circuit
+            The circuit
+
+    Return
+    ---------
+    Dict[str, Hashable]
+        The number of nonlinear constraints, the histogram of constraint term counts, and the histogram of signal degrees in
+        the signal-constraint incidence graph. Signal degrees are separated by whether the signal is an output, input or neither.
+    """
+    signal_to_coni = _signal_data_from_cons_list(circ.constraints)
+    signal_type = lambda sig : 1 if circ.signal_is_output(sig) else 2 if circ.signal_is_input(sig) else 3
+
+    return {
+        "nonlinear constraints": sum(map(lambda con : con.is_nonlinear(), circ.constraints)),
+        "constraint term counts": _histogram(map(lambda con : con.term_counts(), circ.constraints)),
+        "signal degrees": _histogram(map(lambda sig : (signal_type(sig), len(signal_to_coni.get(sig, []))), circ.get_signals()))
+    }
+
+def coefficient_invariants(circ: Circuit) -> Dict[str, Hashable]:
+    """
+    Hash of the multiset of normalised constraint coefficients, computed in O(m log m). Assumes circ is normalised.
+
+    Parameters
+    -----------
+        circ: Circuit
+            The normalised circuit
+
+    Return
+    ---------
+    Dict[str, Hashable]
+        The sha256 hex digest of the sorted coefficients of each norm
+    """
+    return {"normalised coefficients": hashlib.sha256(repr(_histogram(map(lambda norm : norm.get_coefficients(), circ.normalised_constraints))).encode()).hexdigest()}
+
+def circuit_invariants(circ: Circuit) -> Dict[str, Hashable]:
+    """
+    All invariants of a circuit, for caching when the circuit is compared many times. Normalises the circuit if not already normalised.
+
+    Parameters
+    -----------
+        circ: Circuit
+            The circuit
+
+    Return
+    ---------
+    Dict[str, Hashable]
+        The structural_invariants and coefficient_invariants of circ
+    """
+    if len(circ.normalised_constraints) == 0: circ.normalise_constraints()
+    return {**structural_invariants(circ), **coefficient_invariants(circ)}
+
+def compare_invariants(names: List[str], invariants: Dict[str, Dict[str, Hashable]], test_data: Dict[str, any] | None = None) -> None:
+    """
+    Compares the invariants both circuits have, in the order of the first circuit.
+
+    Parameters
+    -----------
+        names: List[str]
+            The names of the two circuits
+        invariants: Dict[str, Dict[str, Hashable]]
+            The invariants of each circuit
+        test_data: Dict[str, any] | None
+            If not None, a differing invariant is recorded in test_data as "certificate", the evidence of non-equivalence in place of a
+            proof, with the name of the invariant as "invariant" and the value of each circuit as a string under its name. Default None
+
+    Raises
+    ---------
+    AssertionError
+        An invariant differs, hence the circuits are not equivalent
+    """
+    for key, lval in invariants[names[0]].items():
+        if key not in invariants[names[1]]: continue
+        rval = invariants[names[1]][key]
+        if lval != rval:
+            if test_data is not None: test_data["certificate"] = {"invariant": key, names[0]: str(lval), names[1]: str(rval)}
+            raise AssertionError(f"EE: Different {key}, {names[0]} had {lval} where {names[1]} had {rval}")
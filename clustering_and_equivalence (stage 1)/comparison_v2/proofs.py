@@ -0,0 +1,230 @@
+"""
+DRAT proofs of unsatisfiable comparisons, so that non-equivalence verdicts can be audited independently of the solver.
+
+The formula and the proof of an unsatisfiable comparison are stored gzipped next to each other and checked in a separate pass by
+drat-trim if available, or otherwise by a bundled checker that is only practical for small proofs.
+"""
+
+from typing import List, Dict, Iterable, Iterator, Tuple, TextIO
+from collections import defaultdict
+from pysat.solvers import Solver
+import gzip
+import itertools
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+DRAT_TRIM = "drat-trim"
+
+def _open(path: str) -> TextIO:
+    return gzip.open(path, "rt") if path.endswith(".gz") else open(path, "r")
+
+def store_proof(prefix: str, solver: Solver, result: bool | None) -> Dict[str, str] | None:
+    """
+    Called after solving the formula written to f"{prefix}.cnf" with a solver made with_proof. If the formula is unsatisfiable the
+    formula is compressed and the proof written next to it, otherwise the formula is removed.
+
+    Parameters
+    -----------
+        prefix: str
+            The location of the formula without the .cnf extension
+        solver: Solver
+            The solver, after solving
+        result: bool | None
+            The result of solving
+
+    Return
+    ---------
+    Dict[str, str] | None
+        The "formula" and "proof" files if unsatisfiable, else None
+    """
+    if result is not False:
+        os.remove(f"{prefix}.cnf")
+        return None
+
+    with open(f"{prefix}.cnf", "rb") as fin, gzip.open(f"{prefix}.cnf.gz", "wb") as fout: shutil.copyfileobj(fin, fout)
+    os.remove(f"{prefix}.cnf")
+
+    with gzip.open(f"{prefix}.drat.gz", "wt") as f:
+        f.writelines(line + "\n" for line in solver.get_proof())
+
+    return {"formula": f"{prefix}.cnf.gz", "proof": f"{prefix}.drat.gz"}
+
+def read_dimacs(path: str) -> List[List[int]]:
+    "The clauses of a DIMACS file, which may be gzipped"
+    with _open(path) as f:
+        literals = [int(lit) for line in f if not line.startswith(("p", "c")) for lit in line.split()]
+
+    clauses, clause = [], []
+    for lit in literals:
+        if lit == 0: clauses.append(clause); clause = []
+        else: clause.append(lit)
+    return clauses
+
+def read_drat(path: str) -> Iterator[Tuple[bool, List[int]]]:
+    "The (is deletion, clause) steps of a text DRAT proof, which may be gzipped"
+    with _open(path) as f:
+        for line in f:
+            tokens = line.split()
+            if len(tokens) == 0 or tokens[0] == "c": continue
+            if tokens[0] == "d": yield True, list(map(int, tokens[1:-1]))
+            else: yield False, list(map(int, tokens[:-1]))
+
+class _ClauseDatabase():
+    "The active clauses of a proof being checked, with two watched literals per clause for unit propagation"
+
+    def __init__(self, clauses: Iterable[List[int]]):
+        self.clauses: Dict[int, List[int]] = {}
+        self.ids: Dict[Tuple[int], List[int]] = defaultdict(list)
+        self.watches: Dict[int, List[int]] = defaultdict(list)
+        self.units: Dict[int, int] = {}
+        self.has_empty = False
+        self.next_id = 0
+        for clause in clauses: self.add(clause)
+
+    def add(self, clause: List[int]) -> None:
+        clause = list(dict.fromkeys(clause))
+        if len(clause) == 0: self.has_empty = True; return
+
+        id_ = self.next_id
+        self.next_id += 1
+        self.clauses[id_] = clause
+        self.ids[tuple(sorted(clause))].append(id_)
+        if len(clause) == 1: self.units[id_] = clause[0]
+        else: self.watches[clause[0]].append(id_); self.watches[clause[1]].append(id_)
+
+    def delete(self, clause: List[int]) -> None:
+        # as in drat-trim, deletions of units and of clauses unit under top level propagation, which the reasons of top level units
+        # are, are ignored since solvers delete clauses satisfied at the top level without deleting the units propagated from them
+        ids = self.ids.get(tuple(sorted(set(clause))), [])
+        if len(ids) == 0 or len(self.clauses[ids[-1]]) == 1: return
+        assignment = self.propagate([])
+        values = [None if assignment is None or abs(lit) not in assignment else assignment[abs(lit)] == (lit > 0) for lit in clause]
+        if values.count(True) == 1 and values.count(False) == len(values) - 1: return
+        id_ = ids.pop()
+        clause = self.clauses.pop(id_)
+        self.watches[clause[0]].remove(id_); self.watches[clause[1]].remove(id_)
+
+    def is_rup(self, clause: List[int]) -> bool:
+        "Whether unit propagation of the negation of clause reaches a conflict"
+        return self.propagate([-lit for lit in clause]) is None
+
+    def propagate(self, assumptions: List[int]) -> Dict[int, bool] | None:
+        "The assignment of unit propagation of the assumptions and the units, None if it reaches a conflict"
+        assignment = {}
+        value = lambda lit : None if abs(lit) not in assignment else assignment[abs(lit)] == (lit > 0)
+        trail = []
+
+        def assign(lit: int) -> bool:
+            if abs(lit) in assignment: return value(lit)
+            assignment[abs(lit)] = lit > 0
+            trail.append(lit)
+            return True
+
+        for lit in itertools.chain(assumptions, self.units.values()):
+            if not assign(lit): return None
+
+        i = 0
+        while i < len(trail):
+            false_lit = -trail[i]
+            i += 1
+            watchers = self.watches[false_lit]
+            j = 0
+            while j < len(watchers):
+                watched = self.clauses[watchers[j]]
+                if watched[0] == false_lit: watched[0], watched[1] = watched[1], watched[0]
+                if value(watched[0]) == True: j += 1; continue
+
+                for k in range(2, len(watched)):
+                    if value(watched[k]) != False:
+                        watched[1], watched[k] = watched[k], watched[1]
+                        self.watches[watched[1]].append(watchers[j])
+                        watchers[j] = watchers[-1]
+                        watchers.pop()
+                        break
+                else:
+                    if not assign(watched[0]): return None
+                    j += 1
+
+        return assignment
+
+    def is_rat(self, clause: List[int]) -> bool:
+        "Whether clause is a resolution asymmetric tautology on its first literal"
+        if len(clause) == 0: return False
+        pivot = clause[0]
+        return all(self.is_rup(clause + [lit for lit in other if lit != -pivot]) for other in list(self.clauses.values()) if -pivot in other)
+
+def check_drat(clauses: Iterable[List[int]], proof: Iterable[Tuple[bool, List[int]]]) -> bool:
+    """
+    Bundled forward DRAT checker, checks each lemma of the proof in order by unit propagation over all active clauses.
+
+    Unlike drat-trim it does not trim the proof and propagates from scratch for every lemma, so is only practical for small proofs.
+
+    Parameters
+    -----------
+        clauses: Iterable[List[int]]
+            The clauses of the formula
+        proof: Iterable[Tuple[bool, List[int]]]
+            The (is deletion, clause) steps of the proof, as read by read_drat
+
+    Return
+    ---------
+    bool
+        Whether every lemma is RUP or RAT and the formula with the lemmas derives the empty clause
+    """
+    database = _ClauseDatabase(clauses)
+    if database.has_empty: return True
+
+    for is_deletion, clause in proof:
+        if is_deletion:
+            database.delete(clause)
+            continue
+        if not (database.is_rup(clause) or database.is_rat(clause)): return False
+        if len(clause) == 0: return True
+        database.add(clause)
+
+    return database.is_rup([])
+
+def check_proof(formula_file: str, proof_file: str, checker: str | None = DRAT_TRIM, timeout: float | None = None) -> Dict[str, any]:
+    """
+    Checks that the proof refutes the formula, with the external checker if it is on the PATH and otherwise with check_drat.
+
+    Parameters
+    -----------
+        formula_file: str
+            The DIMACS formula, which may be gzipped
+        proof_file: str
+            The text DRAT proof, which may be gzipped
+        checker: str | None
+            The drat-trim executable, or None to always use check_drat. Default DRAT_TRIM
+        timeout: float | None
+            Seconds after which the external checker is stopped, None for no limit. Default None
+
+    Return
+    ---------
+    Dict[str, any]
+        "checker", the checker used, "verified", whether the proof was verified (None if the checker timed out), and "time"
+    """
+    start = time.time()
+    executable = None if checker is None else shutil.which(checker)
+
+    if executable is None:
+        verified = check_drat(read_dimacs(formula_file), read_drat(proof_file))
+        return {"checker": "bundled", "verified": verified, "time": time.time() - start}
+
+    # drat-trim does not read gzipped files
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        for path in [formula_file, proof_file]:
+            paths.append(os.path.join(directory, os.path.basename(path).removesuffix(".gz")))
+            with _open(path) as fin, open(paths[-1], "w") as fout: shutil.copyfileobj(fin, fout)
+
+        try:
+            output = subprocess.run([executable, *paths], capture_output=True, text=True, timeout=timeout).stdout
+            verified = any(line.strip() == "s VERIFIED" for line in output.splitlines())
+        except subprocess.TimeoutExpired:
+            verified = None
+
+    return {"checker": executable, "verified": verified, "time": time.time() - start}
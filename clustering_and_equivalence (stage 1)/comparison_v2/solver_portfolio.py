@@ -0,0 +1,104 @@
+"""
+Portfolio solving, races several SAT solvers on the same formula in separate processes and takes the first answer
+"""
+
+from typing import List, Tuple, Iterable
+from pysat.solvers import Solver
+import multiprocessing
+import queue
+import time
+
+# NOTE: the formula is shared with the racing processes by forking, which requires unix
+
+# (maximum formula size, solvers) pairs, the first pair with a large enough maximum is used. Small formulas are solved faster than a
+#   process can be forked so are given a single solver.
+DEFAULT_PORTFOLIOS: List[Tuple[int | float, List[str]]] = [
+    (100000, ['cadical195']),
+    (1000000, ['cadical195', 'glucose4']),
+    (float('inf'), ['cadical195', 'glucose4', 'maplesat', 'lingeling']),
+]
+
+def default_portfolio(formula_size: int, portfolios: List[Tuple[int | float, List[str]]] = DEFAULT_PORTFOLIOS) -> List[str]:
+    """
+    Returns the solvers to race for a formula of formula_size clauses
+
+    Parameters
+    -----------
+        formula_size: int
+            The number of clauses in the formula
+        portfolios: List[Tuple[int | float, List[str]]]
+            Sorted (maximum formula size, solvers) pairs. Default DEFAULT_PORTFOLIOS
+
+    Return
+    ---------
+    List[str]
+        The solver names of the first pair whose maximum is at least formula_size
+    """
+    return next(solver_names for max_size, solver_names in portfolios if formula_size <= max_size)
+
+def _solve(solver_name: str, clauses: Iterable[List[int]], assumptions: List[int]) -> Tuple[bool, List[int] | None]:
+    with Solver(name=solver_name, bootstrap_with=clauses) as solver:
+        result = solver.solve(assumptions=assumptions)
+        return result, solver.get_model() if result else None
+
+def _portfolio_worker(solver_name: str, clauses: Iterable[List[int]], assumptions: List[int], results: multiprocessing.Queue) -> None:
+    results.put((solver_name, *_solve(solver_name, clauses, assumptions)))
+
+def race_solvers(
+        clauses: List[List[int]],
+        solver_names: List[str],
+        assumptions: List[int] = [],
+        timeout: float | None = None
+    ) -> Tuple[str | None, bool | None, List[int] | None]:
+    """
+    Solves the formula with each solver in a separate process, returning the first answer and terminating the other processes.
+
+    With a single solver no process is started. Solvers that error, e.g. from running out of memory, are ignored unless every solver errors.
+
+    Parameters
+    -----------
+        clauses: List[List[int]]
+            The clauses of the formula
+        solver_names: List[str]
+            The pysat names of the solvers to race
+        assumptions: List[int]
+            Literal assumptions for the solve call. Default empty
+        timeout: float | None
+            The maximum time in seconds to wait for an answer. Default None, no limit
+
+    Return
+    ---------
+    Tuple[str | None, bool | None, List[int] | None]
+        The name of the first solver to finish, its result, and its model if satisfiable. If the timeout is reached (None, None, None).
+
+    Raises
+    ---------
+    RuntimeError
+        Every solver process exited without an answer
+    """
+
+    if len(solver_names) == 1 and timeout is None:
+        return solver_names[0], *_solve(solver_names[0], clauses, assumptions)
+
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    processes = [context.Process(target=_portfolio_worker, args=(solver_name, clauses, assumptions, results)) for solver_name in solver_names]
+
+    try:
+        for process in processes: process.start()
+
+        # poll so that solvers that crash are noticed
+        deadline = None if timeout is None else time.time() + timeout
+        while deadline is None or time.time() < deadline:
+            try:
+                return results.get(timeout = 0.1 if deadline is None else max(0, min(0.1, deadline - time.time())))
+            except queue.Empty:
+                if all(not process.is_alive() for process in processes) and results.empty():
+                    raise RuntimeError(f"All portfolio solvers {solver_names} exited without an answer")
+
+        return None, None, None
+
+    finally:
+        for process in processes:
+            if process.is_alive(): process.terminate()
+        for process in processes: process.join()
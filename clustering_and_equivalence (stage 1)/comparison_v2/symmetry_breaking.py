@@ -0,0 +1,213 @@
+"""
+Lex-leader symmetry breaking for the equivalence formulas.
+
+An automorphism of the left circuit that preserves the classes from fingerprinting maps any solution of the formula onto another
+solution with the same cost, so the solver only needs to consider the lexicographically largest solution in each orbit. Each
+automorphism adds clauses that rule out solutions that are not, which does not change satisfiability or the MaxSAT optimum.
+"""
+
+from typing import List, Dict, Tuple, Hashable, Iterable
+from collections import Counter
+import itertools
+
+from circuits_and_constraints.abstract_circuit import Circuit
+from circuits_and_constraints.abstract_constraint import Constraint
+
+from utilities.assignment import Assignment
+from comparison_v2.canonical_labelling import canonical_labelling
+
+DEFAULT_SYMMETRY_MAX_LEAVES = 32
+
+# colour of signals and norms that are not in any encoded class
+UNENCODED_COLOUR = -1
+
+def is_class_automorphism(
+        norms: List[Constraint],
+        signal_to_normi: Dict[int, List[int]] | List[List[int]],
+        signal_colours: Dict[int, Hashable],
+        norm_colours: List[Hashable],
+        automorphism: Dict[int, int]
+    ) -> bool:
+    """
+    Checks that automorphism is an automorphism of the norms that preserves the signal and norm colours.
+
+    Only the norms of moved signals are checked, as all other norms are fixed.
+
+    Parameters
+    -----------
+        norms: List[Constraint]
+            The normalised constraints of the circuit
+        signal_to_normi: Dict[int, List[int]] | List[List[int]]
+            The norms each signal is in
+        signal_colours: Dict[int, Hashable]
+            The class of each signal
+        norm_colours: List[Hashable]
+            The class of each norm
+        automorphism: Dict[int, int]
+            The signal to signal mapping to check, signals not in the mapping are fixed
+
+    Return
+    ---------
+    bool
+        Whether automorphism maps the norms of each colour onto themselves
+    """
+    moved = [sig for sig, image in automorphism.items() if sig != image]
+    if any(signal_colours[sig] != signal_colours[automorphism[sig]] for sig in moved): return False
+
+    normis = set(itertools.chain.from_iterable(map(signal_to_normi.__getitem__, moved)))
+    return (Counter((norm_colours[normi], norms[normi].relabelled({})) for normi in normis) ==
+            Counter((norm_colours[normi], norms[normi].relabelled(automorphism)) for normi in normis))
+
+def transposition_automorphisms(
+        norms: List[Constraint],
+        signal_to_normi: Dict[int, List[int]] | List[List[int]],
+        signal_colours: Dict[int, Hashable],
+        norm_colours: List[Hashable],
+        signal_classes: Iterable[List[int]]
+    ) -> List[Dict[int, int]]:
+    """
+    Swaps of two signals in the same class that are automorphisms, i.e. signals that are interchangeable in every norm they are in.
+
+    Only consecutive signals of each sorted class are checked, so this is linear in the number of signals. Swapping consecutive
+    signals generates every permutation of a run of interchangeable signals, but interchangeable signals separated by another
+    signal of the class are missed, which only weakens the symmetry breaking.
+
+    Parameters
+    -----------
+        signal_classes: Iterable[List[int]]
+            The signal classes of the circuit
+
+        For other parameters see is_class_automorphism.
+
+    Return
+    ---------
+    List[Dict[int, int]]
+        The automorphisms found, each mapping only the two swapped signals
+    """
+    automorphisms = []
+    for signals in signal_classes:
+        signals = sorted(signals)
+        for lsig, rsig in zip(signals, signals[1:]):
+            automorphism = {lsig: rsig, rsig: lsig}
+            if is_class_automorphism(norms, signal_to_normi, signal_colours, norm_colours, automorphism): automorphisms.append(automorphism)
+    return automorphisms
+
+def lex_leader_clauses(
+        automorphisms: List[Dict[int, int]],
+        signal_to_class: Dict[int, Hashable],
+        right_signals: Dict[Hashable, List[int]],
+        signal_pair_encoder: Assignment
+    ) -> List[List[int]]:
+    """
+    Lex-leader clauses for the signal pair variables under each automorphism.
+
+    The pair variables are ordered by left signal then by the order of right_signals, so each left signal is a row and a row with its
+    pair earlier is larger. For an automorphism g the smallest moved left signal a is the first row where a solution X and its image
+    gX may differ, and that row of gX is the row of c = g^-1(a) in X. So X >= gX implies row a >= row c: if c is paired with the
+    j-th right signal then a is paired with one of the first j-1. This is the first step of the lex-leader constraint of g; it is
+    implied by the full constraint hence every orbit still has a solution satisfying the clauses of every automorphism.
+
+    If a row has no pair, as can happen in a MaxSAT formula, the row is smaller than any row with one, which the clauses also enforce.
+
+    Parameters
+    -----------
+        automorphisms: List[Dict[int, int]]
+            Class preserving automorphisms of the left circuit
+        signal_to_class: Dict[int, Hashable]
+            The class of each encoded left signal
+        right_signals: Dict[Hashable, List[int]]
+            The right signals of each class
+        signal_pair_encoder: Assignment
+            The encoder of the signal pair variables
+
+    Return
+    ---------
+    List[List[int]]
+        The symmetry breaking clauses
+    """
+    pair_variable = lambda lsig, rsig : signal_pair_encoder.assignment.get(lsig, {}).get(rsig, None)
+
+    clauses, seen = [], set([])
+    for automorphism in automorphisms:
+        moved = [sig for sig, image in automorphism.items() if sig != image and sig in signal_to_class]
+        if len(moved) == 0: continue
+
+        first = min(moved)
+        preimage = next(sig for sig, image in automorphism.items() if image == first)
+        if (first, preimage) in seen: continue
+        seen.add((first, preimage))
+
+        earlier = []
+        for rsig in right_signals[signal_to_class[first]]:
+            preimage_literal = pair_variable(preimage, rsig)
+            if preimage_literal is not None: clauses.append([-preimage_literal, *earlier])
+
+            first_literal = pair_variable(first, rsig)
+            if first_literal is not None: earlier.append(first_literal)
+
+    return clauses
+
+def symmetry_breaking_clauses(
+        names: List[str],
+        in_pair: List[Tuple[str, Circuit]],
+        signal_to_normi: Dict[str, Dict[int, List[int]] | List[List[int]]],
+        fingerprints_to_normi: Dict[str, Dict[int, List[int]]],
+        fingerprints_to_signals: Dict[str, Dict[int, List[int]]],
+        signal_pair_encoder: Assignment,
+        max_leaves: int = DEFAULT_SYMMETRY_MAX_LEAVES
+    ) -> Tuple[List[List[int]], int]:
+    """
+    Detects automorphisms of the left circuit that preserve the encoded classes and returns their lex-leader clauses.
+
+    Automorphisms are the interchangeable signal pairs from transposition_automorphisms, and those found by the individualisation-
+    refinement search of canonical_labelling started from the encoded classes, up to max_leaves leaves. Every automorphism is checked
+    exactly before use. If the left circuit has no class with more than one signal there is nothing to break and no search is done.
+
+    Parameters
+    -----------
+        names: List[str]
+            The names of the circuits, the first is the left circuit
+        in_pair: List[Tuple[str, Circuit]]
+            Pair of (name, Circuit) tuples with normalised constraints
+        signal_to_normi: Dict[str, Dict[int, List[int]] | List[List[int]]]
+            The norms each signal is in for each circuit
+        fingerprints_to_normi: Dict[str, Dict[int, List[int]]]
+            The encoded norm classes
+        fingerprints_to_signals: Dict[str, Dict[int, List[int]]]
+            The encoded signal classes
+        signal_pair_encoder: Assignment
+            The encoder of the signal pair variables, after encoding
+        max_leaves: int
+            The maximum number of leaves of the automorphism search, if 0 only transpositions are found. Default DEFAULT_SYMMETRY_MAX_LEAVES
+
+    Return
+    ---------
+    Tuple[List[List[int]], int]
+        The symmetry breaking clauses, and the number of automorphisms they were generated from
+    """
+
+    if all(len(signals) <= 1 for signals in fingerprints_to_signals[names[0]].values()): return [], 0
+
+    circ = in_pair[0][1]
+    norms = circ.normalised_constraints
+
+    # classes are renumbered as the fingerprints may not be comparable with each other
+    signal_to_class = {sig: key for key, signals in fingerprints_to_signals[names[0]].items() for sig in signals}
+    class_to_colour = {key: colour for colour, key in enumerate(fingerprints_to_signals[names[0]].keys())}
+    signal_colours = {sig: class_to_colour[signal_to_class[sig]] if sig in signal_to_class else UNENCODED_COLOUR for sig in circ.get_signals()}
+
+    norm_colours = [UNENCODED_COLOUR for _ in norms]
+    for colour, normis in enumerate(fingerprints_to_normi[names[0]].values()):
+        for normi in normis: norm_colours[normi] = colour
+
+    automorphisms = transposition_automorphisms(norms, signal_to_normi[names[0]], signal_colours, norm_colours,
+                                                filter(lambda signals : len(signals) > 1, fingerprints_to_signals[names[0]].values()))
+
+    if max_leaves > 0:
+        _, searched = canonical_labelling(norms, circ.get_signals(), circ.fingerprint_signal, signal_colours, norm_colours,
+                                          max_leaves=max_leaves, return_automorphisms=True)
+        searched = map(lambda automorphism : {sig: image for sig, image in automorphism.items() if sig != image}, searched)
+        automorphisms.extend(filter(lambda automorphism : is_class_automorphism(norms, signal_to_normi[names[0]], signal_colours, norm_colours, automorphism),
+                                    searched))
+
+    return lex_leader_clauses(automorphisms, signal_to_class, fingerprints_to_signals[names[1]], signal_pair_encoder), len(automorphisms)
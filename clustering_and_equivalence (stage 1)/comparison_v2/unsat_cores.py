@@ -0,0 +1,170 @@
+"""
+Explanations of non-equivalence from unsatisfiable cores, in terms of the fingerprint classes of the encoding.
+
+A core pattern describes the classes of a minimal core up to renaming of the right circuit. Any later comparison with the same left
+circuit whose classes contain the same pattern has an isomorphic unsatisfiable subformula, so can be rejected without encoding.
+"""
+
+from typing import List, Dict, Tuple, Hashable, Iterable
+from collections import Counter
+from pysat.solvers import Solver
+
+from circuits_and_constraints.abstract_circuit import Circuit
+
+from comparison_v2.canonical_labelling import canonical_labelling
+
+DEFAULT_PATTERN_MAX_LEAVES = 64
+
+def minimise_core(solver: Solver, core: Iterable[int], candidates: Iterable[int], assumptions: List[int] = []) -> List[int]:
+    """
+    Deletion-based minimisation of an unsatisfiable core.
+
+    Each literal of the core is dropped in turn, if the formula is still unsatisfiable the literal is removed along with any other
+    literal not in the new core. The result is a minimal core: removing any one literal makes the formula satisfiable.
+
+    Parameters
+    -----------
+        solver: Solver
+            The solver, after an unsatisfiable solve call
+        core: Iterable[int]
+            The core of that solve call
+        candidates: Iterable[int]
+            The assumption literals that can be in the core
+        assumptions: List[int]
+            Literals assumed in every solve call that are never part of the core. Default empty.
+
+    Return
+    ---------
+    List[int]
+        The minimal core, a subset of core
+    """
+    candidates = set(candidates)
+    core = [lit for lit in core if lit in candidates]
+
+    i = 0
+    while i < len(core):
+        trial = core[:i] + core[i+1:]
+        if solver.solve(assumptions + trial):
+            i += 1
+        else:
+            smaller = set(solver.get_core())
+            core = [lit for lit in trial if lit in smaller]
+
+    return core
+
+def _class_id(members: List[int]) -> Tuple[int]:
+    "classes are identified by their members in the left circuit, which are comparable between comparisons with the same left circuit"
+    return tuple(sorted(members))
+
+def _core_region(
+        names: List[str],
+        in_pair: List[Tuple[str, Circuit]],
+        norm_ids: Tuple[Tuple[int]],
+        signal_ids: Tuple[Tuple[int]],
+        fingerprints_to_normi: Dict[str, Dict[int, List[int]]],
+        fingerprints_to_signals: Dict[str, Dict[int, List[int]]],
+        max_leaves: int
+    ) -> Hashable | None:
+    """
+    Description of the classes norm_ids and signal_ids, exact in the left circuit and canonical in the right circuit. None if not
+    every class is present or the canonical labelling of the right circuit exceeds max_leaves.
+    """
+    norm_keys = {_class_id(normis): key for key, normis in fingerprints_to_normi[names[0]].items()}
+    signal_keys = {_class_id(signals): key for key, signals in fingerprints_to_signals[names[0]].items()}
+    if any(id not in norm_keys for id in norm_ids) or any(id not in signal_keys for id in signal_ids): return None
+
+    signal_to_id = {name: {sig: id for id, key in signal_keys.items() for sig in fingerprints_to_signals[name][key]} for name in names}
+
+    parts = []
+    for name, circ in in_pair:
+        normis = [normi for id in norm_ids for normi in fingerprints_to_normi[name][norm_keys[id]]]
+        norm_colours = [id for id in norm_ids for _ in fingerprints_to_normi[name][norm_keys[id]]]
+        signals = sorted(set(sig for normi in normis for sig in circ.normalised_constraints[normi].signals()).union(
+            sig for id in signal_ids for sig in fingerprints_to_signals[name][signal_keys[id]]))
+
+        if name == names[0]:
+            parts.append((tuple(zip(normis, norm_colours)), tuple((sig, signal_to_id[name][sig]) for sig in signals)))
+            continue
+
+        norms = [circ.normalised_constraints[normi] for normi in normis]
+        signal_colours = {sig: signal_to_id[name][sig] for sig in signals}
+        labelling = canonical_labelling(norms, signals, circ.fingerprint_signal, signal_colours, norm_colours, max_leaves)
+        if labelling is None: return None
+
+        # labels start at 1 as 0 is the constant signal
+        labels = {sig: label + 1 for sig, label in labelling[1].items()}
+        parts.append((frozenset(Counter(zip(norm_colours, map(lambda norm : norm.relabelled(labels), norms))).items()),
+                      tuple(sorted((labels[sig], colour) for sig, colour in signal_colours.items()))))
+
+    return tuple(parts)
+
+def core_pattern(
+        names: List[str],
+        in_pair: List[Tuple[str, Circuit]],
+        norm_keys: List[Hashable],
+        signal_keys: List[Hashable],
+        fingerprints_to_normi: Dict[str, Dict[int, List[int]]],
+        fingerprints_to_signals: Dict[str, Dict[int, List[int]]],
+        max_leaves: int = DEFAULT_PATTERN_MAX_LEAVES
+    ) -> Hashable | None:
+    """
+    The pattern of the core classes norm_keys and signal_keys, for use with matches_core_pattern.
+
+    The pattern fixes the core classes and the classes of every signal in a core norm by their members in the left circuit, and the
+    norms and signals of the right circuit in these classes up to isomorphism. As the clauses of a class only depend on these, a
+    comparison matching the pattern has an isomorphic copy of the core.
+
+    Parameters
+    -----------
+        names: List[str]
+            The names of the circuits
+        in_pair: List[Tuple[str, Circuit]]
+            Pair of (name, Circuit) tuples with normalised constraints
+        norm_keys: List[Hashable]
+            The fingerprints of the norm classes in the core
+        signal_keys: List[Hashable]
+            The fingerprints of the signal classes in the core
+        fingerprints_to_normi: Dict[str, Dict[int, List[int]]]
+            The norm classes of the comparison
+        fingerprints_to_signals: Dict[str, Dict[int, List[int]]]
+            The signal classes of the comparison
+        max_leaves: int
+            The maximum number of leaves of the canonical labelling of the right circuit. Default DEFAULT_PATTERN_MAX_LEAVES
+
+    Return
+    ---------
+    Hashable | None
+        The pattern, None if the canonical labelling exceeded max_leaves
+    """
+    norm_ids = tuple(sorted(_class_id(fingerprints_to_normi[names[0]][key]) for key in norm_keys))
+    signal_ids = tuple(sorted(_class_id(fingerprints_to_signals[names[0]][key]) for key in signal_keys))
+
+    region = _core_region(names, in_pair, norm_ids, signal_ids, fingerprints_to_normi, fingerprints_to_signals, max_leaves)
+    return None if region is None else (norm_ids, signal_ids, region, max_leaves)
+
+def matches_core_pattern(
+        pattern: Hashable,
+        names: List[str],
+        in_pair: List[Tuple[str, Circuit]],
+        fingerprints_to_normi: Dict[str, Dict[int, List[int]]],
+        fingerprints_to_signals: Dict[str, Dict[int, List[int]]]
+    ) -> bool:
+    """
+    Checks whether the classes of a comparison contain a core pattern, in which case the comparison is unsatisfiable.
+
+    The left circuit must be the same circuit the pattern was made with, with the same signal and norm indexing.
+
+    Parameters
+    -----------
+        pattern: Hashable
+            A pattern from core_pattern
+
+        For other parameters see core_pattern.
+
+    Return
+    ---------
+    bool
+        Whether the classes contain the pattern
+    """
+    norm_ids, signal_ids, region, max_leaves = pattern
+    return region == _core_region(names, in_pair, norm_ids, signal_ids, fingerprints_to_normi, fingerprints_to_signals, max_leaves)
@@ -17,6 +17,7 @@ from circuits_and_constraints.abstract_circuit import Circuit
 from circuits_and_constraints.abstract_constraint import Constraint
 
 from utilities.assignment import Assignment
+from utilities.deadline import Deadline
 from comparison_v2.fingerprinting_v2 import back_and_forth_fingerprinting
 
 # TODO: make part of constraint Class
@@ -73,9 +74,11 @@ def iterated_fingerprints_w_reverting(
     fingerprints_to_signals: Dict[str, Dict[int, List[int]]],
     initial_mode: bool = True,
     return_index_to_fingerprint: bool = False,
-    test_data: dict | None = None 
+    test_data: dict | None = None,
+    deadline: Deadline | None = None
     ):
     return back_and_forth_fingerprinting(
         names, in_pair, signal_to_normi, fingerprints_to_normi, fingerprints_to_signals, initial_mode = initial_mode, 
-        per_iteration_postprocessing = sanity_check_and_revert, return_index_to_fingerprint = return_index_to_fingerprint, test_data = test_data, strict_unique=True
+        per_iteration_postprocessing = sanity_check_and_revert, return_index_to_fingerprint = return_index_to_fingerprint, test_data = test_data, strict_unique=True,
+        deadline = deadline
     )
\ No newline at end of file
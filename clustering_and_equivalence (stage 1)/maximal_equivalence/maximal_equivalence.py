@@ -2,15 +2,18 @@ from typing import Tuple, List, Callable, Dict, Set, Iterable
 from pysat.formula import CNF
 from pysat.solvers import Solver
 from pysat.examples.lsu import LSU
-from threading import Timer
 import time
 import itertools
 from collections import deque 
 
 from utilities.utilities import _signal_data_from_cons_list, count_ints
+from utilities.assignment import decode_model
+from utilities.deadline import Deadline, check_deadline
+from utilities.budget import Budget, check_budget_clauses
 
 from circuits_and_constraints.abstract_circuit import Circuit
 from comparison_v2.constraint_encoding_v2 import encode_classes_v2
+from comparison_v2.symmetry_breaking import symmetry_breaking_clauses
 
 from maximal_equivalence.iterated_fingerprints_with_pausing import iterated_fingerprints_w_reverting, coefficient_only_fingerprinting
 
@@ -22,8 +25,22 @@ def maximum_equivalence(
         debug: bool = False,
         fingerprints_to_normi: Dict[str, Dict[int, List[int]]] | None = None,
         fingerprints_to_signals: Dict[str, Dict[int, List[int]]] | None = None,
-        solver_timeout: float | None = None
+        solver_timeout: float | None = None,
+        solver_name: str | None = None,
+        symmetry_breaking: bool = False,
+        deadline: Deadline | None = None,
+        budget: Budget | None = None
         ) -> Dict[str, any]:
+    """
+    MaxSAT variant of circuit_equivalence, finding the mapping between the circuits that satisfies the most constraints.
+
+    The solve stops at solver_timeout seconds or the deadline, whichever is first, and the best mapping found so far is returned. The
+    deadline is also checked during fingerprinting and encoding, raising TimeoutException once expired.
+
+    Likewise the solve stops once the conflicts or propagations of the budget are used, over all calls of the LSU oracle when it is
+    glucose4 (the default if limited). The limit that stopped the solve is added to test_data as "limit_hit", None if the optimum was
+    found. The clauses of the budget are checked during encoding, raising TimeoutException once exceeded.
+    """
     
     names = [in_pair[0][0], in_pair[1][0]]
 
@@ -73,7 +90,7 @@ def maximum_equivalence(
         # encode initial fingerprints but norms now have signal class in norm
         fingerprints_to_normi, fingerprints_to_signals, _, signal_to_fingerprints = iterated_fingerprints_w_reverting(
             names, in_pair, signal_to_normi, fingerprints_to_normi, fingerprints_to_signals, return_index_to_fingerprint=True,
-            initial_mode = False
+            initial_mode = False, deadline = deadline
         )
 
         ## SatEncoding needs same classes
@@ -97,22 +114,32 @@ def maximum_equivalence(
                 "counts": [x[1] for x in ints]
             }
 
-        formula, _, norm_assignment, signal_assignment = encode_classes_v2(in_pair, fingerprints_to_normi, signal_to_fingerprints, fingerprints_to_signals, weighted_cnf=True)
+        formula, _, norm_assignment, signal_assignment = encode_classes_v2(in_pair, fingerprints_to_normi, signal_to_fingerprints, fingerprints_to_signals, weighted_cnf=True,
+                                                                           deadline=deadline, budget=budget)
+
+        # symmetric mappings have the same cost so the lex-leader clauses are hard
+        if symmetry_breaking:
+            symmetry_clauses, test_data["symmetry_generators"] = symmetry_breaking_clauses(
+                names, in_pair, signal_to_normi, fingerprints_to_normi, fingerprints_to_signals, signal_assignment)
+            formula.extend(symmetry_clauses)
         test_data["formula_size"] = len(formula.hard) + len(formula.soft)
+        check_budget_clauses(budget, formula)
 
-        solver = LSU(formula, solver='glucose4' if solver_timeout is not None else 'cadical195', expect_interrupt=solver_timeout is not None, verbose=debug, incr=solver_timeout is not None)
+        check_deadline(deadline)
+        if budget is None: budget = Budget()
+        interruptible = solver_timeout is not None or (deadline is not None and deadline.expires is not None) or budget.limits_solver()
+        if solver_name is None: solver_name = 'glucose4' if interruptible else 'cadical195'
+        solver = LSU(formula, solver=solver_name, expect_interrupt=interruptible, verbose=debug, incr=interruptible)
         # solver.oracle.solve_limited(expect_interrupt=solver.expect_interrupt) ## For some reason, running the oracle once here (which is done in the solve loop) makes it work??
 
         encoding_time = time.time()
         test_data["timing"]["encoding_time"] = encoding_time - last_time
         if debug: print("encoding took : ", test_data["timing"]["encoding_time"], " and formula size: ", test_data["formula_size"] )
 
-        if solver_timeout is not None:
-            timer = Timer(interval = solver_timeout, function = lambda lsu : lsu.interrupt(), args = [solver]) ## needs to be passed as an argument for some reason. Testing with solver.interrupt() gave weird behaviour -- TODO: understand
-            timer.start()
-
-        solver.solve()
-        if solver_timeout is not None: timer.cancel()
+        solve_deadline = Deadline(solver_timeout, parent=deadline)
+        with solve_deadline.interrupting(solver), budget.limiting(solver.oracle) as stats:
+            solver.solve()
+        test_data["limit_hit"] = None if solver.oracle.get_status() is not None else budget.limit_hit(solver.oracle, stats, solve_deadline)
 
         try:
             model = list(solver.get_model())
@@ -126,17 +153,14 @@ def maximum_equivalence(
 
         if debug: print("solving took : ", test_data["timing"]["solving_time"] )
 
-        # TODO: make more efficient
-        norm_vals = { val : True for val in itertools.chain(*map(lambda key : norm_assignment.assignment[key].values(), norm_assignment.assignment.keys()))}
-        signal_vals = { val : True for val in itertools.chain(*map(lambda key : signal_assignment.assignment[key].values(), signal_assignment.assignment.keys()))}
+        model_norm_pairs, signal_pairs = decode_model(model, [norm_assignment, signal_assignment])
 
         norm_pairs = list(itertools.chain( 
                 # norm pairs from uniquely identified norms
              map(lambda key : (fingerprints_to_normi[names[0]][key][0], fingerprints_to_normi[names[1]][key][0]), filter(lambda key : len(fingerprints_to_normi[names[0]][key]) == 1 and len(fingerprints_to_normi[names[1]].setdefault(key, [])) == 1, fingerprints_to_normi[names[0]].keys()))
             , # norm pairs from MaxSAT solver
-            map(norm_assignment.get_inv_assignment, filter(lambda lit : norm_vals.setdefault(lit, False), filter(lambda x : x > 0, model))) 
+            model_norm_pairs
         ))
-        signal_pairs = list(map(signal_assignment.get_inv_assignment, filter(lambda lit : signal_vals.setdefault(lit, False), filter(lambda x : x > 0, model))))
 
         coni_pairs = list(set(map(lambda pair : tuple(in_pair[i][1].normi_to_coni[pair[i]] for i in range(2)), norm_pairs)))
 
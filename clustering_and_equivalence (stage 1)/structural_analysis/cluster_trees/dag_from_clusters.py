@@ -7,7 +7,8 @@ import itertools
 import json
 import warnings
 
-from utilities.utilities import UnionFind, _signal_data_from_cons_list, dist_to_source_set, _distances_to_signal_set
+from utilities.utilities import UnionFind, _signal_data_from_cons_list
+from utilities.graph_kernels import adjacency_matrix, multi_source_distances
 from circuits_and_constraints.abstract_circuit import Circuit
 from circuits_and_constraints.abstract_constraint import Constraint
 
@@ -105,6 +106,7 @@ def dag_from_partition(circ: Circuit, partition: List[List[int]]) -> "directed_a
     # copying to avoid mutating
 
     partition: Dict[int, List[int]] = {i : part for i, part in enumerate(partition)}
+    nparts = len(partition)
 
     part_to_sigs = lambda part : itertools.chain.from_iterable(map(lambda coni : circ.constraints[coni].signals(), part))
     input_parts = set(filter(lambda i : any(map(circ.signal_is_input, part_to_sigs(partition[i]))),partition.keys()))
@@ -130,11 +132,14 @@ def dag_from_partition(circ: Circuit, partition: List[List[int]]) -> "directed_a
     while merged:
         merged = False
 
-        dist_to_inputs = dist_to_source_set(input_parts, adjacencies)
-        dist_to_outputs = dist_to_source_set(output_parts, adjacencies)
+        # merged parts keep the id of their root, so the ids of the first partition number the vertices
+        graph = adjacency_matrix(adjacencies, nparts)
+        dist_to_inputs = multi_source_distances(graph, input_parts).tolist()
+        dist_to_outputs = multi_source_distances(graph, output_parts).tolist()
 
         ## make the preorder
-        part_to_preorder = { i: (dist_to_inputs.get(i, float("inf")), dist_to_outputs.get(i, float("inf"))) for i in partition.keys()}
+        distance = lambda dist : dist if dist >= 0 else float("inf")
+        part_to_preorder = { i: (distance(dist_to_inputs[i]), distance(dist_to_outputs[i])) for i in partition.keys()}
         
         to_merge = UnionFind()
 
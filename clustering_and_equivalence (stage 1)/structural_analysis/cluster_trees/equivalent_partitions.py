@@ -7,33 +7,59 @@ from utilities.iterated_adj_reclassing import iterated_label_propagation
 from circuits_and_constraints.abstract_circuit import Circuit
 from utilities.assignment import Assignment
 from testing_harness import exception_catcher
+from structural_analysis.utilities.connected_preprocessing import connected_preprocessing
+from comparison_v2.comparison_session import ComparisonSession
+from comparison_v2.prescreen import circuit_invariants
+from comparison_v2.canonical_labelling import canonical_hash, DEFAULT_MAX_LEAVES
 
-def naive_equivalency_analysis(nodes: Dict[int, DAGNode], time_limit: int = 0,  fingerprints_to_normi = None, fingerprints_to_signals = None) -> List[List[int]]:
+def naive_equivalency_analysis(nodes: Dict[int, DAGNode], time_limit: int = 0,  fingerprints_to_normi = None, fingerprints_to_signals = None,
+                               explain_unsat: bool = False) -> List[List[int]]:
     """
     iterates over the list of partition, definition sub-circuits for each partition and comparing with each class representative
         worst-case time: O(len(partition)^2
+
+    each class keeps a ComparisonSession for its representative so the representative is only preprocessed once
+    the invariants of each node are computed once, and a node is only compared with representatives with the same invariants
+    with explain_unsat each failed comparison records its unsatisfiable core in the session, so later nodes containing the same core are skipped
     """
 
     classes: List[List[int]] = []
     mappings: List[List[List[int]]] = []
+    sessions: List[ComparisonSession] = []
+
+    _naive_classing(nodes, time_limit, fingerprints_to_normi, fingerprints_to_signals, classes, mappings, sessions, explain_unsat)
+
+    for session in sessions: session.delete()
+    
+    return classes, mappings
+
+def _naive_classing(nodes: Dict[int, DAGNode], time_limit: int, fingerprints_to_normi, fingerprints_to_signals, 
+                    classes: List[List[int]], mappings: List[List[List[int]]], sessions: List[ComparisonSession], explain_unsat: bool = False,
+                    tried: Dict[int, int] | None = None) -> None:
+    """
+    adds each node to the first class in classes it is equivalent to, or to a new class, extending classes, mappings and sessions in place
+    a node in tried is not compared again with the class index it maps to, which it already failed to join
+    """
+    if tried is None: tried = {}
 
     for node_id, node in nodes.items():
 
-        # build sub-circuit
-        sub_circ = node.get_subcircuit()
+        # build sub-circuit, preprocessed once for all comparisons
+        sub_circ = connected_preprocessing(node.get_subcircuit())
+        invariants = circuit_invariants(sub_circ)
 
         equivalent = False
         for class_ind, class_ in enumerate(classes):
 
-            # subcircuit only calculated once then stored in the class so this isn't wasting time
-            repr_circ = nodes[class_[0]].get_subcircuit()
-
-            initial_norm_fingerprints = None if fingerprints_to_normi is None else { node.id : fingerprints_to_normi[node.id] for node in [node, nodes[class_[0]]]}
-            initial_signal_fingerprints = None if fingerprints_to_signals is None else { node.id : fingerprints_to_signals[node.id] for node in [node, nodes[class_[0]]]}
+            if tried.get(node_id) == class_ind or sessions[class_ind].invariants != invariants: continue
+            repr_circ = sessions[class_ind].circ
 
+            # class_[0] need not be in nodes when extending classes found by canonical_equivalency_analysis
+            initial_norm_fingerprints = None if fingerprints_to_normi is None else { id : fingerprints_to_normi[id] for id in [node.id, class_[0]]}
+            initial_signal_fingerprints = None if fingerprints_to_signals is None else { id : fingerprints_to_signals[id] for id in [node.id, class_[0]]}
 
-
-            test_data = exception_catcher([(nodes[class_[0]].id, repr_circ), (node.id, sub_circ)], time_limit_seconds=time_limit, fingerprints_to_normi = initial_norm_fingerprints, fingerprints_to_signals = initial_signal_fingerprints)
+            test_data = exception_catcher([(class_[0], repr_circ), (node.id, sub_circ)], {}, time_limit_seconds=time_limit, comparison=sessions[class_ind].compare,
+                                          preprocessed=True, invariants=invariants, explain_unsat=explain_unsat, fingerprints_to_normi = initial_norm_fingerprints, fingerprints_to_signals = initial_signal_fingerprints)
             equivalent = test_data["result"]
 
             if equivalent: 
@@ -44,7 +70,73 @@ def naive_equivalency_analysis(nodes: Dict[int, DAGNode], time_limit: int = 0,
         if not equivalent:
             classes.append([node_id])
             mappings.append([])
-    
+            sessions.append(ComparisonSession(node.id, sub_circ, preprocessed=True))
+
+def canonical_equivalency_analysis(nodes: Dict[int, DAGNode], time_limit: int = 0,  fingerprints_to_normi = None, fingerprints_to_signals = None, 
+                                   max_leaves: int = DEFAULT_MAX_LEAVES) -> List[List[int]]:
+    """
+    groups the nodes by the canonical hash of their subcircuit, each node is then only compared with the first node with the same hash
+        worst-case time: O(len(partition)) comparisons if every hash is found
+
+    nodes whose canonical labelling needs more than max_leaves leaves, or that are not equivalent to the first node with the same hash
+    (i.e. the comparison timed out), fall back to naive_equivalency_analysis against every class other than the one already tried. For two or fewer nodes hashing can not 
+    save a comparison so naive_equivalency_analysis is used directly.
+    """
+
+    if len(nodes) <= 2: return naive_equivalency_analysis(nodes, time_limit, fingerprints_to_normi, fingerprints_to_signals)
+
+    classes: List[List[int]] = []
+    mappings: List[List[List[int]]] = []
+    sessions: List[ComparisonSession] = []
+
+    hash_to_class: Dict[str, int] = {}
+    unhashed: Dict[int, DAGNode] = {}
+    tried: Dict[int, int] = {}
+
+    for node_id, node in nodes.items():
+        sub_circ = node.get_subcircuit()
+
+        # the initial fingerprints are shared between nodes so can be used as initial colours
+        initial_signal_colours = None if fingerprints_to_signals is None else {
+            sig: key for key, signals in fingerprints_to_signals[node.id].items() for sig in signals}
+        initial_norm_colours = None
+        if fingerprints_to_normi is not None:
+            initial_norm_colours = [None for _ in range(sum(map(len, fingerprints_to_normi[node.id].values())))]
+            for key, normis in fingerprints_to_normi[node.id].items():
+                for normi in normis: initial_norm_colours[normi] = key
+
+        hash_ = canonical_hash(sub_circ, initial_signal_colours, initial_norm_colours, max_leaves)
+
+        if hash_ is None:
+            unhashed[node_id] = node
+            continue
+
+        if hash_ not in hash_to_class:
+            hash_to_class[hash_] = len(classes)
+            classes.append([node_id])
+            mappings.append([])
+            sessions.append(ComparisonSession(node.id, sub_circ))
+            continue
+
+        class_ind = hash_to_class[hash_]
+
+        initial_norm_fingerprints = None if fingerprints_to_normi is None else { id : fingerprints_to_normi[id] for id in [node.id, classes[class_ind][0]]}
+        initial_signal_fingerprints = None if fingerprints_to_signals is None else { id : fingerprints_to_signals[id] for id in [node.id, classes[class_ind][0]]}
+
+        test_data = exception_catcher([(classes[class_ind][0], sessions[class_ind].circ), (node.id, sub_circ)], {}, time_limit_seconds=time_limit, comparison=sessions[class_ind].compare,
+                                      fingerprints_to_normi = initial_norm_fingerprints, fingerprints_to_signals = initial_signal_fingerprints)
+
+        if test_data["result"]:
+            classes[class_ind].append(node_id)
+            mappings[class_ind].append(list(map(lambda pair : pair[1], sorted(test_data["mapping"]["coni"]))))
+        else:
+            unhashed[node_id] = node
+            tried[node_id] = class_ind
+
+    _naive_classing(unhashed, time_limit, fingerprints_to_normi, fingerprints_to_signals, classes, mappings, sessions, tried=tried)
+
+    for session in sessions: session.delete()
+
     return classes, mappings
 
 def easy_fingerprint_then_equivalence(nodes: Dict[int, DAGNode], time_limit: int = 0) -> List[List[int]]:
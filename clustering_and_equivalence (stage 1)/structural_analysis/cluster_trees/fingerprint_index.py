@@ -0,0 +1,230 @@
+"""
+Persistent on-disk index of subcircuits keyed by canonical hash, so that equivalence classes resolved in earlier runs are reused.
+
+Each entry stores the class representative as a preprocessed circuit with normalised constraints, its canonical signal labels and the
+known mappings of members onto it. A subcircuit with the same hash as an entry is mapped onto the representative by matching canonical
+labels, which is verified exactly in linear time, so cache hits need neither fingerprinting nor a SAT comparison.
+"""
+
+from typing import List, Dict, Tuple
+import os
+import pickle
+
+from circuits_and_constraints.abstract_circuit import Circuit
+from structural_analysis.cluster_trees.dag_from_clusters import DAGNode
+from structural_analysis.utilities.connected_preprocessing import connected_preprocessing
+from comparison_v2.canonical_labelling import canonical_hash, DEFAULT_MAX_LEAVES
+
+# the number of member mappings kept for each entry, these are only a record of where the representative has been seen
+MAX_INDEX_MEMBERS = 16
+
+def canonical_mapping(lcirc: Circuit, llabels: Dict[int, int], rcirc: Circuit, rlabels: Dict[int, int]) -> List[Tuple[int, int]] | None:
+    """
+    Maps the constraints of lcirc to those of rcirc by pairing signals with the same canonical label, if this is an equivalence.
+
+    Parameters
+    -----------
+        lcirc: Circuit
+            The left circuit, with normalised constraints
+        llabels: Dict[int, int]
+            The canonical labels of the left signals, as returned by canonical_hash
+        rcirc: Circuit
+            The right circuit, with normalised constraints
+        rlabels: Dict[int, int]
+            The canonical labels of the right signals
+
+    Return
+    ---------
+    List[Tuple[int, int]] | None
+        The sorted (left coni, right coni) pairs of the constraint bijection, None if pairing signals by label does not map each
+        normalised constraint to one of the other circuit or does not preserve inputs and outputs.
+    """
+    if lcirc.nConstraints != rcirc.nConstraints or len(lcirc.normalised_constraints) != len(rcirc.normalised_constraints): return None
+    if sorted(llabels.values()) != sorted(rlabels.values()): return None
+
+    signal_type = lambda circ, sig : 1 if circ.signal_is_output(sig) else 2 if circ.signal_is_input(sig) else 3
+    if {label: signal_type(lcirc, sig) for sig, label in llabels.items()} != {label: signal_type(rcirc, sig) for sig, label in rlabels.items()}: return None
+
+    right_norms = {}
+    for normi, norm in enumerate(rcirc.normalised_constraints): right_norms.setdefault(norm.relabelled(rlabels), []).append(normi)
+
+    pairs = set([])
+    for normi, norm in enumerate(lcirc.normalised_constraints):
+        normjs = right_norms.get(norm.relabelled(llabels), [])
+        if len(normjs) == 0: return None
+        pairs.add((lcirc.normi_to_coni[normi], rcirc.normi_to_coni[normjs.pop()]))
+
+    if len(pairs) != lcirc.nConstraints or len(set(map(lambda pair : pair[1], pairs))) != rcirc.nConstraints: return None
+    return sorted(pairs)
+
+class FingerprintIndex():
+    """
+    Directory of representative subcircuits keyed by canonical hash, one pickle file per entry.
+
+    Entries are loaded on first use and written by save, each file is replaced atomically so concurrent runs sharing an index at worst
+    lose the members recorded by one of them.
+
+    Attributes
+    -----------
+        directory: str
+            The directory of the index
+        max_leaves: int
+            The maximum number of leaves of the canonical labelling, subcircuits exceeding it are not indexed
+        entries: Dict[str, Dict[str, any] | None]
+            The entries loaded so far, None for hashes not in the index
+        modified: set[str]
+            The hashes of entries changed since the last save
+    """
+
+    def __init__(self, directory: str, max_leaves: int = DEFAULT_MAX_LEAVES):
+        """
+        Constructor for FingerprintIndex, creates the directory if it does not exist
+
+        Parameters
+        -----------
+            directory: str
+                The directory of the index
+            max_leaves: int
+                The maximum number of leaves of the canonical labelling. Default DEFAULT_MAX_LEAVES
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_leaves = max_leaves
+        self.entries = {}
+        self.modified = set([])
+
+    def _path(self, hash_: str) -> str:
+        return os.path.join(self.directory, f"{hash_}.pickle")
+
+    def get(self, hash_: str) -> Dict[str, any] | None:
+        """
+        Returns the entry of hash_, a dict with fields "circuit", "labels" and "members", or None if not in the index
+        """
+        if hash_ not in self.entries:
+            path = self._path(hash_)
+            if os.path.exists(path):
+                with open(path, "rb") as f: self.entries[hash_] = pickle.load(f)
+            else: self.entries[hash_] = None
+        return self.entries[hash_]
+
+    def add(self, hash_: str, circ: Circuit, labels: Dict[int, int], source: str) -> None:
+        """
+        Adds circ as the representative of hash_, unless hash_ already has one
+
+        Parameters
+        -----------
+            hash_: str
+                The canonical hash of circ
+            circ: Circuit
+                The preprocessed circuit with normalised constraints
+            labels: Dict[int, int]
+                The canonical labels of circ
+            source: str
+                Description of where circ came from
+        """
+        if self.get(hash_) is not None: return
+        self.entries[hash_] = {"circuit": circ, "labels": labels, "members": {source: list(range(circ.nConstraints))}}
+        self.modified.add(hash_)
+
+    def add_member(self, hash_: str, source: str, mapping: List[int]) -> None:
+        """
+        Records that source is equivalent to the representative of hash_ by mapping, the constraint of source mapped to by each
+        constraint of the representative. At most MAX_INDEX_MEMBERS members are kept.
+        """
+        members = self.get(hash_)["members"]
+        if source in members or len(members) >= MAX_INDEX_MEMBERS: return
+        members[source] = mapping
+        self.modified.add(hash_)
+
+    def save(self) -> None:
+        "Writes every entry changed since the last save"
+        for hash_ in self.modified:
+            path = self._path(hash_)
+            with open(f"{path}.{os.getpid()}.tmp", "wb") as f: pickle.dump(self.entries[hash_], f)
+            os.replace(f"{path}.{os.getpid()}.tmp", path)
+        self.modified = set([])
+
+def indexed_equivalency(nodes: Dict[int, DAGNode], index: FingerprintIndex, source: str = "") -> Tuple[Dict[str, Dict[int, List[int]]], Dict[int, DAGNode], Dict[int, Tuple[str, Dict[int, int], Circuit]]]:
+    """
+    Maps each node whose subcircuit is in the index onto the representative of its entry.
+
+    Parameters
+    -----------
+        nodes: Dict[int, DAGNode]
+            The nodes to look up
+        index: FingerprintIndex
+            The index
+        source: str
+            Prefix of the node ids recorded as members in the index. Default empty
+
+    Return
+    ---------
+    Dict[str, Dict[int, List[int]]]
+        For each hash found, the mapping of each node onto the representative, as the constraint of the node mapped to by each
+        constraint of the representative
+    Dict[int, DAGNode]
+        The nodes not found
+    Dict[int, Tuple[str, Dict[int, int], Circuit]]
+        For each node not found that has a canonical hash, the hash, canonical labels and preprocessed subcircuit for index_classes
+    """
+    hits, misses, miss_data = {}, {}, {}
+
+    for node_id, node in nodes.items():
+        circ = connected_preprocessing(node.get_subcircuit())
+        hashed = canonical_hash(circ, max_leaves=index.max_leaves, return_labels=True)
+        entry = None if hashed is None else index.get(hashed[0])
+        pairs = None if entry is None else canonical_mapping(entry["circuit"], entry["labels"], circ, hashed[1])
+
+        if pairs is None:
+            misses[node_id] = node
+            if hashed is not None: miss_data[node_id] = (*hashed, circ)
+            continue
+
+        mapping = list(map(lambda pair : pair[1], pairs))
+        hits.setdefault(hashed[0], {})[node_id] = mapping
+        index.add_member(hashed[0], f"{source}{node_id}", mapping)
+
+    return hits, misses, miss_data
+
+def hit_class(node_ids: List[int], mappings: Dict[int, List[int]]) -> Tuple[List[int], List[List[int]]]:
+    """
+    An equivalence class of nodes mapped onto the same representative, with the mappings relative to the first node as in
+    naive_equivalency_analysis
+
+    Parameters
+    -----------
+        node_ids: List[int]
+            The nodes of the class
+        mappings: Dict[int, List[int]]
+            The mapping of each node onto the representative, from indexed_equivalency
+
+    Return
+    ---------
+    Tuple[List[int], List[List[int]]]
+        The class, and for each but the first node the constraint mapped to by each constraint of the first node, in order
+    """
+    reference = mappings[node_ids[0]]
+    return node_ids, [list(map(lambda pair : pair[1], sorted(zip(reference, mappings[node_id])))) for node_id in node_ids[1:]]
+
+def index_classes(index: FingerprintIndex, classes: List[List[int]], mappings: List[List[List[int]]], miss_data: Dict[int, Tuple[str, Dict[int, int], Circuit]], source: str = "") -> None:
+    """
+    Adds the representative of each class found without the index, and the mappings of its other members
+
+    Parameters
+    -----------
+        index: FingerprintIndex
+            The index
+        classes: List[List[int]]
+            Equivalence classes of nodes, the first node of each is the representative
+        mappings: List[List[List[int]]]
+            The mappings of each class as returned by naive_equivalency_analysis
+        miss_data: Dict[int, Tuple[str, Dict[int, int], Circuit]]
+            The data of the nodes not found, from indexed_equivalency. Classes whose representative is not in miss_data are skipped
+        source: str
+            Prefix of the node ids recorded in the index. Default empty
+    """
+    for class_, class_mappings in zip(classes, mappings):
+        if class_[0] not in miss_data: continue
+        hash_, labels, circ = miss_data[class_[0]]
+        index.add(hash_, circ, labels, f"{source}{class_[0]}")
+        for node_id, mapping in zip(class_[1:], class_mappings): index.add_member(hash_, f"{source}{node_id}", mapping)
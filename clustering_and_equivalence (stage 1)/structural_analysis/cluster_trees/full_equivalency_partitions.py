@@ -6,8 +6,9 @@
     # 3. keep fingerprint information to pass to comparison_v2
 
     # TODO: alter testing_harness without all the baggage from not using v2s
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Callable, Iterable
 import itertools
+import multiprocessing
 from collections import deque
 
 from structural_analysis.cluster_trees.dag_from_clusters import DAGNode
@@ -16,48 +17,121 @@ from utilities.assignment import Assignment
 from comparison_v2.fingerprinting_v2 import back_and_forth_fingerprinting
 from utilities.utilities import _signal_data_from_cons_list
 
-from structural_analysis.cluster_trees.equivalent_partitions import naive_equivalency_analysis, class_iterated_label_passing
+from structural_analysis.cluster_trees.equivalent_partitions import naive_equivalency_analysis, canonical_equivalency_analysis, class_iterated_label_passing
+from structural_analysis.cluster_trees.fingerprint_index import FingerprintIndex, indexed_equivalency, hit_class, index_classes
 
-def subcircuit_fingerprinting_equivalency(nodes: Dict[int, DAGNode], time_limit: int = 0):
-    
-    subcircuit_groups, fingerprints_to_normi, fingerprints_to_signals = fingerprint_subcircuits(nodes)
+# NOTE: the group analysis is shared with the worker processes by forking, which requires unix
+_GROUP_EQUIVALENCY: Callable | None = None
+
+def _group_equivalency_worker(keylist: List[int]) -> Tuple[List[List[int]], List[List[List[int]]]]:
+    return _GROUP_EQUIVALENCY(keylist)
+
+def _map_groups(group_equivalency: Callable[[List[int]], Tuple[List[List[int]], List[List[List[int]]]]], groups: Iterable[List[int]], jobs: int = 1) -> List[Tuple[List[List[int]], List[List[List[int]]]]]:
+    """
+    maps group_equivalency over the groups of node ids, in a pool of jobs processes if jobs > 1. The groups are independent so the
+    results are the same as the serial map, in group order. The nodes and fingerprints are inherited by the workers when forked and
+    only the classes and mappings are sent back. Larger groups are started first so that one large group does not finish last.
+    """
+    global _GROUP_EQUIVALENCY
+
+    groups = list(groups)
+    if jobs <= 1 or len(groups) <= 1: return list(map(group_equivalency, groups))
+
+    order = sorted(range(len(groups)), key = lambda i : -len(groups[i]))
+    results = [None for _ in groups]
+
+    _GROUP_EQUIVALENCY = group_equivalency
+    try:
+        with multiprocessing.get_context('fork').Pool(min(jobs, len(groups))) as pool:
+            for i, result in zip(order, pool.imap(_group_equivalency_worker, map(groups.__getitem__, order), chunksize=1)): results[i] = result
+    finally:
+        _GROUP_EQUIVALENCY = None
+
+    return results
+
+def subcircuit_fingerprinting_equivalency(nodes: Dict[int, DAGNode], time_limit: int = 0, canonical_hashing: bool = False, 
+                                          index: FingerprintIndex | None = None, index_source: str = "", jobs: int = 1):
+    """
+    if an index is given, nodes found in it are classed by their entry without fingerprinting or comparison, and the classes of the
+    remaining nodes are added to it. index_source prefixes the node ids recorded in the index.
+
+    if jobs > 1 the fingerprint groups are analysed in a pool of jobs processes, see _map_groups
+    """
 
     equivalent = []
     mappings = []
 
-    deque(maxlen = 0,
-          iterable = itertools.starmap(lambda equiv, mapp : [equivalent.extend(equiv), mappings.extend(mapp)],
-                     map(lambda nodes_subset : naive_equivalency_analysis(nodes_subset, time_limit, fingerprints_to_normi = fingerprints_to_normi, fingerprints_to_signals = fingerprints_to_signals),
-                     map(lambda keylist: {key: nodes[key] for key in keylist},
-                     subcircuit_groups.values()              
-         )))
-    )
+    if index is not None:
+        hits, nodes, miss_data = indexed_equivalency(nodes, index, index_source)
+        for hash_mappings in hits.values():
+            class_, class_mappings = hit_class(list(hash_mappings.keys()), hash_mappings)
+            equivalent.append(class_)
+            mappings.append(class_mappings)
+
+    if len(nodes) > 0:
+        subcircuit_groups, fingerprints_to_normi, fingerprints_to_signals = fingerprint_subcircuits(nodes)
+        equivalency_analysis = canonical_equivalency_analysis if canonical_hashing else naive_equivalency_analysis
+
+        def group_equivalency(keylist: List[int]) -> Tuple[List[List[int]], List[List[List[int]]]]:
+            return equivalency_analysis({key: nodes[key] for key in keylist}, time_limit, fingerprints_to_normi = fingerprints_to_normi, fingerprints_to_signals = fingerprints_to_signals)
+
+        deque(maxlen = 0,
+            iterable = itertools.starmap(lambda equiv, mapp : [equivalent.extend(equiv), mappings.extend(mapp)],
+                        _map_groups(group_equivalency, subcircuit_groups.values(), jobs)
+            )
+        )
+
+    if index is not None:
+        index_classes(index, equivalent, mappings, miss_data, index_source)
+        index.save()
 
     return equivalent, mappings
 
-def subcircuit_fingerprint_with_structural_augmentation_equivalency(nodes: Dict[int, DAGNode], time_limit: int = 0):
-    
-    subcircuit_groups, fingerprints_to_normi, fingerprints_to_signals = fingerprint_subcircuits(nodes)
+def subcircuit_fingerprint_with_structural_augmentation_equivalency(nodes: Dict[int, DAGNode], time_limit: int = 0, canonical_hashing: bool = False,
+                                                                   index: FingerprintIndex | None = None, index_source: str = "", jobs: int = 1):
+    """
+    if an index is given, the nodes found in it are grouped by entry instead of by fingerprint. Label passing only refines these groups
+    so each structural group of found nodes is a class without comparison. See subcircuit_fingerprinting_equivalency, also for jobs
+    """
+
+    hits, unindexed, miss_data = indexed_equivalency(nodes, index, index_source) if index is not None else ({}, nodes, {})
+    node_to_hit = {node_id: hash_mappings for hash_mappings in hits.values() for node_id in hash_mappings.keys()}
+
+    subcircuit_groups, fingerprints_to_normi, fingerprints_to_signals = fingerprint_subcircuits(unindexed) if len(unindexed) > 0 else ({}, {}, {})
+    equivalency_analysis = canonical_equivalency_analysis if canonical_hashing else naive_equivalency_analysis
+
+    # each entry found is an initial group of its own
+    first_hit_label = max(subcircuit_groups.keys(), default=0) + 1
+    subcircuit_groups.update({first_hit_label + i: list(hash_mappings.keys()) for i, hash_mappings in enumerate(hits.values())})
     structural_labels = class_iterated_label_passing(nodes, subcircuit_groups)
 
+    def group_equivalency(keylist: List[int]) -> Tuple[List[List[int]], List[List[List[int]]]]:
+        if keylist[0] in node_to_hit:
+            class_, class_mappings = hit_class(keylist, node_to_hit[keylist[0]])
+            return [class_], [class_mappings]
+        return equivalency_analysis({key: nodes[key] for key in keylist}, time_limit, fingerprints_to_normi = fingerprints_to_normi, fingerprints_to_signals = fingerprints_to_signals)
+
     equivalent = []
     mappings = []
 
     deque(maxlen = 0,
           iterable = itertools.starmap(lambda equiv, mapp : [equivalent.extend(equiv), mappings.extend(mapp)],
-                     map(lambda nodes_subset : naive_equivalency_analysis(nodes_subset, time_limit, fingerprints_to_normi = fingerprints_to_normi, fingerprints_to_signals = fingerprints_to_signals),
-                     map(lambda keylist: {key: nodes[key] for key in keylist},
-                     structural_labels.values()              
-         )))
+                     _map_groups(group_equivalency, structural_labels.values(), jobs)
+         )
     )
 
+    if index is not None:
+        index_classes(index, equivalent, mappings, miss_data, index_source)
+        index.save()
+
     equivalent, mappings = propagate_subcirctuit_labels(nodes, equivalent, mappings)
 
     return equivalent, mappings
 
-def subcircuit_fingerprinting_equivalency_and_structural_augmentation_equivalency(nodes: Dict[int, DAGNode], time_limit: int = 0):
+def subcircuit_fingerprinting_equivalency_and_structural_augmentation_equivalency(nodes: Dict[int, DAGNode], time_limit: int = 0, canonical_hashing: bool = False,
+                                                                                  index: FingerprintIndex | None = None, index_source: str = "", jobs: int = 1):
 
-    local_equivalent, local_mappings = subcircuit_fingerprinting_equivalency(nodes, time_limit)
+    local_equivalent, local_mappings = subcircuit_fingerprinting_equivalency(nodes, time_limit, canonical_hashing, index, index_source, jobs)
     full_equivalent, full_mappings = propagate_subcirctuit_labels(nodes, local_equivalent, local_mappings)
     
     return local_equivalent, local_mappings, full_equivalent, full_mappings
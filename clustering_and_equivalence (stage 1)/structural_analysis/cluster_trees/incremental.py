@@ -0,0 +1,340 @@
+"""
+Incremental re-clustering of a new version of a circuit from the clustering of a previous version, as written by an earlier run of cluster.py.
+
+Constraints and signals of the two versions are matched by hashes of their neighbourhoods, so the constraints an edit leaves untouched are
+matched even when the edit renumbers them, see match_circuits. Matched constraints start Leiden in the cluster they were in before.
+A node made of the same constraints as a previous node, with the same subcircuit under the matching, keeps the equivalence class of the previous node, so
+only the other nodes and one representative of each previous class are analysed.
+"""
+
+from typing import List, Dict, Tuple, Hashable, Callable, Iterable, Set
+from collections import Counter, deque
+import itertools
+import json
+import numpy as np
+
+from circuits_and_constraints.abstract_circuit import Circuit
+from circuits_and_constraints.abstract_constraint import Constraint
+from structural_analysis.cluster_trees.dag_from_clusters import DAGNode
+from utilities.utilities import _signal_data_from_cons_list
+
+# the radius of the neighbourhoods hashed, edits change the hashes of constraints within this many steps so they are not matched
+DEFAULT_MATCH_ROUNDS = 2
+
+def neighbourhood_hashes(circ: Circuit, rounds: int = DEFAULT_MATCH_ROUNDS, signal_to_coni: Dict[int, List[int]] | None = None) -> Tuple[List[int], Dict[int, Tuple[int, int]]]:
+    """
+    Hashes of the constraints and signals of circ that only depend on the constraints within rounds steps and not on their indices.
+
+    Signals start with their type, then each round hashes each constraint by Constraint.fingerprint of its signal hashes and each signal
+    by its hash and the sorted hashes of its constraints. Signal hashes are pairs as Constraint.fingerprint expects.
+
+    Parameters
+    -----------
+        circ: Circuit
+            The circuit
+        rounds: int
+            The number of rounds. Default DEFAULT_MATCH_ROUNDS
+        signal_to_coni: Dict[int, List[int]] | None
+            The constraints of each signal if already computed. Default None
+
+    Return
+    ---------
+    List[int]
+        The hash of each constraint
+    Dict[int, Tuple[int, int]]
+        The hash of each signal in a constraint
+    """
+    if signal_to_coni is None: signal_to_coni = _signal_data_from_cons_list(circ.constraints)
+    signal_hashes = {sig: (0, 1 if circ.signal_is_output(sig) else 2 if circ.signal_is_input(sig) else 3) for sig in signal_to_coni.keys()}
+
+    for _ in range(rounds):
+        constraint_hashes = [hash(con.fingerprint(signal_hashes)) for con in circ.constraints]
+        signal_hashes = {sig: (0, hash((signal_hashes[sig], tuple(sorted(map(constraint_hashes.__getitem__, conis)))))) for sig, conis in signal_to_coni.items()}
+
+    return [hash(con.fingerprint(signal_hashes)) for con in circ.constraints], signal_hashes
+
+def _match_by_hash(old_hashes: Dict[int, Hashable], new_hashes: Dict[int, Hashable]) -> Dict[int, int]:
+    "pairs the keys with each hash in increasing order, so a shift in numbering keeps the order of repeated templates"
+    old_by_hash = {}
+    for key in sorted(old_hashes.keys()): old_by_hash.setdefault(old_hashes[key], []).append(key)
+
+    matching, used = {}, {}
+    for key in sorted(new_hashes.keys()):
+        candidates = old_by_hash.get(new_hashes[key], [])
+        i = used.get(new_hashes[key], 0)
+        if i < len(candidates):
+            matching[key] = candidates[i]
+            used[new_hashes[key]] = i + 1
+    return matching
+
+def _unique_pairs(new_items: Iterable[int], old_items: Iterable[int], new_hash: Callable[[int], Hashable], old_hash: Callable[[int], Hashable], 
+                  new_matched: Dict[int, int], old_matched: Set[int]) -> List[Tuple[int, int]]:
+    "the pairs of unmatched items whose hash is that of exactly one unmatched item on each side"
+    new_by_hash, old_by_hash = {}, {}
+    for item in new_items:
+        if item not in new_matched: new_by_hash.setdefault(new_hash(item), []).append(item)
+    for item in old_items:
+        if item not in old_matched: old_by_hash.setdefault(old_hash(item), []).append(item)
+    return [(items[0], old_by_hash[hash_][0]) for hash_, items in new_by_hash.items() if len(items) == 1 and len(old_by_hash.get(hash_, [])) == 1]
+
+def match_circuits(previous_circ: Circuit, circ: Circuit, rounds: int = DEFAULT_MATCH_ROUNDS) -> Tuple[Dict[int, int], Dict[int, int]]:
+    """
+    Matches the constraints and signals of circ to those of previous_circ with the same neighbourhood hash.
+
+    Constraints whose hash is unique in both circuits are matched first. Matches are then extended from each matched constraint to its
+    signals, and from each matched signal to its constraints, wherever a hash is that of a single unmatched candidate on each side, so
+    repeated templates are matched outward from the unique parts of the circuit and an edit does not shift the matching of the templates
+    after it. Signals of a constraint are told apart by their coefficients as well as their hash. Each constraint and signal is extended from at most once. Items left unmatched are paired by hash in increasing order.
+
+    Parameters
+    -----------
+        previous_circ: Circuit
+            The previous version
+        circ: Circuit
+            The current version
+        rounds: int
+            The radius of the hashes, see neighbourhood_hashes. Default DEFAULT_MATCH_ROUNDS
+
+    Return
+    ---------
+    Dict[int, int]
+        The matched constraint of previous_circ for each matched constraint of circ
+    Dict[int, int]
+        The matched signal of previous_circ for each matched signal of circ, the constant signal 0 is matched to itself
+    """
+    old_signal_to_coni, new_signal_to_coni = _signal_data_from_cons_list(previous_circ.constraints), _signal_data_from_cons_list(circ.constraints)
+    old_constraints, old_signals = neighbourhood_hashes(previous_circ, rounds, old_signal_to_coni)
+    new_constraints, new_signals = neighbourhood_hashes(circ, rounds, new_signal_to_coni)
+
+    constraint_match, signal_match = {}, {0: 0}
+    old_matched_constraints, old_matched_signals = set([]), set([0])
+    queue = deque()
+
+    old_counts, new_counts = Counter(old_constraints), Counter(new_constraints)
+    old_unique = {hash_: coni for coni, hash_ in enumerate(old_constraints) if old_counts[hash_] == 1}
+    for coni, hash_ in enumerate(new_constraints):
+        if new_counts[hash_] == 1 and hash_ in old_unique: queue.append((True, coni, old_unique[hash_]))
+    for _, coni, old_coni in queue:
+        constraint_match[coni] = old_coni
+        old_matched_constraints.add(old_coni)
+
+    while len(queue) > 0:
+        is_constraint, item, old_item = queue.popleft()
+        if is_constraint:
+            new_roles, old_roles = circ.constraints[item].signal_roles(), previous_circ.constraints[old_item].signal_roles()
+            for sig, old_sig in _unique_pairs(new_roles.keys(), old_roles.keys(), lambda sig : (new_signals[sig], new_roles[sig]), 
+                                              lambda sig : (old_signals[sig], old_roles[sig]), signal_match, old_matched_signals):
+                signal_match[sig] = old_sig
+                old_matched_signals.add(old_sig)
+                queue.append((False, sig, old_sig))
+        else:
+            for coni, old_coni in _unique_pairs(new_signal_to_coni[item], old_signal_to_coni[old_item], new_constraints.__getitem__, 
+                                                old_constraints.__getitem__, constraint_match, old_matched_constraints):
+                constraint_match[coni] = old_coni
+                old_matched_constraints.add(old_coni)
+                queue.append((True, coni, old_coni))
+
+    constraint_match.update(_match_by_hash({coni: hash_ for coni, hash_ in enumerate(old_constraints) if coni not in old_matched_constraints},
+                                           {coni: hash_ for coni, hash_ in enumerate(new_constraints) if coni not in constraint_match}))
+    signal_match.update(_match_by_hash({sig: hash_ for sig, hash_ in old_signals.items() if sig not in old_matched_signals},
+                                       {sig: hash_ for sig, hash_ in new_signals.items() if sig not in signal_match}))
+
+    return constraint_match, signal_match
+
+class PreviousClustering():
+    """
+    The clustering of a previous version of a circuit, matched to the current version.
+
+    Attributes
+    -----------
+        circ: Circuit
+            The previous version
+        nodes: Dict[int, Dict[str, any]]
+            The nodes of the previous clustering by node id, as written to the JSON
+        node_of: np.ndarray
+            The node id of each constraint of the previous version, -1 if in no node
+        classes: List[List[int]] | None
+            The local equivalence classes of the previous nodes, or the structural classes if there are no local classes
+        mappings: List[List[List[int]]] | None
+            The mappings of the classes, None if not in the JSON
+        constraint_match: np.ndarray
+            The matched constraint of the previous version for each constraint of the current version, -1 if unmatched
+        signal_match: Dict[int, int]
+            The matched signal of the previous version for each matched signal of the current version
+    """
+
+    def __init__(self, clustering_file: str, previous_circ: Circuit, circ: Circuit, rounds: int = DEFAULT_MATCH_ROUNDS):
+        """
+        Constructor for PreviousClustering
+
+        Parameters
+        -----------
+            clustering_file: str
+                A single JSON written by cluster.py for previous_circ, without --dont-undo-mapping
+            previous_circ: Circuit
+                The previous version
+            circ: Circuit
+                The current version
+            rounds: int
+                The radius of the hashes matching constraints, see match_circuits. Default DEFAULT_MATCH_ROUNDS
+        """
+        with open(clustering_file, 'r') as f: clustering = json.load(f)
+        if "nodes" not in clustering: raise ValueError(f"{clustering_file} is not a single clustering JSON")
+
+        self.circ = previous_circ
+        self.nodes = {node["node_id"]: node for node in clustering["nodes"]}
+        self.node_of = np.full(previous_circ.nConstraints, -1, dtype=np.int64)
+        for node_id, node in self.nodes.items(): self.node_of[node["constraints"]] = node_id
+
+        equivalence = next((equiv for equiv in ["local", "structural"] if f"equivalency_{equiv}" in clustering), None)
+        self.classes = None if equivalence is None else clustering[f"equivalency_{equivalence}"]
+        self.mappings = None if equivalence is None else clustering.get(f"equiv_mapping_{equivalence}", None)
+
+        constraint_match, self.signal_match = match_circuits(previous_circ, circ, rounds)
+        self.constraint_match = np.full(circ.nConstraints, -1, dtype=np.int64)
+        self.constraint_match[list(constraint_match.keys())] = list(constraint_match.values())
+
+    def initial_membership(self, coni_inverse: List[int] | None, nvertices: int) -> List[int]:
+        """
+        The initial membership for Leiden of a graph of a preprocessed part of the current version, each matched constraint is in the
+        part of its previous node and every other vertex is alone.
+
+        Parameters
+        -----------
+            coni_inverse: List[int] | None
+                The constraint of the current version for each constraint of the preprocessed part, None if not preprocessed
+            nvertices: int
+                The number of vertices of the graph, the vertices after the constraints are alone
+
+        Return
+        ---------
+        List[int]
+            The part of each vertex
+        """
+        previous = np.full(nvertices, -1, dtype=np.int64)
+        matched = self.constraint_match if coni_inverse is None else self.constraint_match[coni_inverse]
+        previous[:len(matched)][matched >= 0] = self.node_of[matched[matched >= 0]]
+
+        # parts are renumbered from 0, unplaced vertices get parts after them
+        _, membership = np.unique(previous, return_inverse=True)
+        unplaced = np.flatnonzero(previous < 0)
+        has_unplaced = len(unplaced) > 0
+        membership = membership - has_unplaced
+        membership[unplaced] = membership.max(initial=-1) + 1 + np.arange(len(unplaced))
+        return membership.tolist()
+
+    def unchanged_nodes(self, nodes: Dict[int, DAGNode], coni_inverse: List[int] | None, sig_inverse: Dict[int, int] | None) -> Dict[int, Tuple[int, List[int]]]:
+        """
+        The nodes that are a previous node under the matching: they have the constraints of the previous node, the same subcircuit when
+        the signals are renamed by signal_match, and the same input and output signals.
+
+        Parameters
+        -----------
+            nodes: Dict[int, DAGNode]
+                The nodes of a preprocessed part of the current version
+            coni_inverse: List[int] | None
+                The constraint of the current version for each constraint of the preprocessed part, None if not preprocessed
+            sig_inverse: Dict[int, int] | None
+                The signal of the current version for each signal of the preprocessed part, None if not preprocessed
+
+        Return
+        ---------
+        Dict[int, Tuple[int, List[int]]]
+            For each unchanged node, the previous node and the position in the previous node of each of its constraints
+        """
+        unchanged = {}
+        for node_id, node in nodes.items():
+            old_conis = self.constraint_match[node.constraints if coni_inverse is None else [coni_inverse[coni] for coni in node.constraints]]
+            if len(old_conis) == 0 or (old_conis < 0).any(): continue
+            old_id = int(self.node_of[old_conis[0]])
+            old_node = self.nodes.get(old_id, None)
+            if old_node is None or (self.node_of[old_conis] != old_id).any() or len(old_node["constraints"]) != len(old_conis): continue
+
+            # signals without a match are renamed to negative signals so they match no previous signal
+            rename = lambda sig : self.signal_match.get(sig if sig_inverse is None else sig_inverse[sig], -1 - sig)
+            if (set(map(rename, node.input_signals)) != set(old_node["input_signals"])
+                or set(map(rename, node.output_signals)) != set(old_node["output_signals"])): continue
+
+            renaming = {sig: rename(sig) for sig in set(itertools.chain.from_iterable(map(lambda coni : node.circ.constraints[coni].signals(), node.constraints)))}
+            if all(node.circ.constraints[coni].relabelled(renaming) == self.circ.constraints[old_coni].relabelled({})
+                   for coni, old_coni in zip(node.constraints, old_conis.tolist())):
+                position = {old_coni: i for i, old_coni in enumerate(old_node["constraints"])}
+                unchanged[node_id] = (old_id, list(map(position.__getitem__, old_conis.tolist())))
+
+        return unchanged
+
+def _compose(first: List[int], second: List[int]) -> List[int]:
+    "the mapping first then second, mappings give the position mapped to by each position"
+    return list(map(second.__getitem__, first))
+
+def _invert(mapping: List[int]) -> List[int]:
+    inverse = [None for _ in mapping]
+    for i, j in enumerate(mapping): inverse[j] = i
+    return inverse
+
+def incremental_equivalency(
+        nodes: Dict[int, DAGNode],
+        previous: PreviousClustering,
+        unchanged: Dict[int, Tuple[int, List[int]]],
+        equivalency: Callable[[Dict[int, DAGNode]], Tuple[List[List[int]], List[List[List[int]]]]],
+        with_mappings: bool = True
+    ) -> Tuple[List[List[int]], List[List[List[int]]]]:
+    """
+    The local equivalence classes of nodes, analysing only the changed nodes and one unchanged node of each previous class.
+
+    Each unchanged node not analysed is equivalent to the analysed node of its previous class, so joins its class. As each previous class
+    has one node analysed the classes are those of analysing every node, though the order of classes and members may differ.
+
+    Parameters
+    -----------
+        nodes: Dict[int, DAGNode]
+            The nodes
+        previous: PreviousClustering
+            The previous clustering, with classes
+        unchanged: Dict[int, Tuple[int, List[int]]]
+            The unchanged nodes, from PreviousClustering.unchanged_nodes
+        equivalency: Callable[[Dict[int, DAGNode]], Tuple[List[List[int]], List[List[List[int]]]]]
+            The local equivalence analysis, as subcircuit_fingerprinting_equivalency
+        with_mappings: bool
+            Flag for whether to return the mappings of the classes, these need the mappings of the previous clustering. Default True
+
+    Return
+    ---------
+    List[List[int]]
+        The classes
+    List[List[List[int]]]
+        The mappings of the classes as the equivalency analysis, empty lists if not with_mappings
+    """
+    if previous.classes is None: raise ValueError("The previous clustering has no equivalence classes")
+    if with_mappings and previous.mappings is None: raise ValueError("The previous clustering has no mappings, run it with mappings")
+
+    # the previous class of each previous node, and the mapping from the first node of the class
+    old_class = {}
+    for classi, class_ in enumerate(previous.classes):
+        for i, old_id in enumerate(class_):
+            old_class[old_id] = (classi, None if not with_mappings else list(range(len(previous.nodes[old_id]["constraints"]))) if i == 0 else previous.mappings[classi][i-1])
+
+    representatives, followers = {}, {}
+    for node_id, (old_id, _) in unchanged.items():
+        classi = old_class[old_id][0]
+        if classi in representatives: followers.setdefault(representatives[classi], []).append(node_id)
+        else: representatives[classi] = node_id
+
+    analysed = {node_id: node for node_id, node in nodes.items() if node_id not in unchanged or node_id in representatives.values()}
+    classes, mappings = equivalency(analysed)
+
+    # mappings between positions of unchanged nodes go through the first node of their previous class
+    def mapping_between(node_id, other_id) -> List[int]:
+        (old_id, positions), (other_old_id, other_positions) = unchanged[node_id], unchanged[other_id]
+        to_node, to_other = old_class[old_id][1], old_class[other_old_id][1]
+        return _compose(_compose(_compose(positions, _invert(to_node)), to_other), _invert(other_positions))
+
+    for class_, class_mappings in zip(classes, mappings):
+        for i, node_id in enumerate(list(class_)):
+            for follower in followers.get(node_id, []):
+                class_.append(follower)
+                if not with_mappings: continue
+                from_first = list(range(len(nodes[class_[0]].constraints))) if i == 0 else class_mappings[i-1]
+                class_mappings.append(_compose(from_first, mapping_between(node_id, follower)))
+
+    return classes, mappings if with_mappings else [[] for _ in classes]
@@ -0,0 +1,135 @@
+"""
+Coarsening of the shared signal graph before community detection.
+
+Much of a compiled circuit is wiring: chains of linear constraints copying a signal and constraints that only pass a signal from one
+constraint to the next. Each maximal chain of these constraints is contracted, together with the neighbour it shares the most signals with,
+into a single vertex of a coarse graph. Edges between contracted vertices are summed and the edges inside them kept as self-loops, so the
+modularity of a partition of the coarse graph is that of its projection onto the original graph, and clustering the coarse graph only
+removes the partitions that would split the wiring from its neighbour.
+"""
+
+from typing import List, Tuple
+import igraph as ig
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+
+from circuits_and_constraints.abstract_circuit import Circuit
+
+def pass_through_constraints(circ: Circuit, graph: ig.Graph) -> np.ndarray:
+    """
+    The constraints contracted by coarsening_groups, those adjacent to at most two other constraints. These include the chains of linear
+    constraints x = y that copy a signal from one template to the next, and the constraints only used by one other, as each bit of a
+    binary decomposition.
+
+    Linear constraints copying a signal into several constraints are not contracted. They are as attracted to the template of the signal
+    as to each template using it, and joining them to either lost more modularity than the smaller graph saved.
+
+    Parameters
+    -----------
+        circ: Circuit
+            The circuit
+        graph: ig.Graph
+            The shared signal graph of circ, its vertices after the constraints (such as hub vertices) are never contracted
+
+    Return
+    ---------
+    np.ndarray
+        Boolean mask of the vertices of graph
+    """
+    nconstraints = len(circ.constraints)
+    passing = np.zeros(graph.vcount(), dtype=bool)
+    passing[:nconstraints] = np.array(graph.degree()[:nconstraints]) <= 2
+    return passing
+
+def coarsening_groups(circ: Circuit, graph: ig.Graph, edges: np.ndarray, weight: np.ndarray) -> np.ndarray:
+    """
+    The coarse vertex of each vertex of graph.
+
+    The connected components of the pass-through constraints are chains. Each chain joins the other constraint it has the greatest total
+    edge weight to, the lowest such constraint on ties, and every other vertex is a coarse vertex of its own. A chain never joins another
+    chain, so no two constraints that are not pass-through share a coarse vertex.
+
+    Parameters
+    -----------
+        circ: Circuit
+            The circuit
+        graph: ig.Graph
+            The shared signal graph of circ
+        edges: np.ndarray
+            The edges of graph as an array of shape (number of edges, 2)
+        weight: np.ndarray
+            The weight of each edge
+
+    Return
+    ---------
+    np.ndarray
+        The coarse vertex of each vertex, numbered from 0 in order of first vertex
+    """
+    nvertices, nconstraints = graph.vcount(), len(circ.constraints)
+    passing = pass_through_constraints(circ, graph)
+    inside = passing[edges[:, 0]] & passing[edges[:, 1]]
+
+    _, chain = connected_components(sparse.coo_matrix((np.ones(int(inside.sum())), (edges[inside, 0], edges[inside, 1])), shape=(nvertices, nvertices)), directed=False)
+
+    # edges from a chain to a constraint outside it, oriented (pass-through, other)
+    leaving = passing[edges[:, 0]] != passing[edges[:, 1]]
+    inner = np.where(passing[edges[leaving, 0]], edges[leaving, 0], edges[leaving, 1])
+    outer = np.where(passing[edges[leaving, 0]], edges[leaving, 1], edges[leaving, 0])
+    keep = outer < nconstraints
+    attraction = sparse.coo_matrix((weight[leaving][keep], (chain[inner[keep]], outer[keep])), shape=(nvertices, nvertices)).tocsr()
+
+    # the heaviest entry of each row, the argmax of scipy loops over the rows in python
+    rows = np.repeat(np.arange(nvertices), np.diff(attraction.indptr))
+    order = np.lexsort((attraction.indices, -attraction.data, rows))
+    first = order[np.flatnonzero(np.diff(rows[order], prepend=-1))]
+    target = np.full(nvertices, -1, dtype=np.int64)
+    target[rows[first]] = attraction.indices[first]
+
+    groups = np.where(target[chain] >= 0, chain[np.maximum(target[chain], 0)], chain)
+    _, first, groups = np.unique(groups, return_index=True, return_inverse=True)
+    return np.argsort(np.argsort(first, kind="stable"), kind="stable")[groups]
+
+def coarsen_graph(circ: Circuit, graph: ig.Graph, weights: str | None = "weight") -> Tuple[ig.Graph, np.ndarray]:
+    """
+    The graph with the vertices of each group of coarsening_groups contracted into one.
+
+    Parameters
+    -----------
+        circ: Circuit
+            The circuit
+        graph: ig.Graph
+            The shared signal graph of circ
+        weights: str | None
+            The edge attribute of the weights, None for an unweighted graph. Default "weight"
+
+    Return
+    ---------
+    ig.Graph
+        The coarse graph, its "weight" edge attribute the summed weight of the edges between groups, including a self-loop for the edges
+        inside a group, and its "size" vertex attribute the number of vertices of each group
+    np.ndarray
+        The coarse vertex of each vertex of graph
+    """
+    edges = np.array(graph.get_edgelist(), dtype=np.int64).reshape(-1, 2)
+    weight = np.ones(len(edges)) if weights is None else np.array(graph.es[weights], dtype=np.float64)
+    groups = coarsening_groups(circ, graph, edges, weight)
+    ngroups = int(groups.max(initial=-1)) + 1
+
+    ends = groups[edges]
+    # duplicate edges are summed by the conversion
+    coarse = sparse.coo_matrix((weight, (ends.min(axis=1), ends.max(axis=1))), shape=(ngroups, ngroups)).tocsr().tocoo()
+
+    # igraph converts numpy arrays element by element, iterating python ints is several times faster
+    coarse_graph = ig.Graph(n=ngroups, edges=zip(coarse.row.tolist(), coarse.col.tolist()), edge_attrs={"weight": coarse.data.tolist()},
+                            vertex_attrs={"size": np.bincount(groups, minlength=ngroups).tolist()})
+    return coarse_graph, groups
+
+def coarsen_membership(membership: List[int], groups: np.ndarray) -> List[int]:
+    "A membership of the coarse graph from one of the original graph, each coarse vertex in the part of its first vertex"
+    _, first = np.unique(groups, return_index=True)
+    return np.unique(np.asarray(membership)[first], return_inverse=True)[1].tolist()
+
+def project_clustering(clustering: ig.VertexClustering, graph: ig.Graph, groups: np.ndarray, weights: str | None = "weight") -> ig.VertexClustering:
+    "The clustering of graph that puts each vertex in the part of its coarse vertex, with modularity measured by weights"
+    return ig.VertexClustering(graph, np.asarray(clustering.membership)[groups].tolist(), modularity_params={"weights": weights})
@@ -1,35 +1,74 @@
 import igraph as ig
-import itertools
 import math
 import numpy as np
 
-def iterated_louvain(G: ig.Graph, max_iterations: int = 100, init_resolution: int = 1, res_tolerance: float = 1.0, seed : int | None = None):
+from structural_analysis.clustering_methods.leiden import leiden_clustering
 
-    RNG = np.random.RandomState(seed)
+def iterated_louvain(
+        G: ig.Graph, 
+        max_iterations: int = 100, 
+        init_resolution: float = 1, 
+        res_tolerance: float = 1.0, 
+        seed : int | None = None,
+        n_iterations: int = 2,
+        warm_start: bool = True
+    ):
+    """
+    Leiden clustering at the fixpoint of the resolution estimate of Newman (2016), the resolution at which the partition is the maximum
+    likelihood fit of a planted partition model.
 
-    res = init_resolution
-    for niter in range(max_iterations):
+    Each iteration clusters at the current resolution and estimates the next from the edges within and between the parts. The counts are
+    made over the edge list and membership as arrays, so each iteration is linear in the edges outside of Leiden.
 
-        partition = G.community_leiden(objective_function='modularity', resolution=res)
+    Parameters
+    -----------
+        G: ig.Graph
+            The graph to cluster, edge weights are ignored
+        max_iterations: int
+            The maximum number of resolutions tried. Default 100
+        init_resolution: float
+            The first resolution. Default 1
+        res_tolerance: float
+            The iteration stops once the resolution changes by less than this. Default 1.0
+        seed: int | None
+            The seed of every Leiden run, see leiden_clustering. Default None
+        n_iterations: int
+            The number of iterations of each Leiden run. Default 2
+        warm_start: bool
+            Flag for whether each Leiden run starts from the partition of the previous. Default True
+    
+    Return
+    ---------
+    ig.VertexClustering
+        The partition at the final resolution
+    float
+        The final resolution
+    """
+    edges = np.array(G.get_edgelist(), dtype=np.int64).reshape(-1, 2)
+    degrees = np.array(G.degree(), dtype=np.float64)
+    twice_edges = 2 * len(edges)
 
-        # edges in is doubled but doubled in equation so unfixed
-        edges_in = 0
-        twice_edges = len(G.es) * 2
-        degree_sq_sum = 0
-        
-        for part in partition:
+    res, membership = init_resolution, None
+    for niter in range(max_iterations):
 
-            in_pair = {v : True for v in part}
-            degree_sq_sum += sum(G.degree(part))**2
+        partition = leiden_clustering(G, res, seed=seed, n_iterations=n_iterations, weights=None, initial_membership=membership if warm_start else None)
+        membership = partition.membership
+        if twice_edges == 0: break
 
-            edges_in += sum(1 for _ in filter(lambda ov : in_pair.get(ov, False), itertools.chain.from_iterable(map(lambda v : G.neighbours , part))))
+        parts = np.asarray(membership)
+        # edges in is doubled but doubled in equation so unfixed
+        edges_in = 2 * np.count_nonzero(parts[edges[:, 0]] == parts[edges[:, 1]])
+        # the estimate is undefined without edges both within and between parts
+        if edges_in == 0 or edges_in == twice_edges: break
+        degree_sq_sum = np.square(np.bincount(parts, weights=degrees)).sum()
 
         omega_in = edges_in * (twice_edges / degree_sq_sum)
         omega_out = (twice_edges - edges_in) / (twice_edges - degree_sq_sum / twice_edges)
-    
+
+        if omega_in == omega_out: break
         newres = (omega_in - omega_out) / (math.log(omega_in) - math.log(omega_out))
 
         if abs(res - newres) < res_tolerance: break
         res = newres
 
-    return partition, res
\ No newline at end of file
+    return partition, res
@@ -0,0 +1,156 @@
+"""
+Seeded Leiden clustering of constraint graphs with igraph, the default clustering of cluster.py, and sweeps of it over resolutions and
+seeds run in parallel on a single graph
+"""
+
+from typing import List, Dict, Tuple
+import itertools
+import multiprocessing
+import random
+import time
+import igraph as ig
+import numpy as np
+
+# NOTE: the graph of a sweep is shared with the worker processes by forking, which requires unix
+_SWEEP_GRAPH: ig.Graph | None = None
+
+def leiden_clustering(
+        graph: ig.Graph,
+        resolution: float = 1,
+        resolution_schedule: List[float] | None = None,
+        seed: int | None = None,
+        n_iterations: int = -1,
+        weights: str | None = "weight",
+        initial_membership: List[int] | None = None
+    ) -> ig.VertexClustering:
+    """
+    Leiden modularity optimisation of graph, deterministic for a given seed.
+
+    igraph draws its random numbers from a single generator shared by the whole process, which is replaced by a generator seeded with
+    seed for the duration of the call. The result is therefore independent of any other use of the random module, but calls must not
+    be made from several threads at once.
+
+    Parameters
+    -----------
+        graph: ig.Graph
+            The graph to cluster
+        resolution: float
+            The resolution of the modularity. Default 1
+        resolution_schedule: List[float] | None
+            Factors of resolution to run Leiden at in turn, each run starting from the partition of the previous. An increasing schedule
+            refines a coarse partition, a decreasing one merges a fine one. Default None, a single run at resolution
+        seed: int | None
+            The seed of the random choices of Leiden, None for an unseeded generator. Default None
+        n_iterations: int
+            The number of iterations of each run, negative to iterate until the partition is stable. Default -1
+        weights: str | None
+            The edge attribute of the weights, None for an unweighted graph. Default "weight"
+        initial_membership: List[int] | None
+            The partition the first run starts from, None to start from singletons. Default None
+
+    Return
+    ---------
+    ig.VertexClustering
+        The clustering of the final run
+    """
+    if resolution_schedule is not None and len(resolution_schedule) == 0: raise ValueError("Empty resolution schedule")
+
+    # the default node weights of igraph leave out self-loops, which is not the modularity of a graph with contracted vertices
+    node_weights = graph.strength(weights = weights)
+    membership = initial_membership
+    ig.set_random_number_generator(random.Random(seed))
+    try:
+        for factor in ([1] if resolution_schedule is None else resolution_schedule):
+            clustering = graph.community_leiden(objective_function = "modularity", weights = weights, resolution = resolution * factor,
+                                                initial_membership = membership, n_iterations = n_iterations, node_weights = node_weights)
+            membership = clustering.membership
+    finally:
+        ig.set_random_number_generator(random)
+
+    return clustering
+
+def _vertex_sizes(graph: ig.Graph) -> np.ndarray:
+    "the number of original vertices of each vertex, the size attribute of a graph from coarsening.coarsen_graph and otherwise 1"
+    return np.array(graph.vs["size"] if "size" in graph.vs.attributes() else np.ones(graph.vcount()))
+
+def _sweep_run(args: Tuple[float, int, List[float] | None, int, str | None]) -> Tuple[Dict[str, any], np.ndarray]:
+    resolution, seed, resolution_schedule, n_iterations, weights = args
+    start = time.time()
+    clustering = leiden_clustering(_SWEEP_GRAPH, resolution, resolution_schedule, seed, n_iterations, weights)
+    seconds = time.time() - start
+
+    sizes = np.bincount(clustering.membership, weights=_vertex_sizes(_SWEEP_GRAPH))
+    record = {
+        "resolution": resolution, "seed": seed, "clusters": len(sizes), "largest_cluster": int(sizes.max(initial=0)),
+        "modularity": _SWEEP_GRAPH.modularity(clustering.membership, weights=weights),
+        "quality": _SWEEP_GRAPH.modularity(clustering.membership, weights=weights, resolution=resolution * (1 if resolution_schedule is None else resolution_schedule[-1])),
+        "time": seconds
+    }
+    return record, np.array(clustering.membership, dtype=np.int32)
+
+def leiden_sweep(
+        graph: ig.Graph,
+        resolutions: List[float],
+        seeds: List[int],
+        resolution_schedule: List[float] | None = None,
+        n_iterations: int = -1,
+        weights: str | None = "weight",
+        expected_size: float | None = None,
+        jobs: int = 1
+    ) -> Tuple[ig.VertexClustering, List[Dict[str, any]]]:
+    """
+    Runs leiden_clustering for every pair of resolution and seed and chooses one clustering.
+
+    The graph is built once and shared with the worker processes by forking, only the memberships are sent back.
+
+    Parameters
+    -----------
+        graph: ig.Graph
+            The graph to cluster
+        resolutions: List[float]
+            The resolutions to run at
+        seeds: List[int]
+            The seeds to run with
+        resolution_schedule: List[float] | None
+            The schedule of every run, see leiden_clustering. Default None
+        n_iterations: int
+            The number of iterations of each run, see leiden_clustering. Default -1
+        weights: str | None
+            The edge attribute of the weights, None for an unweighted graph. Default "weight"
+        expected_size: float | None
+            If given the run whose mean cluster size is closest is chosen, otherwise the run of highest modularity. Default None
+        jobs: int
+            The number of processes running Leiden, if 1 the runs are made in this process. Default 1
+
+    Return
+    ---------
+    ig.VertexClustering
+        The chosen clustering
+    List[Dict[str, any]]
+        A record of each run in order of resolution then seed, with the fields "resolution", "seed", "clusters", "largest_cluster",
+        "modularity" at resolution 1, "quality" the modularity at the final resolution of the run, "time" and "chosen"
+    """
+    global _SWEEP_GRAPH
+
+    runs = [(resolution, seed, resolution_schedule, n_iterations, weights) for resolution, seed in itertools.product(resolutions, seeds)]
+    if len(runs) == 0: raise ValueError("Empty sweep")
+
+    _SWEEP_GRAPH = graph
+    try:
+        if jobs <= 1 or len(runs) == 1:
+            results = list(map(_sweep_run, runs))
+        else:
+            with multiprocessing.get_context('fork').Pool(min(jobs, len(runs))) as pool:
+                results = pool.map(_sweep_run, runs)
+    finally:
+        _SWEEP_GRAPH = None
+
+    records = [record for record, _ in results]
+    if expected_size is None:
+        chosen = max(range(len(records)), key = lambda i : records[i]["modularity"])
+    else:
+        nvertices = _vertex_sizes(graph).sum()
+        chosen = min(range(len(records)), key = lambda i : abs(nvertices / records[i]["clusters"] - expected_size))
+    for i, record in enumerate(records): record["chosen"] = i == chosen
+
+    return ig.VertexClustering(graph, results[chosen][1].tolist()), records
@@ -1,14 +1,116 @@
 from typing import Iterable, List, Tuple, Dict, Set
 import itertools
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
 
 from utilities.utilities import UnionFind, _signal_data_from_cons_list
 from circuits_and_constraints.abstract_circuit import Circuit
 from circuits_and_constraints.abstract_constraint import Constraint
+from structural_analysis.utilities.constraint_graph import incidence_matrix
+
+def _rows(matrix: sparse.csr_matrix, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    "the (index into rows, column) pairs of the nonzero entries of the rows of matrix"
+    lengths = matrix.indptr[rows + 1] - matrix.indptr[rows]
+    source = np.repeat(np.arange(len(rows)), lengths)
+    offsets = np.arange(len(source)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return source, matrix.indices[matrix.indptr[rows][source] + offsets]
+
+def _neighbours(incidence: sparse.csr_matrix, signal_incidence: sparse.csr_matrix, coni: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    "the (index into coni, adjacent constraint) pairs of the constraints coni, with repeats for constraints sharing several signals"
+    source, signals = _rows(incidence, coni)
+    signal_source, adjacent = _rows(signal_incidence, signals)
+    return source[signal_source], adjacent
 
 def nonlinear_attract_clustering(circ: Circuit, pre_merge: bool = False):
     """
     Clustering Method
 
+    Process
+    --------
+        step 1:
+            place adjacent nonlinears into a cluster
+        step 2: 
+            iteratively check adjacent constraints
+            if cons adjacent to only cluster then attract
+            otherwise leave alone
+    
+    The adjacency of constraints is read from the constraint x signal incidence matrix and its transpose. Step 1 is the connected
+    components of the bipartite graph of nonlinear constraints and their signals. Step 2 keeps a frontier of the constraints attracted
+    in the last round, and each round only examines the linear constraints adjacent to the frontier, as nonlinear_attract_clustering_unionfind
+
+    To Improve
+    --------
+        non-adjacent nonlinear can never be in the same class
+        leads to very small clusters typically
+        need to think of some point at which we can merge clusters
+        TODO: for large circuits like test_ecdsa, nonlinear attract seems to have lower quality clusters (one very big cluster)
+
+    Parameters
+    ----------
+        circ: Circuit
+            the input circuit to cluster
+        pre_merge: bool
+            if True step 1 also places every constraint adjacent to a nonlinear constraint in its cluster
+    
+    Returns
+    ----------
+    (Dict[int, List[int]], None, None)
+        The clusters in dictionary form, keyed by their smallest constraint, and 2 None object to keep the same number of returns as 
+        previous Clustering Methods
+    """
+    nconstraints = len(circ.constraints)
+    incidence = incidence_matrix(circ.constraints)
+    signal_incidence = incidence.T.tocsr()
+    nsignals = incidence.shape[1]
+    nonlinear = np.fromiter((con.is_nonlinear() for con in circ.constraints), dtype=bool, count=nconstraints)
+
+    # Step 1: place adjacent nonlinears into a cluster, through the signals of the nonlinear constraints
+    rows = np.repeat(np.arange(nconstraints), np.diff(incidence.indptr))
+    linked = nonlinear[rows]
+    if pre_merge:
+        # NOTE: we do not want only nonlinear clusters so we merge the first adjacency of linear clusters as well
+        linked = np.zeros(nsignals, dtype=bool)
+        linked[incidence.indices[nonlinear[rows]]] = True
+        linked = linked[incidence.indices]
+    bipartite = sparse.coo_matrix((np.ones(int(linked.sum())), (rows[linked], nconstraints + incidence.indices[linked])), shape=(nconstraints + nsignals,) * 2)
+    _, component = connected_components(bipartite, directed=False)
+
+    clustered = np.zeros(nconstraints, dtype=bool)
+    clustered[np.isin(component[:nconstraints], component[:nconstraints][nonlinear])] = True
+    cluster_of = np.full(nconstraints, -1, dtype=np.int64)
+    members = np.flatnonzero(clustered)
+    _, first, cluster_of[members] = np.unique(component[members], return_index=True, return_inverse=True)
+    keys = members[first]
+
+    # Step 2: repeatedly attract the unclustered linear constraints adjacent to the constraints clustered in the last round that are adjacent
+    #   to only 1 cluster among them
+    frontier, attracted = members, [members]
+    while len(frontier) > 0:
+        source, adjacent = _neighbours(incidence, signal_incidence, frontier)
+        candidate = cluster_of[adjacent] == -1
+        pairs = np.unique(np.stack([adjacent[candidate], cluster_of[frontier][source[candidate]]]), axis=1)
+        coni, counts = np.unique(pairs[0], return_counts=True)
+        attract = np.isin(pairs[0], coni[counts == 1])
+
+        frontier, cluster_of[pairs[0, attract]] = pairs[0, attract], pairs[1, attract]
+        attracted.append(frontier)
+
+    # each cluster in the order its constraints were attracted
+    attracted = np.concatenate(attracted)
+    attracted = attracted[np.argsort(cluster_of[attracted], kind="stable")]
+    bounds = [0, *(np.flatnonzero(np.diff(cluster_of[attracted])) + 1).tolist(), len(attracted)]
+    # slicing one list is much faster than splitting the array when most clusters are small
+    attracted = attracted.tolist()
+    clusters = {key: attracted[start:end] for key, start, end in zip(keys.tolist(), bounds, bounds[1:])}
+
+    return clusters, None, None
+
+def nonlinear_attract_clustering_unionfind(circ: Circuit, pre_merge: bool = False):
+    """
+    The original implementation of nonlinear_attract_clustering over sets and a UnionFind, which recomputes the adjacency of each
+    constraint it visits. Kept as the reference of benchmarks.nonlinear_attract
+
     Process
     --------
         step 1:
@@ -3,21 +3,29 @@
 Fixes compiler bug where some circuits aren't a single connected component
 
 """
-from typing import List, Tuple
+from typing import List, Tuple, Dict
 import itertools
 import json
-from collections import deque
+import multiprocessing
+import numpy as np
+from scipy.sparse.csgraph import connected_components
 
 from circuits_and_constraints.abstract_circuit import Circuit
 from circuits_and_constraints.abstract_constraint import Constraint
 
-from utilities.utilities import _signal_data_from_cons_list, _distances_to_signal_set
+from utilities.graph_kernels import bipartite_matrix, reachable
+from structural_analysis.utilities.constraint_graph import incidence_matrix
 
 DEBUG_PRINT_LEVEL = 2
 
+# NOTE: the circuit is shared with the worker processes taking subcircuits by forking, which requires unix
+_COMPONENT_CIRCUIT: Circuit | None = None
+
 def connected_preprocessing(circ: Circuit, return_mapping: bool = False) -> Circuit | Tuple[Circuit, List[int | None]]:
     """
-    Given an input circuit removes all constraints not connected to any inputs
+    Given an input circuit removes all constraints not connected to any inputs or outputs
+
+    The signals kept are those reachable from an input or output in the bipartite graph of constraints and signals
 
     Parameters
     ----------
@@ -31,28 +39,78 @@ def connected_preprocessing(circ: Circuit, return_mapping: bool = False) -> Circ
     Circuit | (Circuit, List[int | None])
         Always returns the new circuit that contains only connected components with inputs
     """
-    sig_to_coni = _signal_data_from_cons_list(circ.constraints)
+    incidence = incidence_matrix(circ.constraints, max(circ.get_signals(), default=-1) + 1)
+    nconstraints = incidence.shape[0]
 
-    dist_from_inputs = _distances_to_signal_set(circ.constraints, circ.get_input_signals(), sig_to_coni)
-    dist_from_outputs = _distances_to_signal_set(circ.constraints, circ.get_output_signals(), sig_to_coni)
+    sources = itertools.chain(circ.get_input_signals(), circ.get_output_signals())
+    reached = reachable(bipartite_matrix(incidence), map(lambda sig : nconstraints + sig, sources))
 
-    next_int = itertools.count().__next__
-    remapp = {k : next_int() for k in sorted(set(dist_from_inputs.keys()).union(dist_from_outputs.keys()))}
-    cons_subset = list(filter(lambda coni : all(map(lambda sig : remapp.get(sig, None) != None, circ.constraints[coni].signals())), range(circ.nConstraints)))
+    remapp = {sig : i for i, sig in enumerate(np.flatnonzero(reached[nconstraints:]).tolist())}
+    # a constraint is reached with its signals, constraints without signals are kept as before
+    cons_subset = np.flatnonzero(reached[:nconstraints] | (np.diff(incidence.indptr) == 0)).tolist()
 
     new_circ, remapp = circ.take_subcircuit(cons_subset, signal_map=remapp, return_signal_mapping=True)
 
     return new_circ if not return_mapping else (new_circ, remapp)
 
-def componentwise_preprocessing(circ: Circuit, minimum_circuit_size: int = 100, output_automatic_clusters: bool = True, debug: False = False) -> Tuple[List[Circuit], List[Tuple[int,int] | None], List[Tuple[int,int] | None]]:
+def _take_component(args: Tuple[List[int], Dict[int, int]]) -> Tuple[Circuit, Dict[int, int]]:
+    constraints, signal_map = args
+    return _COMPONENT_CIRCUIT.take_subcircuit(constraints, signal_map=signal_map, return_signal_mapping=True)
+
+def connected_components_of_signals(circ: Circuit) -> Tuple[List[List[int]], List[List[int]]]:
+    """
+    The connected components of the circuit, as the components of the bipartite graph of constraints and signals found in a single pass
+    over the incidence matrix
+
+    Parameters
+    ----------
+        circ: Circuit
+            the input circuit
+
+    Returns
+    ----------
+    (signals_by_component, constraints_by_component)
+        the sorted signals and sorted constraints of each component in order of smallest signal, a signal in no constraint is a component
+        of its own and constraints without signals are in no component
+    """
+    signals = np.fromiter(circ.get_signals(), dtype=np.int64)
+    incidence = incidence_matrix(circ.constraints, int(signals.max(initial=-1)) + 1)
+    nconstraints = incidence.shape[0]
+
+    _, component = connected_components(bipartite_matrix(incidence), directed=False)
+
+    # each component is sliced from one sorted list, splitting arrays is much slower when most components are small
+    signals = np.sort(signals)
+    signals = signals[np.argsort(component[nconstraints + signals], kind="stable")]
+    labels = component[nconstraints + signals]
+    starts = np.flatnonzero(np.diff(labels, prepend=-1))
+    ends = np.append(starts[1:], len(signals))
+    by_smallest = np.argsort(signals[starts], kind="stable")
+
+    constraints = np.argsort(component[:nconstraints], kind="stable")
+    constraint_starts = np.searchsorted(component[constraints], labels[starts], side="left")
+    constraint_ends = np.searchsorted(component[constraints], labels[starts], side="right")
+
+    signals, constraints = signals.tolist(), constraints.tolist()
+    signals_by_component = [signals[start:end] for start, end in zip(starts[by_smallest].tolist(), ends[by_smallest].tolist())]
+    constraints_by_component = [constraints[start:end] for start, end in zip(constraint_starts[by_smallest].tolist(), constraint_ends[by_smallest].tolist())]
+
+    return signals_by_component, constraints_by_component
+
+def componentwise_preprocessing(circ: Circuit, minimum_circuit_size: int = 100, output_automatic_clusters: bool = True, debug: False = False, jobs: int = 1) -> Tuple[List[Circuit], List[Tuple[int,int] | None], List[Tuple[int,int] | None]]:
     """
     Like connected_preprocessing but additionally splits circuit up into different circuits connected components
     Does not modify input circuit
 
+    The components are found by connected_components_of_signals, and the subcircuits of the components above minimum_circuit_size are
+    taken in a pool of jobs processes
+
     Parameters
     ----------
         circ: Circuit
             the input circuit
+        jobs: int
+            the number of processes taking subcircuits, if 1 they are taken in this process. Default 1
 
     Returns 
     ----------
@@ -67,45 +125,37 @@ def componentwise_preprocessing(circ: Circuit, minimum_circuit_size: int = 100,
         
             a list of where each constraint was mapped to (form (i,j): circuit i, new constraint j)
     """
+    global _COMPONENT_CIRCUIT
 
     if debug >= DEBUG_PRINT_LEVEL: print("------------------ preprocessing --------------------")
 
-    signal_to_conis = _signal_data_from_cons_list(circ.constraints)
-    signals = set(circ.get_signals())
-
-    signals_by_component = []
-
-    # TODO: sets? anything better?
-    while len(signals) > 0:
-        if debug: print(len(signals), "           ", end='\r')
-        next_signal = next(iter(signals))
+    signals_by_component, constraints_by_component = connected_components_of_signals(circ)
+    if debug >= DEBUG_PRINT_LEVEL: print(f"{len(signals_by_component)} components")
 
-        dist_from_signal = _distances_to_signal_set(circ.constraints, [next_signal], signal_to_conis)
-        signals_by_component.append(sorted(dist_from_signal.keys())) # sorted to maintain output/input relationships
+    is_io = lambda sig : circ.signal_is_input(sig) or circ.signal_is_output(sig)
 
-        signals.difference_update(dist_from_signal.keys())
-
-    circuits = []
     minimum_size_clusterings = []
-    coni_inverse = []
-    sig_inverse = []
-
-    i = -1
-    for signals in filter(lambda signals: any(map(lambda sig : circ.signal_is_input(sig) or circ.signal_is_output(sig), signals)), signals_by_component):
-        if debug >= DEBUG_PRINT_LEVEL: print(f"processing component {i+1} of {len(signals_by_component)}", "           ", end='\r')
-        
-        constraints = list(set(itertools.chain.from_iterable(map(lambda sig : signal_to_conis.get(sig, []), signals))))
-        if len(constraints) == 0: continue
+    components = []
+    for signals, constraints in zip(signals_by_component, constraints_by_component):
+        if len(constraints) == 0 or not any(map(is_io, signals)): continue
         elif len(constraints) <= minimum_circuit_size: 
             if output_automatic_clusters: minimum_size_clusterings.append(constraints)
             continue
-        i += 1
-
-        next_circuit, signal_map = circ.take_subcircuit(constraints, signal_map={sig: cnt for cnt, sig in enumerate(signals)}, return_signal_mapping=True)
-        
-        sig_inverse.append({val : key for key, val in signal_map.items()})
-        coni_inverse.append(constraints)
-        circuits.append(next_circuit)
+        components.append((constraints, {sig: cnt for cnt, sig in enumerate(signals)})) # sorted to maintain output/input relationships
+
+    _COMPONENT_CIRCUIT = circ
+    try:
+        if jobs <= 1 or len(components) <= 1:
+            subcircuits = list(map(_take_component, components))
+        else:
+            with multiprocessing.get_context('fork').Pool(min(jobs, len(components))) as pool:
+                subcircuits = pool.map(_take_component, components, chunksize = max(1, len(components) // (4 * jobs)))
+    finally:
+        _COMPONENT_CIRCUIT = None
+
+    circuits = [next_circuit for next_circuit, _ in subcircuits]
+    sig_inverse = [{val : key for key, val in signal_map.items()} for _, signal_map in subcircuits]
+    coni_inverse = [constraints for constraints, _ in components]
 
     if debug >= DEBUG_PRINT_LEVEL: print("------------------ end preprocessing --------------------")
 
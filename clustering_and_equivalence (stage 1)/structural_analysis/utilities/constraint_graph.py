@@ -1,14 +1,20 @@
 
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Iterable
+from collections import Counter
 import igraph as ig
 import networkx as nx
-from itertools import combinations
+import numpy as np
+from scipy import sparse
+from itertools import combinations, chain
 
 from circuits_and_constraints.abstract_constraint import Constraint
 from circuits_and_constraints.abstract_circuit import Circuit
 
 from utilities.utilities import _signal_data_from_cons_list
 
+# ways of adding the signals of degree above the hub threshold to the graph, see shared_signal_graph_sparse
+HUB_STRATEGIES = ["drop", "hub", "sparsify"]
+
 def shared_signal_graph_igraph(circ: Circuit) -> ig.Graph:
     """
     Given an input list of constraints, returns a igraph graph.
@@ -37,10 +43,169 @@ def shared_signal_graph_igraph(circ: Circuit) -> ig.Graph:
         for pair in map(pair_to_num, combinations(signal_to_coni[signal], r = 2)):
             weights[pair] = weights.get(pair, 0) + 1
 
-    graph.add_edges(map(num_to_pair, weights.keys()), attributes={"weight": weights.values()})
+    graph.add_edges(map(num_to_pair, weights.keys()), attributes={"weight": list(weights.values())})
 
     return graph
 
+def incidence_matrix(cons: List[Constraint], nsignals: int = 0) -> sparse.csr_matrix:
+    """
+    The sparse constraint x signal incidence matrix, entry (i, j) is 1 if signal j is in constraint i
+
+    Parameters
+    ----------
+        cons: List[Constraint]
+            List of constraints
+        nsignals: int
+            The least number of columns, for signals in no constraint. Default 0
+    Returns
+    ----------
+    sparse.csr_matrix
+        The len(cons) x max(nsignals, maximum signal + 1) incidence matrix
+    """
+    signals = [con.signals() for con in cons]
+    lengths = np.fromiter(map(len, signals), dtype=np.int64, count=len(signals))
+    cols = np.fromiter(chain.from_iterable(signals), dtype=np.int64, count=int(lengths.sum()))
+    rows = np.repeat(np.arange(len(signals), dtype=np.int64), lengths)
+
+    return sparse.csr_matrix((np.ones(len(cols), dtype=np.int32), (rows, cols)), shape=(len(signals), max(nsignals, int(cols.max(initial=0)) + 1)))
+
+def shared_signal_graph_sparse(circ: Circuit, hub_threshold: int | None = None, hub_strategy: str = "drop", seed: int = 0) -> ig.Graph:
+    """
+    The graph of :func:`shared_signal_graph_igraph`, built by the sparse matrix product M M^T of the incidence matrix M rather than by
+    enumerating the pairs of constraints of each signal in Python.
+
+    The edges are in row-major order of the upper triangle of M M^T, so differ in order from shared_signal_graph_igraph.
+
+    A signal in d constraints adds d(d-1)/2 edges, so a few hub signals can dominate the graph. Signals in more than hub_threshold
+    constraints are instead added by hub_strategy:
+        "drop": the hub signals add no edges, constraints left without edges are reattached by constraint_partition
+        "hub": each hub signal is an auxiliary vertex adjacent to its constraints, after the constraint vertices
+        "sparsify": each hub signal adds hub_threshold // 2 random cycles through its constraints, weighted so that the weighted degree
+            of each constraint is as in the clique
+    The hub signals and strategy are stored as the graph attributes "hub_signals" and "hub_strategy".
+
+    Parameters
+    ----------
+        circ: Circuit
+            The circuit
+        hub_threshold: int | None
+            The largest degree of a signal added as a clique, None for no limit. Default None
+        hub_strategy: str
+            One of HUB_STRATEGIES. Default "drop"
+        seed: int
+            The seed of the random cycles of "sparsify". Default 0
+    Returns
+    ----------
+    ig.Graph
+        Vertices in the graph are constraint, edges are between constraints with a shared non-constant signal weighted by the number
+        of shared signals
+    """
+    if hub_strategy not in HUB_STRATEGIES: raise ValueError(f"Unknown hub strategy {hub_strategy}, expected one of {HUB_STRATEGIES}")
+
+    incidence = incidence_matrix(circ.constraints).tocsc()
+    nconstraints = incidence.shape[0]
+    degrees = np.diff(incidence.indptr)
+    hubs = np.empty(0, dtype=np.int64) if hub_threshold is None else np.flatnonzero(degrees > hub_threshold)
+
+    if len(hubs) > 0: 
+        incidence, hub_incidence = incidence[:, degrees <= hub_threshold], incidence[:, hubs]
+    shared = sparse.triu(incidence @ incidence.T, k=1, format="coo")
+
+    nvertices = nconstraints + (len(hubs) if hub_strategy == "hub" else 0)
+    if len(hubs) > 0 and hub_strategy != "drop":
+        rows, cols, weights = [shared.row], [shared.col], [shared.data.astype(np.float64)]
+        rng = np.random.default_rng(seed)
+        rounds = max(1, hub_threshold // 2)
+
+        for i in range(len(hubs)):
+            coni = hub_incidence.indices[hub_incidence.indptr[i]:hub_incidence.indptr[i+1]]
+            if hub_strategy == "hub":
+                rows.append(coni)
+                cols.append(np.full(len(coni), nconstraints + i))
+                weights.append(np.ones(len(coni)))
+                continue
+            for _ in range(rounds):
+                cycle = rng.permutation(coni)
+                rows.append(np.minimum(cycle, np.roll(cycle, -1)))
+                cols.append(np.maximum(cycle, np.roll(cycle, -1)))
+                weights.append(np.full(len(coni), (len(coni) - 1) / (2 * rounds)))
+
+        # duplicate edges are summed by the conversion
+        shared = sparse.coo_matrix((np.concatenate(weights), (np.concatenate(rows), np.concatenate(cols))), shape=(nvertices, nvertices)).tocsr().tocoo()
+
+    # igraph converts numpy arrays element by element, iterating python ints is several times faster
+    graph = ig.Graph(n=nvertices, edges=zip(shared.row.tolist(), shared.col.tolist()), edge_attrs={"weight": shared.data.tolist()})
+    graph["hub_signals"], graph["hub_strategy"] = hubs.tolist(), hub_strategy
+    return graph
+
+def partition_from_membership(membership: Iterable[int]) -> List[List[int]]:
+    """
+    The nonempty parts of a membership vector, in order of part index with each part sorted.
+
+    Vertices are grouped by a stable argsort rather than appended one at a time, so the only Python-level work is making the lists.
+
+    Parameters
+    ----------
+        membership: Iterable[int]
+            The part index of each vertex, as VertexClustering.membership
+    Returns
+    ----------
+    List[List[int]]
+        The parts
+    """
+    membership = np.asarray(membership, dtype=np.int64)
+    order = np.argsort(membership, kind="stable")
+    bounds = np.flatnonzero(np.diff(membership[order])) + 1
+    return [part.tolist() for part in np.split(order, bounds)] if len(order) > 0 else []
+
+def constraint_partition(partition: Iterable[Iterable[int]] | ig.VertexClustering, circ: Circuit, graph: ig.Graph) -> List[List[int]]:
+    """
+    The partition of the constraints from a partition of the vertices of a graph from shared_signal_graph_sparse.
+
+    Hub vertices are removed. For the "drop" strategy, each constraint with hub signals and no edges joins the most common part of the
+    other constraints of its first hub signal, or a new part shared with the other such constraints if there are none.
+
+    Parameters
+    ----------
+        partition: Iterable[Iterable[int]] | ig.VertexClustering
+            The partition of the vertices of graph, a VertexClustering is read from its membership without iterating its parts
+        circ: Circuit
+            The circuit the graph was built from
+        graph: ig.Graph
+            The graph
+    Returns
+    ----------
+    List[List[int]]
+        The nonempty parts, restricted to constraints
+    """
+    nconstraints = len(circ.constraints)
+    if isinstance(partition, ig.VertexClustering):
+        part_of = np.array(partition.membership, dtype=np.int64)
+    else:
+        part_of = np.empty(graph.vcount(), dtype=np.int64)
+        for parti, part in enumerate(partition): part_of[list(part)] = parti
+    nparts = int(part_of.max(initial=-1)) + 1
+
+    if graph["hub_strategy"] == "drop" and len(graph["hub_signals"]) > 0:
+        hub_incidence = incidence_matrix(circ.constraints).tocsc()[:, graph["hub_signals"]]
+        isolated = np.array(graph.degree()[:nconstraints]) == 0
+        reattached = np.zeros(nconstraints, dtype=bool)
+
+        for i in range(len(graph["hub_signals"])):
+            coni = hub_incidence.indices[hub_incidence.indptr[i]:hub_incidence.indptr[i+1]]
+            unplaced = coni[isolated[coni] & ~reattached[coni]]
+            if len(unplaced) == 0: continue
+
+            attached = coni[~isolated[coni]]
+            if len(attached) > 0: 
+                target = Counter(part_of[attached].tolist()).most_common(1)[0][0]
+            else: 
+                target, nparts = nparts, nparts + 1
+            part_of[unplaced] = target
+            reattached[unplaced] = True
+
+    return partition_from_membership(part_of[:nconstraints])
+
 def shared_signal_graph_nx(cons: List[Constraint], names: List[int] | None = None) -> nx.Graph:
     """
     Given an input list of constraints, returns a networkx graph.
@@ -1,51 +1,80 @@
 from typing import Tuple
 
+import os
 import time
+import math
 import json
 import signal # NOTE: use of signal as a timeout handler requires unix
 from contextlib import contextmanager
-from typing import Dict
+from typing import Dict, Callable
 
 from circuits_and_constraints.abstract_circuit import Circuit
 
 from circuit_shuffle import get_r1cs_circuits
 from comparison_v2.compare_circuits_v2 import circuit_equivalence
-
-class TimeoutException(Exception): pass
+from utilities.deadline import Deadline, TimeoutException
 
 @contextmanager
 def time_limit(seconds):
+    """
+    Signal based time limit for code that does not check a Deadline, only usable in the main thread.
+    An enclosing time_limit is restored on exit, and still fires if it expires first. If it expired while its alarm was replaced by
+    this one it fires on exit, and it never fires twice.
+    """
     def signal_handler(signum, frame):
         raise TimeoutException(f"Timed Out after {seconds} seconds")
-    signal.signal(signal.SIGALRM, signal_handler)
-    signal.alarm(seconds)
+    start = time.time()
+    previous_handler = signal.signal(signal.SIGALRM, signal_handler)
+    previous_alarm = signal.alarm(seconds)
+    # whether the enclosing alarm, expiring first, is the one running inside
+    outer_running = previous_alarm and (not seconds or previous_alarm < seconds)
+    if outer_running:
+        signal.signal(signal.SIGALRM, previous_handler)
+        signal.alarm(previous_alarm)
     try:
         yield
     finally:
+        left = signal.getitimer(signal.ITIMER_REAL)[0]
         signal.alarm(0)
+        signal.signal(signal.SIGALRM, previous_handler)
+        if outer_running:
+            # nothing left means the enclosing alarm has already fired
+            if left > 0: signal.alarm(math.ceil(left))
+        elif previous_alarm:
+            remaining = previous_alarm - (time.time() - start)
+            if remaining > 0: signal.alarm(math.ceil(remaining))
+            else: signal.raise_signal(signal.SIGALRM)
 
 def exception_catcher(
     in_pair,
     test_data: Dict[str, any] = {},
     debug: bool = False,
     time_limit_seconds: int = 0, # 0 means no limit
+    comparison: Callable = circuit_equivalence,
     **kwargs
     ):   
+    """
+    runs comparison, recording any exception in test_data. The time limit is a Deadline passed to comparison, nested within any
+    deadline in kwargs, so comparison must accept a deadline argument. If a TimeoutException is raised the limit hit, wall clock or
+    a budget in kwargs, is recorded as "limit_hit"
+    """
 
     start = time.time()
+    deadline = Deadline(time_limit_seconds, parent=kwargs.pop("deadline", None))
     try:
-        with time_limit(time_limit_seconds):
-            circuit_equivalence(
-                in_pair,
-                test_data,
-                debug=debug,
-                **kwargs
-            )
+        comparison(
+            in_pair,
+            test_data,
+            debug=debug,
+            deadline=deadline,
+            **kwargs
+        )
     except Exception as e:
         # print(e)
         test_data["result"] = False
         test_data["result_explanation"] = repr(e)
         test_data["timing"]["error_time"] = time.time() - start
+        if isinstance(e, TimeoutException): test_data["limit_hit"] = e.limit
 
     return test_data
     
@@ -92,12 +121,12 @@ def quick_compare(
     **kwargs
 ) -> bool:
     try:
-        with time_limit(time_limit_seconds):
-            data = circuit_equivalence(
-                [lpair, rpair],
-                debug=debug,
-                **kwargs
-            )
+        data = circuit_equivalence(
+            [lpair, rpair],
+            debug=debug,
+            deadline=Deadline(time_limit_seconds, parent=kwargs.pop("deadline", None)),
+            **kwargs
+        )
     except TimeoutException:
         return False
     return data["result"]
@@ -108,8 +137,13 @@ def run_current_best_test(
     rfilename: str,
     outfile: str,
     time_limit: int = 0,
-    debug: bool = True
+    debug: bool = True,
+    proof: bool = False
     ):
+    """
+    compares the two circuit files writing the test_data to outfile. If proof, a non-equivalence verdict is stored with a DRAT proof
+    next to outfile, to be checked by check_proofs.py
+    """
 
     circ, circs = Circuit(), Circuit()
 
@@ -121,7 +155,8 @@ def run_current_best_test(
     test_data = exception_catcher(
         in_pair,
         debug=debug,
-        time_limit_seconds=time_limit
+        time_limit_seconds=time_limit,
+        proof_prefix=os.path.splitext(outfile)[0] if proof else None
     )
 
     f = open(outfile, "w")
@@ -0,0 +1,25 @@
+"""
+Checks of batch_compare.batch_equivalence on generated circuits.
+
+Run from the directory above with
+
+    python -m pytest tests
+"""
+
+from benchmarks.coarsening import wired_circuit
+from circuit_shuffle import shuffle_signals, shuffle_constraints
+from batch_compare import batch_equivalence
+
+def library():
+    "An identical copy of the query, a shuffled copy, and a circuit of other templates rejected by its invariants"
+    shuffled = wired_circuit(20, 4)
+    shuffle_signals(shuffled, seed=1)
+    shuffle_constraints(shuffled, seed=2)
+    return [("copy", wired_circuit(20, 4)), ("shuffled", shuffled), ("other", wired_circuit(20, 5))]
+
+def test_batch_with_time_limit():
+    records = {record["name"]: record for record in batch_equivalence(("query", wired_circuit(20, 4)), library(), time_limit=30)}
+    for name in ["copy", "shuffled"]:
+        assert records[name]["stage"] == "sat"
+        assert records[name]["result"], records[name]["result_explanation"]
+    assert not records["other"]["result"]
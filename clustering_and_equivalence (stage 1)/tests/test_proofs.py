@@ -0,0 +1,36 @@
+"""
+Checks of the bundled DRAT checker of comparison_v2.proofs on proofs of the solvers comparisons use.
+
+Run from the directory above with
+
+    python -m pytest tests
+"""
+
+import pytest
+from pysat.examples.genhard import PHP
+from pysat.solvers import Solver
+from comparison_v2.proofs import store_proof, check_proof, check_drat, read_dimacs, read_drat
+
+@pytest.mark.parametrize("holes", [4, 5, 6])
+def test_bundled_checker_glucose_proof(tmp_path, holes):
+    # glucose deletes clauses satisfied at the top level, some of them the reasons of top level units
+    formula = PHP(holes)
+    prefix = str(tmp_path / f"php{holes}")
+    formula.to_file(f"{prefix}.cnf")
+    with Solver(name='glucose4', bootstrap_with=formula.clauses, with_proof=True) as solver:
+        files = store_proof(prefix, solver, solver.solve())
+
+    assert files is not None
+    result = check_proof(files["formula"], files["proof"], checker=None)
+    assert result["checker"] == "bundled"
+    assert result["verified"]
+
+def test_bundled_checker_rejects_truncated_proof(tmp_path):
+    formula = PHP(4)
+    prefix = str(tmp_path / "php4")
+    formula.to_file(f"{prefix}.cnf")
+    with Solver(name='glucose4', bootstrap_with=formula.clauses, with_proof=True) as solver:
+        files = store_proof(prefix, solver, solver.solve())
+
+    lemmas = [step for step in read_drat(files["proof"]) if not step[0]]
+    assert not check_drat(read_dimacs(files["formula"]), lemmas[:len(lemmas) // 2])
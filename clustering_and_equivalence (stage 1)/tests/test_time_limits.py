@@ -0,0 +1,45 @@
+"""
+Regression checks that a time limit does not change the verdict of a comparison that finishes within it.
+
+Run from the directory above with
+
+    python -m pytest tests
+"""
+
+from benchmarks.coarsening import wired_circuit
+from circuit_shuffle import shuffle_signals, shuffle_constraints
+from testing_harness import exception_catcher, quick_compare
+from utilities.deadline import Deadline
+from utilities.budget import Budget, default_solver_name
+from comparison_v2.comparison_session import ComparisonSession
+
+def equivalent_pair():
+    "A generated circuit and a shuffled copy, with symmetric bits so the comparison reaches the SAT solver"
+    left, right = wired_circuit(20, 4), wired_circuit(20, 4)
+    shuffle_signals(right, seed=1)
+    shuffle_constraints(right, seed=2)
+    return [("left", left), ("right", right)]
+
+def test_default_solver_name():
+    assert default_solver_name() == 'cadical195'
+    assert default_solver_name(Deadline()) == 'cadical195'
+    assert default_solver_name(Deadline(100)) == 'glucose4'
+    assert default_solver_name(budget=Budget(conflicts=100)) == 'cadical195'
+    assert default_solver_name(budget=Budget(propagations=100)) == 'glucose4'
+
+def test_equivalent_with_time_limit():
+    test_data = exception_catcher(equivalent_pair(), {}, time_limit_seconds=100)
+    assert test_data["result"], test_data.get("result_explanation")
+    assert test_data["formula_size"] > 0
+
+def test_quick_compare_with_time_limit():
+    assert quick_compare(*equivalent_pair(), time_limit_seconds=100)
+
+def test_session_with_time_limit():
+    in_pair = equivalent_pair()
+    session = ComparisonSession(*in_pair[0])
+    try:
+        test_data = exception_catcher(in_pair, {}, time_limit_seconds=100, comparison=session.compare)
+    finally:
+        session.delete()
+    assert test_data["result"], test_data.get("result_explanation")
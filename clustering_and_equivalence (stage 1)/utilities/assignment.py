@@ -1,4 +1,5 @@
-from typing import Tuple
+from typing import Tuple, List, Iterable
+import numpy as np
 
 """
 Class container for the a key mapping for a set of values
@@ -26,6 +27,12 @@ class Assignment():
                 The input tuple for the assignment dictionary.
             offset: int
                 The any returned value will be given the offset
+            owners: bytearray
+                The tag of the Assignment that mapped each value minus offset, 0 for auxiliary values. Shared with linked Assignments
+            tags: SharedInt
+                The largest tag given to this Assignment or any linked Assignment
+            tag: int
+                The tag of this Assignment in owners
         """        
 
         def __init__(self, assignees: int = 2, link: "Assignment" = None, offset: int = 0):
@@ -39,7 +46,7 @@ class Assignment():
                 link: Assignment | None
                     If link is not None, the two assignments will never use the same value.
                     They will share curr, and inv_assignment but not assignment.
-                    Default None. If link is not None offset must be 0
+                    Default None. If link is not None offset must be the same as that of link
                 offset: int
                     The any returned value will be given the offset
             """    
@@ -48,14 +55,20 @@ class Assignment():
             self.curr = SharedInt(1)
             self.assignees = assignees
             self.offset = offset
-            self.has_assigned = []
+            self.owners = bytearray(1)
+            self.tags = SharedInt(1)
 
             if link is not None:
                 self.inv_assignment = link.inv_assignment
                 self.curr = link.curr
+                self.owners = link.owners
+                self.tags = link.tags
+                self.tags.val += 1
 
-                if self.offset != 0:
-                    raise ValueError("Linked Assignments with offset not available")
+                if self.offset != link.offset:
+                    raise ValueError("Linked Assignments with different offsets not available")
+
+            self.tag = self.tags.val
         
         def get_assignment(self, *args, update: bool = True) -> int:
             """
@@ -97,14 +110,37 @@ class Assignment():
                     return None
                 # set value
                 curr[args[-1]] = self.curr.val + self.offset
-                self.has_assigned.append(self.curr.val + self.offset)
+                self.owners.append(self.tag)
                 self.inv_assignment.append(args)
                 self.curr.val += 1
                 return curr[args[-1]]
             else:
                 # is int
                 return res
-        
+
+        def get_auxiliary(self, n: int = 1) -> range:
+            """
+            Reserves n new values that are not mapped from any input tuple.
+
+            Used for auxiliary variables in encodings, linked Assignments will never reuse these values.
+            The values are owned by no Assignment and their inverse mapping is None.
+
+            Parameters
+            ----------
+                n: int
+                    The number of values to reserve. Default 1.
+
+            Returns
+            ---------
+            range
+                The reserved values
+            """
+            start = self.curr.val + self.offset
+            self.inv_assignment.extend(None for _ in range(n))
+            self.owners.extend(bytes(n))
+            self.curr.val += n
+            return range(start, start + n)
+
         def get_inv_assignment(self, i: int) -> Tuple[int, int]:
             """
             Returns inverse mapping of value i
@@ -121,4 +157,46 @@ class Assignment():
             """
 
             assert i > self.offset, f"Input index {i} <= {self.offset}"
-            return self.inv_assignment[i - self.offset]
\ No newline at end of file
+            return self.inv_assignment[i - self.offset]
+
+        def decode(self, literals: np.ndarray) -> List[Tuple]:
+            """
+            Returns the inverse mapping of each literal in literals that was mapped by this Assignment, in order.
+
+            Parameters
+            ----------
+                literals: np.ndarray
+                    Integer array of positive literals e.g. the true literals of a SAT model
+
+            Returns
+            ---------
+            List[Tuple[any]]
+                The input tuples of the literals mapped by this Assignment
+            """
+            indices = literals - self.offset
+            indices = indices[(indices > 0) & (indices < len(self.owners))]
+            mask = np.frombuffer(self.owners, dtype=np.uint8)[indices] == self.tag
+            return [self.inv_assignment[i] for i in indices[mask].tolist()]
+
+def decode_model(model: Iterable[int], assignments: List[Assignment]) -> List[List[Tuple]]:
+    """
+    Decodes a SAT model into the input tuples of the true variables of each Assignment.
+
+    The model is converted to a NumPy array once and each Assignment selects its variables with a boolean mask over the owners
+    of the true literals, so only the true variables of the Assignment are decoded in Python.
+
+    Parameters
+    ----------
+        model: Iterable[int]
+            The model, as a list of literals
+        assignments: List[Assignment]
+            The Assignments the variables of the model were mapped by
+
+    Returns
+    ---------
+    List[List[Tuple[any]]]
+        For each Assignment, the input tuples of its true variables in model order
+    """
+    model = np.asarray(model, dtype=np.int64)
+    literals = model[model > 0]
+    return [assignment.decode(literals) for assignment in assignments]
\ No newline at end of file
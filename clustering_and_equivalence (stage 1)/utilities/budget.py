@@ -0,0 +1,128 @@
+"""
+Deterministic resource budgets, limiting the work of the SAT solver and the size of the formula rather than wall-clock time so
+results do not depend on the speed or load of the machine
+"""
+
+from typing import Dict, Iterator
+from contextlib import contextmanager
+from pysat.formula import WCNF
+from pysat.solvers import Solver
+
+from utilities.deadline import Deadline, TimeoutException
+
+def formula_size(formula) -> int:
+    """
+    The number of clauses in formula, hard and soft for a WCNF. formula is a CNF, a WCNF or a clause sink counting its clauses in
+    nclauses, such as comparison_v2.clause_sink.SolverSink
+    """
+    if hasattr(formula, "nclauses"): return formula.nclauses
+    if type(formula) == WCNF: return len(formula.hard) + len(formula.soft)
+    return len(formula.clauses)
+
+class Budget():
+    """
+    Limits on the conflicts and propagations of a solve and on the number of clauses of the formula.
+
+    The solver limits are passed to the solver with conf_budget and prop_budget, so only hold for solve_limited calls. CaDiCaL does
+    not support propagation budgets.
+
+    Attributes
+    -----------
+        conflicts: int | None
+            The maximum number of conflicts of a solve, None for no limit
+        propagations: int | None
+            The maximum number of propagations of a solve, None for no limit
+        clauses: int | None
+            The maximum number of clauses of the formula, None for no limit
+    """
+
+    def __init__(self, conflicts: int | None = None, propagations: int | None = None, clauses: int | None = None):
+        """
+        Constructor for Budget
+
+        Parameters
+        -----------
+            conflicts: int | None
+                The maximum number of conflicts of a solve. Default None
+            propagations: int | None
+                The maximum number of propagations of a solve. Default None
+            clauses: int | None
+                The maximum number of clauses of the formula. Default None
+        """
+        self.conflicts = conflicts
+        self.propagations = propagations
+        self.clauses = clauses
+
+    def limits_solver(self) -> bool:
+        "Whether the budget limits solving, so needs solve_limited"
+        return self.conflicts is not None or self.propagations is not None
+
+    def check_clauses(self, formula) -> None:
+        """
+        Raises
+        ---------
+        TimeoutException
+            formula has more clauses than the budget, with limit "clauses". formula is as in formula_size
+        """
+        if self.clauses is not None and formula_size(formula) > self.clauses:
+            raise TimeoutException(f"Formula exceeded budget of {self.clauses} clauses", limit="clauses")
+
+    @contextmanager
+    def limiting(self, solver: Solver) -> Iterator[Dict[str, int]]:
+        """
+        Context manager that sets the conflict and propagation budgets of solver, and removes them on exit so an incremental solver can
+        be reused without a budget.
+
+        Parameters
+        -----------
+            solver: Solver
+                The solver, for an LSU this is the oracle
+
+        Return
+        ---------
+        Iterator[Dict[str, int]]
+            Yields the accumulated statistics of solver before the budget was set, for limit_hit
+        """
+        stats = solver.accum_stats()
+        if self.conflicts is not None: solver.conf_budget(self.conflicts)
+        if self.propagations is not None: solver.prop_budget(self.propagations)
+        try:
+            yield stats
+        finally:
+            if self.conflicts is not None: solver.conf_budget(-1)
+            if self.propagations is not None: solver.prop_budget(-1)
+
+    def limit_hit(self, solver: Solver, stats: Dict[str, int], deadline: Deadline | None = None) -> str:
+        """
+        The limit that stopped a solve_limited call that returned None
+
+        Parameters
+        -----------
+            solver: Solver
+                The solver
+            stats: Dict[str, int]
+                The statistics yielded by limiting
+            deadline: Deadline | None
+                The deadline of the solve. Default None
+
+        Return
+        ---------
+        str
+            "conflicts", "propagations" or "wall clock". The propagations are not compared as solvers count them differently to
+            their budget, so a propagation budget is assumed to be hit if neither other limit was
+        """
+        if self.conflicts is not None and solver.accum_stats()["conflicts"] - stats["conflicts"] >= self.conflicts: return "conflicts"
+        if self.propagations is not None and (deadline is None or not deadline.expired()): return "propagations"
+        return "wall clock"
+
+def default_solver_name(deadline: Deadline | None = None, budget: Budget | None = None) -> str:
+    """
+    The pysat solver of a comparison, cadical195 unless the solve is interrupted at a deadline or limited in propagations, which the
+    CaDiCaL of pysat does not support, in which case glucose4
+    """
+    interrupted = deadline is not None and deadline.expires is not None
+    return 'glucose4' if interrupted or (budget is not None and budget.propagations is not None) else 'cadical195'
+
+def check_budget_clauses(budget: Budget | None, formula) -> None:
+    "Budget.check_clauses if budget is not None"
+    if budget is not None: budget.check_clauses(formula)
@@ -0,0 +1,90 @@
+"""
+Cooperative wall-clock deadlines, checked by long-running loops rather than interrupting by signal so they work in any thread or process
+"""
+
+from typing import Iterator
+from contextlib import contextmanager
+from threading import Timer
+import time
+
+class TimeoutException(Exception):
+    """
+    Raised when a comparison runs out of a resource. limit names the resource: "wall clock" for a Deadline, otherwise the name of
+    the budget, see utilities.budget.Budget
+    """
+    def __init__(self, message: str = "Deadline expired", limit: str = "wall clock"):
+        super().__init__(message)
+        self.limit = limit
+
+class Deadline():
+    """
+    A point in time after which work should stop, checked cooperatively.
+
+    Deadlines nest: a deadline made with a parent expires no later than the parent, so an inner time limit can never extend an outer one.
+    A solver is stopped at the deadline by a timer thread calling its interrupt method, see interrupting.
+
+    Attributes
+    -----------
+        expires: float | None
+            The time.time() at which the deadline expires, None if it never does
+    """
+
+    def __init__(self, seconds: float | None = None, parent: "Deadline | None" = None):
+        """
+        Constructor for Deadline
+
+        Parameters
+        -----------
+            seconds: float | None
+                The number of seconds from now until the deadline expires. None or 0 means no limit other than the parent's. Default None
+            parent: Deadline | None
+                An enclosing deadline. Default None
+        """
+        self.expires = None if not seconds else time.time() + seconds
+        if parent is not None and parent.expires is not None:
+            self.expires = parent.expires if self.expires is None else min(self.expires, parent.expires)
+
+    def remaining(self) -> float | None:
+        "The number of seconds until the deadline expires, at least 0, None if it never does"
+        return None if self.expires is None else max(0, self.expires - time.time())
+
+    def expired(self) -> bool:
+        "Whether the deadline has expired"
+        return self.expires is not None and time.time() >= self.expires
+
+    def check(self) -> None:
+        """
+        Raises
+        ---------
+        TimeoutException
+            The deadline has expired
+        """
+        if self.expired(): raise TimeoutException("Deadline expired")
+
+    @contextmanager
+    def interrupting(self, solver) -> Iterator[None]:
+        """
+        Context manager that calls solver.interrupt() when the deadline expires, for solver calls with expect_interrupt such as
+        Solver.solve_limited. The interrupt is cleared on exit so the solver can be reused. The solver must support interrupts, which
+        CaDiCaL does not, see utilities.budget.default_solver_name.
+
+        Parameters
+        -----------
+            solver: Solver | LSU
+                Any object with an interrupt method
+        """
+        if self.expires is None:
+            yield
+            return
+
+        timer = Timer(interval = self.remaining(), function = solver.interrupt)
+        timer.start()
+        try:
+            yield
+        finally:
+            timer.cancel()
+            if hasattr(solver, "clear_interrupt"): solver.clear_interrupt()
+
+def check_deadline(deadline: Deadline | None) -> None:
+    "Deadline.check if deadline is not None"
+    if deadline is not None: deadline.check()
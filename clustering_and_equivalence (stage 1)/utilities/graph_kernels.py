@@ -0,0 +1,92 @@
+"""
+Breadth first search over sparse adjacency matrices, replacing the python BFS over dictionaries of utilities.dist_to_source_set and
+utilities._distances_to_signal_set.
+
+Graphs are undirected scipy CSR matrices. The searches are run by scipy.sparse.csgraph, whose unweighted dijkstra from every source at
+once is a multi-source BFS in compiled code; unlike a numpy frontier loop its cost does not grow with the depth of the graph, which for
+the long chains of a hash circuit is in the hundreds of thousands. Distances between signals are found on the bipartite graph of
+constraints and signals, where two signals of the same constraint are at distance 2.
+"""
+
+from typing import Collection, Dict, Iterable, List
+import itertools
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import dijkstra, connected_components
+
+def adjacency_matrix(adjacencies: Dict[int, Collection[int]] | List[Collection[int]], nvertices: int | None = None) -> sparse.csr_matrix:
+    """
+    The CSR adjacency matrix of a graph given as adjacency lists.
+
+    Parameters
+    ----------
+        adjacencies: Dict[int, Collection[int]] | List[Collection[int]]
+            The neighbours of each vertex, a vertex not in adjacencies has no neighbours
+        nvertices: int | None
+            The number of vertices, if None one more than the largest vertex in adjacencies
+
+    Returns
+    ----------
+    sparse.csr_matrix
+        The symmetric adjacency matrix of shape (nvertices, nvertices)
+    """
+    if type(adjacencies) != dict: adjacencies = dict(enumerate(adjacencies))
+    # read in place, copying each adjacency list into a list of its own triggers the garbage collector on large graphs
+    lengths = np.fromiter(map(len, adjacencies.values()), dtype=np.int64, count=len(adjacencies))
+    rows = np.repeat(np.fromiter(adjacencies.keys(), dtype=np.int64, count=len(adjacencies)), lengths)
+    cols = np.fromiter(itertools.chain.from_iterable(adjacencies.values()), dtype=np.int64, count=int(lengths.sum()))
+
+    if nvertices is None: nvertices = max(int(rows.max(initial=-1)), int(cols.max(initial=-1))) + 1
+    graph = sparse.coo_matrix((np.ones(len(rows)), (rows, cols)), shape=(nvertices, nvertices)).tocsr()
+    return (graph + graph.T).tocsr()
+
+def bipartite_matrix(incidence: sparse.csr_matrix) -> sparse.csr_matrix:
+    "The adjacency matrix of the bipartite graph of an incidence matrix, the constraints numbered first and then the signals"
+    return sparse.bmat([[None, incidence], [incidence.T, None]], format="csr")
+
+def multi_source_distances(graph: sparse.csr_matrix, sources: Iterable[int]) -> np.ndarray:
+    """
+    The number of edges from each vertex to the nearest source.
+
+    Parameters
+    ----------
+        graph: sparse.csr_matrix
+            The symmetric adjacency matrix of the graph
+        sources: Iterable[int]
+            The source vertices
+
+    Returns
+    ----------
+    np.ndarray
+        The distance of each vertex, -1 for vertices in no component of a source
+    """
+    sources = np.unique(np.fromiter(sources, dtype=np.int64))
+    if len(sources) == 0: return np.full(graph.shape[0], -1, dtype=np.int64)
+    distances = dijkstra(graph, directed=False, indices=sources, unweighted=True, min_only=True)
+    return np.where(np.isinf(distances), -1, distances).astype(np.int64)
+
+def reachable(graph: sparse.csr_matrix, sources: Iterable[int]) -> np.ndarray:
+    "Boolean mask of the vertices in the component of a source, found from the connected components of graph"
+    _, component = connected_components(graph, directed=False)
+    sources = np.fromiter(sources, dtype=np.int64)
+    return np.isin(component, component[sources])
+
+def signal_distances(incidence: sparse.csr_matrix, sources: Iterable[int]) -> np.ndarray:
+    """
+    The distance of each signal to the nearest source signal, a signal at distance 1 of the signals of the constraints it is in.
+
+    Parameters
+    ----------
+        incidence: sparse.csr_matrix
+            The incidence matrix of the constraints, see structural_analysis.utilities.constraint_graph.incidence_matrix
+        sources: Iterable[int]
+            The source signals, each a column of incidence
+
+    Returns
+    ----------
+    np.ndarray
+        The distance of each signal, -1 for signals in no component of a source
+    """
+    nconstraints = incidence.shape[0]
+    distances = multi_source_distances(bipartite_matrix(incidence), map(lambda sig : nconstraints + sig, sources))[nconstraints:]
+    return np.where(distances >= 0, distances // 2, -1)